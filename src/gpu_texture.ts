@@ -0,0 +1,189 @@
+import { GfxDevice, GfxFormat, GfxTexture, makeTextureDescriptor2D } from './noclip/gfx/platform/GfxPlatform.js';
+import { fetchPackBuffer, getPackGpuTexturePath } from './pack.js';
+
+// .gtx sidecars written by the pack builder (tools/gpu_textures.py) next to a
+// TPL: its textures already untiled into the smallest lossless format, so they
+// skip the per-texel TPL decode. Entries with format 0 fall back to decoding
+// the TPL.
+const GTX_MAGIC = 0x58455447; // 'GTEX' read little-endian
+const GTX_VERSION = 1;
+const GTX_HEADER_SIZE = 0x10;
+const GTX_ENTRY_SIZE = 0x10;
+
+const GPU_FORMAT_BC1 = 1;
+const GPU_FORMAT_RGB565 = 2;
+const GPU_FORMAT_RGBA5551 = 3;
+const GPU_FORMAT_RGBA4444 = 4;
+const GPU_FORMAT_L8 = 5;
+const GPU_FORMAT_LA8 = 6;
+const GPU_FORMAT_RGB8 = 7;
+
+// Bytes per texel of the uncompressed sidecar formats.
+const GPU_FORMAT_TEXEL_SIZES: Record<number, number> = {
+  [GPU_FORMAT_RGB565]: 2,
+  [GPU_FORMAT_RGBA5551]: 2,
+  [GPU_FORMAT_RGBA4444]: 2,
+  [GPU_FORMAT_L8]: 1,
+  [GPU_FORMAT_LA8]: 2,
+  [GPU_FORMAT_RGB8]: 3,
+};
+
+export type GpuTexture = {
+  format: number;
+  width: number;
+  height: number;
+  levels: Uint8Array[];
+};
+
+function gpuLevelSize(format: number, width: number, height: number): number {
+  if (format === GPU_FORMAT_BC1) {
+    return Math.ceil(width / 4) * Math.ceil(height / 4) * 8;
+  }
+  return width * height * GPU_FORMAT_TEXEL_SIZES[format];
+}
+
+export function parseGpuTextureSidecar(buffer: ArrayBuffer, tplName: string): Map<string, GpuTexture> {
+  const view = new DataView(buffer);
+  if (view.getUint32(0x00, true) !== GTX_MAGIC) {
+    throw new Error(`${tplName}: not a GPU texture sidecar`);
+  }
+  const version = view.getUint32(0x04, true);
+  if (version !== GTX_VERSION) {
+    throw new Error(`${tplName}: unsupported GPU texture sidecar version ${version}`);
+  }
+  const entryCount = view.getUint32(0x08, true);
+  const textures = new Map<string, GpuTexture>();
+  for (let i = 0; i < entryCount; i += 1) {
+    const base = GTX_HEADER_SIZE + i * GTX_ENTRY_SIZE;
+    const format = view.getUint16(base, true);
+    if (format !== GPU_FORMAT_BC1 && !(format in GPU_FORMAT_TEXEL_SIZES)) {
+      continue;
+    }
+    const mipCount = view.getUint16(base + 0x02, true);
+    const width = view.getUint16(base + 0x04, true);
+    const height = view.getUint16(base + 0x06, true);
+    let offs = view.getUint32(base + 0x08, true);
+    const levels: Uint8Array[] = [];
+    let w = width;
+    let h = height;
+    for (let level = 0; level < mipCount; level += 1) {
+      const size = gpuLevelSize(format, w, h);
+      levels.push(new Uint8Array(buffer, offs, size));
+      offs += size;
+      w = Math.max(1, w >> 1);
+      h = Math.max(1, h >> 1);
+    }
+    // Same naming as parseAVTpl, so the texture cache finds entries by texture name.
+    textures.set(`${tplName}_${String(i).padStart(3, '0')}`, { format, width, height, levels });
+  }
+  return textures;
+}
+
+// The textures of the sidecar the active pack lists for `tplPath` (relative to
+// `basePath`), named like parseAVTpl names `tplName`'s; empty when it lists
+// none. The caller hands them to that load's texture cache, so they never
+// apply to another game's or another stage load's TPL of the same name.
+export async function loadPackGpuTextures(
+  basePath: string,
+  tplPath: string,
+  tplName: string,
+): Promise<Map<string, GpuTexture>> {
+  const sidecarPath = getPackGpuTexturePath(basePath, tplPath);
+  if (!sidecarPath) {
+    return new Map();
+  }
+  try {
+    return parseGpuTextureSidecar(await fetchPackBuffer(sidecarPath), tplName);
+  } catch (err) {
+    console.warn(`Failed to load GPU textures for ${tplPath}; decoding the TPL instead.`, err);
+    return new Map();
+  }
+}
+
+function expandLuminance(src: Uint8Array): Uint8Array {
+  const dst = new Uint8Array(src.length * 3);
+  for (let i = 0, o = 0; i < src.length; i += 1, o += 3) {
+    dst[o] = dst[o + 1] = dst[o + 2] = src[i];
+  }
+  return dst;
+}
+
+function expandLuminanceAlpha(src: Uint8Array): Uint8Array {
+  const dst = new Uint8Array(src.length * 2);
+  for (let i = 0, o = 0; i < src.length; i += 2, o += 4) {
+    dst[o] = dst[o + 1] = dst[o + 2] = src[i];
+    dst[o + 3] = src[i + 1];
+  }
+  return dst;
+}
+
+function expandRgba4444(src: Uint8Array): Uint8Array {
+  const dst = new Uint8Array(src.length * 2);
+  for (let i = 0, o = 0; i < src.length; i += 2, o += 4) {
+    const lo = src[i];
+    const hi = src[i + 1];
+    dst[o] = (hi >> 4) * 17;
+    dst[o + 1] = (hi & 0x0f) * 17;
+    dst[o + 2] = (lo >> 4) * 17;
+    dst[o + 3] = (lo & 0x0f) * 17;
+  }
+  return dst;
+}
+
+function getGfxFormat(format: number): GfxFormat {
+  switch (format) {
+    case GPU_FORMAT_BC1:
+      return GfxFormat.BC1;
+    case GPU_FORMAT_RGB565:
+      return GfxFormat.U16_RGB_565;
+    case GPU_FORMAT_RGBA5551:
+      return GfxFormat.U16_RGBA_5551;
+    case GPU_FORMAT_RGB8:
+    case GPU_FORMAT_L8:
+      return GfxFormat.U8_RGB_NORM;
+    default:
+      return GfxFormat.U8_RGBA_NORM;
+  }
+}
+
+// The GPU layer has no luminance or 4444 formats, so those are widened here;
+// still a straight copy rather than a tile decode.
+function getUploadLevels(texture: GpuTexture): ArrayBufferView[] {
+  switch (texture.format) {
+    case GPU_FORMAT_RGB565:
+    case GPU_FORMAT_RGBA5551:
+      // Packed 16-bit formats upload from a Uint16Array.
+      return texture.levels.map((level) => new Uint16Array(level.buffer, level.byteOffset, level.byteLength >> 1));
+    case GPU_FORMAT_RGBA4444:
+      return texture.levels.map(expandRgba4444);
+    case GPU_FORMAT_L8:
+      return texture.levels.map(expandLuminance);
+    case GPU_FORMAT_LA8:
+      return texture.levels.map(expandLuminanceAlpha);
+    default:
+      return texture.levels;
+  }
+}
+
+// A GPU texture for `name` when `gpuTextures` has one in a format the device
+// can sample; null means decode the TPL entry as usual.
+export function createGpuTexture(
+  device: GfxDevice,
+  gpuTextures: ReadonlyMap<string, GpuTexture>,
+  name: string,
+): GfxTexture | null {
+  const texture = gpuTextures.get(name);
+  if (!texture) {
+    return null;
+  }
+  const format = getGfxFormat(texture.format);
+  if (!device.queryTextureFormatSupported(format, texture.width, texture.height)) {
+    return null;
+  }
+  const gfxTexture = device.createTexture(
+    makeTextureDescriptor2D(format, texture.width, texture.height, texture.levels.length),
+  );
+  device.setResourceName(gfxTexture, name);
+  device.uploadTextureData(gfxTexture, 0, getUploadLevels(texture));
+  return gfxTexture;
+}
@@ -32,6 +32,8 @@ import { parseStagedefLz } from './noclip/SuperMonkeyBall/Stagedef.js';
 import { StageId, STAGE_INFO_MAP } from './noclip/SuperMonkeyBall/StageInfo.js';
 import type { StageData } from './noclip/SuperMonkeyBall/World.js';
 import { convertSmb2StageDef, getMb2wsStageInfo, getSmb2StageInfo } from './smb2_render.js';
+import { loadPackGpuTextures } from './gpu_texture.js';
+import type { GpuTexture } from './gpu_texture.js';
 import { HudRenderer } from './hud.js';
 import type { ReplayData } from './replay.js';
 import {
@@ -39,12 +41,14 @@ import {
   getActivePack,
   getPackCourseData,
   getPackStageBasePath,
+  getPackTplPath,
   hasPackForGameSource,
   loadPackFromFileList,
   loadPackFromUrl,
   loadPackFromZipFile,
   setActivePack,
   setPackEnabled,
+  setTextureTier,
 } from './pack.js';
 import type { LoadedPack } from './pack.js';
 
@@ -322,7 +326,9 @@ async function fetchSlice(path: string): Promise<ArrayBufferSlice> {
 }
 
 async function initPackFromQuery() {
-  const packParam = new URLSearchParams(window.location.search).get('pack');
+  const params = new URLSearchParams(window.location.search);
+  setTextureTier(params.get('tier'));
+  const packParam = params.get('pack');
   if (!packParam) {
     return;
   }
@@ -445,18 +451,29 @@ async function loadRenderStageSmb2(stageId: number, stage: any, gameSource: Game
   const stagedef = convertSmb2StageDef(stage);
 
   const stageBasePath = getStageBasePath(gameSource) ?? STAGE_BASE_PATHS[GAME_SOURCES.SMB2];
+  // TPLs relative to the base path; a pack's texture tier may swap in smaller copies.
+  const stageTplFile = getPackTplPath(stageBasePath, `st${stageIdStr}/st${stageIdStr}.tpl`);
+  const commonTplFile = getPackTplPath(stageBasePath, 'init/common.tpl');
   const stageGmaPath = `${stageBasePath}/st${stageIdStr}/st${stageIdStr}.gma`;
-  const stageTplPath = `${stageBasePath}/st${stageIdStr}/st${stageIdStr}.tpl`;
+  const stageTplPath = `${stageBasePath}/${stageTplFile}`;
 
   const commonGmaPath = `${stageBasePath}/init/common.gma`;
-  const commonTplPath = `${stageBasePath}/init/common.tpl`;
+  const commonTplPath = `${stageBasePath}/${commonTplFile}`;
   const commonNlPath = `${stageBasePath}/init/common_p.lz`;
   const commonNlTplPath = `${stageBasePath}/init/common.lz`;
 
   const bgName = stageInfo.bgInfo.fileName;
+  const bgTplFile = bgName ? getPackTplPath(stageBasePath, `bg/${bgName}.tpl`) : '';
   const bgGmaPath = bgName ? `${stageBasePath}/bg/${bgName}.gma` : '';
-  const bgTplPath = bgName ? `${stageBasePath}/bg/${bgName}.tpl` : '';
-
+  const bgTplPath = bgName ? `${stageBasePath}/${bgTplFile}` : '';
+
+  const gpuTexturesLoaded = Promise.all([
+    loadPackGpuTextures(stageBasePath, stageTplFile, `st${stageIdStr}`),
+    loadPackGpuTextures(stageBasePath, commonTplFile, 'common'),
+    bgName
+      ? loadPackGpuTextures(stageBasePath, bgTplFile, bgName)
+      : Promise.resolve(new Map<string, GpuTexture>()),
+  ]);
   const [
     stageGmaBuf,
     stageTplBuf,
@@ -477,6 +494,7 @@ async function loadRenderStageSmb2(stageId: number, stage: any, gameSource: Game
       bgName ? fetchSlice(bgGmaPath) : Promise.resolve(new ArrayBufferSlice(new ArrayBuffer(0))),
       bgName ? fetchSlice(bgTplPath) : Promise.resolve(new ArrayBufferSlice(new ArrayBuffer(0))),
     ]);
+  const gpuTextures = new Map((await gpuTexturesLoaded).flatMap((textures) => [...textures]));
 
   const stageTpl = parseAVTpl(stageTplBuf, `st${stageIdStr}`);
   const stageGma = Gma.parseGma(stageGmaBuf, stageTpl);
@@ -500,6 +518,7 @@ async function loadRenderStageSmb2(stageId: number, stage: any, gameSource: Game
     stageNlObj: null,
     stageNlObjNameMap: null,
     gameSource,
+    gpuTextures,
   };
 }
 
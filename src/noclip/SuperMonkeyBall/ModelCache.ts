@@ -10,6 +10,8 @@ import { CommonModelID } from "./ModelInfo.js";
 import * as UI from "../ui.js";
 import * as Viewer from "../viewer.js";
 import { GXMaterialHacks } from "../gx/gx_material.js";
+import { createGpuTexture } from "../../gpu_texture.js";
+import type { GpuTexture } from "../../gpu_texture.js";
 
 // Cache loaded models by name and textures by unique name. Not much advantage over loading
 // everything at once but oh well.
@@ -17,9 +19,17 @@ import { GXMaterialHacks } from "../gx/gx_material.js";
 export class TextureCache {
     private cache: Map<string, GfxTexture> = new Map();
 
+    // Pack sidecar textures for this cache's stage load, by texture name.
+    constructor(private gpuTextures: ReadonlyMap<string, GpuTexture> = new Map()) {}
+
     public getTexture(device: GfxDevice, gxTexture: TextureInputGX): GfxTexture {
         const loadedTex = this.cache.get(gxTexture.name);
         if (loadedTex === undefined) {
+            const gpuTex = createGpuTexture(device, this.gpuTextures, gxTexture.name);
+            if (gpuTex !== null) {
+                this.cache.set(gxTexture.name, gpuTex);
+                return gpuTex;
+            }
             const mipChain = calcMipChain(gxTexture, gxTexture.mipCount);
             const freshTex = loadTextureFromMipChain(device, mipChain);
             this.cache.set(gxTexture.name, freshTex.gfxTexture);
@@ -71,7 +81,7 @@ export class ModelCache {
         this.bgEntry = new CacheEntry(stageData.bgGma);
         this.commonEntry = new CacheEntry(stageData.commonGma);
         this.allEntries = [this.stageEntry, this.bgEntry, this.commonEntry];
-        this.textureCache = new TextureCache();
+        this.textureCache = new TextureCache(stageData.gpuTextures);
 
         // TODO(complexplane): Don't do these in modelcache?
         // TODO(complexplane): The game seems to search blue goal using "GOAL" prefix instead of 2
@@ -23,6 +23,7 @@ import {
 } from "../gfx/platform/GfxPlatform.js";
 import { GfxRenderCache } from "../gfx/render/GfxRenderCache.js";
 import type { GfxRenderInst } from "../gfx/render/GfxRenderInstManager.js";
+import type { GpuTexture } from "../../gpu_texture.js";
 import * as GX_Material from "../gx/gx_material.js";
 import { GfxShaderLibrary } from "../gfx/helpers/GfxShaderLibrary.js";
 import { preprocessProgram_GLSL } from "../gfx/shaderc/GfxShaderCompiler.js";
@@ -73,6 +74,8 @@ export type StageData = {
     stageNlObj?: Nl.Obj | null;
     stageNlObjNameMap?: Map<string, number> | null;
     gameSource?: string;
+    // Pack .gtx sidecar textures by texture name; only set for loads that read a pack.
+    gpuTextures?: ReadonlyMap<string, GpuTexture>;
 };
 
 export type MirrorMode = 'none' | 'flat' | 'wavy';
@@ -1,4 +1,4 @@
-import { unzipSync } from 'fflate';
+import { unzipSync, unzlibSync } from 'fflate';
 import ArrayBufferSlice from './noclip/ArrayBufferSlice.js';
 import { STAGE_BASE_PATHS, type GameSource } from './constants.js';
 
@@ -49,6 +49,25 @@ export type PackCourseData = {
   story?: number[][];
 };
 
+// How STAGE### stagedefs are stored in the pack: 'lzss' is the game's own
+// STAGE###.lz, 'raw' the decompressed stagedef and 'deflate' a zlib stream of it.
+export type PackStageEncoding = 'lzss' | 'raw' | 'deflate';
+
+const STAGE_ENCODING_SUFFIXES: Record<PackStageEncoding, string> = {
+  lzss: '.lz',
+  raw: '.bin',
+  deflate: '.zlib',
+};
+
+// A lower-resolution copy of the pack's TPLs without their top `dropMips` mip levels.
+export type PackTextureTier = {
+  dropMips: number;
+  bytes: number;
+  savedBytes: number;
+  // TPL path -> tier TPL; TPLs the tier does not shrink are not listed.
+  files: Record<string, { path: string; bytes: number }>;
+};
+
 export type PackManifest = {
   id: string;
   name: string;
@@ -59,6 +78,10 @@ export type PackManifest = {
     stages?: number[];
     stageNames?: Record<string, string>;
     stageTimeOverrides?: Record<string, number | null>;
+    stageEncoding?: PackStageEncoding;
+    // TPL path -> .gtx sidecar with GPU-ready copies of its textures.
+    gpuTextures?: Record<string, string>;
+    textureTiers?: Record<string, PackTextureTier>;
   };
   courses?: PackCourseData;
   stageEnv?: Record<string, PackStageEnv>;
@@ -76,6 +99,7 @@ export type LoadedPack = {
 
 let activePack: LoadedPack | null = null;
 let packEnabled = true;
+let textureTier: string | null = null;
 
 function normalizePackPath(path: string): string {
   return path.replace(/^\.\//, '').replace(/^\//, '');
@@ -104,6 +128,11 @@ export function setPackEnabled(enabled: boolean) {
   packEnabled = enabled;
 }
 
+// Texture tier to load from packs that have it (e.g. 'low'); null loads the full TPLs.
+export function setTextureTier(tier: string | null) {
+  textureTier = tier;
+}
+
 export function isPackEnabled() {
   return packEnabled;
 }
@@ -158,6 +187,43 @@ export function getPackStageBasePath(gameSource: GameSource): string | null {
   return activePack.basePath;
 }
 
+export function getPackStageEncoding(basePath: string): PackStageEncoding {
+  if (!packEnabled || !activePack || activePack.basePath !== basePath) {
+    return 'lzss';
+  }
+  const encoding = activePack.manifest.content?.stageEncoding;
+  return encoding && encoding in STAGE_ENCODING_SUFFIXES ? encoding : 'lzss';
+}
+
+export function getStageDefFileName(stageIdStr: string, encoding: PackStageEncoding): string {
+  return `STAGE${stageIdStr}${STAGE_ENCODING_SUFFIXES[encoding]}`;
+}
+
+// The TPL to load for `tplPath` (relative to `basePath`): the active texture
+// tier's copy when the pack has one, otherwise `tplPath` itself.
+export function getPackTplPath(basePath: string, tplPath: string): string {
+  if (!textureTier || !packEnabled || !activePack || activePack.basePath !== basePath) {
+    return tplPath;
+  }
+  return activePack.manifest.content?.textureTiers?.[textureTier]?.files[tplPath]?.path ?? tplPath;
+}
+
+export function getPackGpuTexturePath(basePath: string, tplPath: string): string | null {
+  if (!packEnabled || !activePack || activePack.basePath !== basePath) {
+    return null;
+  }
+  const sidecar = activePack.manifest.content?.gpuTextures?.[tplPath];
+  return sidecar ? `${basePath}/${sidecar}` : null;
+}
+
+export async function inflateZlib(buffer: ArrayBuffer): Promise<Uint8Array> {
+  if (typeof DecompressionStream !== 'undefined') {
+    const stream = new Blob([buffer]).stream().pipeThrough(new DecompressionStream('deflate'));
+    return new Uint8Array(await new Response(stream).arrayBuffer());
+  }
+  return unzlibSync(new Uint8Array(buffer));
+}
+
 export function hasPackForGameSource(gameSource: GameSource): boolean {
   return !!packEnabled && activePack?.manifest.gameSource === gameSource;
 }
@@ -1,5 +1,5 @@
 import { lzssDecompress } from './lzs.js';
-import { fetchPackBuffer } from './pack.js';
+import { fetchPackBuffer, getPackStageEncoding, getStageDefFileName, inflateZlib } from './pack.js';
 import ArrayBufferSlice from './noclip/ArrayBufferSlice.js';
 import { CommonNlModelID } from './noclip/SuperMonkeyBall/NlModelInfo.js';
 import { parseObj as parseNlObj } from './noclip/SuperMonkeyBall/NaomiLib.js';
@@ -3266,10 +3266,18 @@ export async function loadGoalTapeAnchorY(basePath = STAGE_BASE_PATHS.smb1, game
 
 export async function loadStageDef(stageId, basePath = STAGE_BASE_PATHS.smb1, gameSource = 'smb1') {
   const id = formatStageId(stageId);
-  const path = `${basePath}/st${id}/STAGE${id}.lz`;
+  const encoding = getPackStageEncoding(basePath);
+  const path = `${basePath}/st${id}/${getStageDefFileName(id, encoding)}`;
   const buffer = await fetchPackBuffer(path);
-  const decompressed = lzssDecompress(buffer);
-  const view = new Uint8Array(decompressed.buffer, decompressed.byteOffset, decompressed.byteLength);
+  let view;
+  if (encoding === 'raw') {
+    view = new Uint8Array(buffer);
+  } else if (encoding === 'deflate') {
+    view = await inflateZlib(buffer);
+  } else {
+    const decompressed = lzssDecompress(buffer);
+    view = new Uint8Array(decompressed.buffer, decompressed.byteOffset, decompressed.byteLength);
+  }
   const stage = parseStageDef(view, gameSource);
   stage.stageId = stageId;
   stage.gameSource = gameSource;
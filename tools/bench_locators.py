@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""Benchmark the REL table locators on a synthetic main_loop.rel.
+
+Times `find_stage_world_themes_offsets` (smb2_pack_builder) and
+`find_story_block_offsets` (dump_vanilla_conf) against the previous
+brute-force scans, which re-check a full window at every offset. Both must
+report the same candidate offsets.
+
+The synthetic REL mixes zero fill, random bytes, runs of WorldTheme-sized
+bytes, near-miss story tables and "bg/" strings, with the real tables planted
+near the end so the brute-force scans have to cross the whole file.
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import struct
+import sys
+import time
+from typing import Callable, List, Set, Tuple
+
+from dump_vanilla_conf import find_story_block_offsets
+from smb2_pack_builder import STAGE_WORLD_THEMES_LEN, RelSection, find_stage_world_themes_offsets
+
+SECTION_OFFSET = 0x1000
+
+
+def stage_world_themes_offsets_bruteforce(data: bytes, section: RelSection) -> List[int]:
+    """The original scan: max() over a fresh 420-byte slice at every offset."""
+    view = memoryview(data)
+    offsets: List[int] = []
+    for off in range(section.offset, section.offset + section.size - STAGE_WORLD_THEMES_LEN):
+        chunk = view[off:off + STAGE_WORLD_THEMES_LEN]
+        if not chunk:
+            break
+        if max(chunk) > 41:
+            continue
+        tail = view[off + STAGE_WORLD_THEMES_LEN:off + STAGE_WORLD_THEMES_LEN + 16]
+        if b'bg/' not in bytes(tail):
+            continue
+        offsets.append(off)
+    return offsets
+
+
+def story_block_offsets_bruteforce(data: bytes, stage_ids: Set[int], named_stage_ids: Set[int]) -> List[int]:
+    """The original scan: re-validate all 100 entries at every 4-byte offset."""
+    offsets: List[int] = []
+    for off in range(0, len(data) - 400, 4):
+        valid = True
+        unique_ids: Set[int] = set()
+        named_count = 0
+        for idx in range(100):
+            stage_id, difficulty = struct.unpack_from('>hh', data, off + idx * 4)
+            if stage_id not in stage_ids or difficulty < 0 or difficulty > 5:
+                valid = False
+                break
+            unique_ids.add(stage_id)
+            if stage_id in named_stage_ids:
+                named_count += 1
+        if not valid or len(unique_ids) < 20:
+            continue
+        if named_stage_ids and named_count / 100 < 0.3:
+            continue
+        offsets.append(off)
+    return offsets
+
+
+def synthetic_rel(size: int, seed: int, stage_ids: List[int]) -> bytes:
+    rng = random.Random(seed)
+    out = bytearray(SECTION_OFFSET)
+    body_end = size - 0x2000
+    while len(out) < body_end:
+        kind = rng.randrange(6)
+        length = rng.randrange(256, 16384)
+        if kind == 0:
+            out += bytes(length)
+        elif kind == 1:
+            out += rng.randbytes(length)
+        elif kind == 2:
+            # WorldTheme-sized bytes that are not followed by a bg path.
+            out += bytes(rng.randrange(42) for _ in range(length))
+        elif kind == 3:
+            # Story-like entries with too few distinct stages to qualify.
+            pool = rng.sample(stage_ids, 8)
+            out += b''.join(struct.pack('>hh', rng.choice(pool), rng.randrange(6)) for _ in range(length // 4))
+        elif kind == 4:
+            out += b'bg/bg_%03d.gma\0' % rng.randrange(1000)
+        else:
+            out += struct.pack(f'>{length // 4}f', *(rng.uniform(-1, 1) for _ in range(length // 4)))
+    del out[body_end:]
+    out += b'\xff' * (-len(out) % 4)
+    story = b''.join(struct.pack('>hh', rng.choice(stage_ids), rng.randrange(6)) for _ in range(100))
+    themes = bytes(rng.randrange(42) for _ in range(STAGE_WORLD_THEMES_LEN))
+    out += story + b'\xff' * 4 + themes + b'\0\0\0\0bg/jun\0' + b'\xff' * 8
+    out += bytes(size - len(out))
+    return bytes(out)
+
+
+def timed(func: Callable[[], List[int]]) -> Tuple[float, List[int]]:
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark REL table locators on a synthetic REL.')
+    parser.add_argument('--size-mb', type=int, default=8, help='Synthetic REL size in MB')
+    parser.add_argument('--seed', type=int, default=1, help='Synthetic REL seed')
+    args = parser.parse_args()
+
+    stage_ids = list(range(1, 421))
+    named_stage_ids = {sid for sid in stage_ids if sid % 4}
+    print(f'Generating {args.size_mb} MB synthetic REL...', file=sys.stderr)
+    data = synthetic_rel(args.size_mb * 1024 * 1024, args.seed, stage_ids)
+    section = RelSection(offset=SECTION_OFFSET, size=len(data) - SECTION_OFFSET, flags=0)
+    stage_id_set = set(stage_ids)
+
+    cases = [
+        ('stage world themes',
+         lambda: stage_world_themes_offsets_bruteforce(data, section),
+         lambda: find_stage_world_themes_offsets(data, section)),
+        ('story block',
+         lambda: story_block_offsets_bruteforce(data, stage_id_set, named_stage_ids),
+         lambda: find_story_block_offsets(data, stage_id_set, named_stage_ids)),
+    ]
+    mismatched = False
+    print(f'{len(data) / 1e6:.1f} MB REL')
+    for label, old, new in cases:
+        old_seconds, old_offsets = timed(old)
+        new_seconds, new_offsets = timed(new)
+        same = old_offsets == new_offsets
+        mismatched |= not same
+        print(f'  {label:<20} brute {old_seconds:7.2f}s  windowed {new_seconds:7.3f}s'
+              f'  x{old_seconds / max(new_seconds, 1e-9):7.1f}  {len(new_offsets)} candidates'
+              f'  {"OK" if same else "MISMATCHED"}')
+    if mismatched:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
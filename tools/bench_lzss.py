@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""Benchmark the pack builder's LZSS decoder.
+
+Times `smb2_pack_builder.lzss_decompress` against the previous byte-at-a-time
+decoder and, when node is available, against `src/lzs.ts` on the same corpus.
+All decoders must produce identical output; mismatches are reported per file.
+
+Without --corpus a synthetic corpus of stage-like payloads is generated.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import random
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from smb2_pack_builder import lzss_decompress
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+LZS_TS = REPO_ROOT / 'src' / 'lzs.ts'
+
+NODE_HARNESS = '''
+import { readFileSync } from 'node:fs';
+import { createHash } from 'node:crypto';
+import { lzssDecompress } from './lzs.mjs';
+
+const [repeat, ...files] = process.argv.slice(2);
+const result = {};
+for (const file of files) {
+  const raw = readFileSync(file);
+  const buffer = raw.buffer.slice(raw.byteOffset, raw.byteOffset + raw.byteLength);
+  let out = lzssDecompress(buffer);
+  const start = process.hrtime.bigint();
+  for (let i = 0; i < Number(repeat); i += 1) {
+    out = lzssDecompress(buffer);
+  }
+  const seconds = Number(process.hrtime.bigint() - start) / 1e9;
+  result[file] = {
+    seconds,
+    sha1: createHash('sha1').update(out).digest('hex'),
+  };
+}
+process.stdout.write(JSON.stringify(result));
+'''
+
+
+def lzss_decompress_bytewise(buffer: bytes) -> bytes:
+    """The original decoder: one byte at a time through a separate 4 KiB ring."""
+    if len(buffer) < 8:
+        return b''
+    src_size = struct.unpack_from('<I', buffer, 0)[0]
+    dest_size = struct.unpack_from('<I', buffer, 4)[0]
+    if src_size <= 8 or dest_size <= 0:
+        return b''
+    src = buffer[8:8 + (src_size - 8)]
+    dest = bytearray(dest_size)
+    ring = bytearray(4096)
+    buf_pos = 4078
+    flags = 0
+    srcp = 0
+    destp = 0
+    while True:
+        flags >>= 1
+        if (flags & 0x100) == 0:
+            if srcp >= len(src):
+                break
+            flags = src[srcp] | 0xFF00
+            srcp += 1
+        if flags & 1:
+            if srcp >= len(src):
+                break
+            byte = src[srcp]
+            srcp += 1
+            if destp >= len(dest):
+                break
+            dest[destp] = byte
+            ring[buf_pos] = byte
+            buf_pos = (buf_pos + 1) & 4095
+            destp += 1
+        else:
+            if srcp + 1 >= len(src):
+                break
+            offset = src[srcp]
+            r8 = src[srcp + 1]
+            srcp += 2
+            length = (r8 & 0x0F) + 2
+            offset |= (r8 & 0xF0) << 4
+            for i in range(length + 1):
+                byte = ring[(offset + i) & 4095]
+                if destp >= len(dest):
+                    break
+                dest[destp] = byte
+                ring[buf_pos] = byte
+                buf_pos = (buf_pos + 1) & 4095
+                destp += 1
+    return bytes(dest)
+
+
+def lzss_compress(data: bytes, max_chain: int = 16) -> bytes:
+    """Greedy LZSS encoder producing streams `lzss_decompress` accepts."""
+    out = bytearray()
+    chains: Dict[bytes, List[int]] = {}
+    pos = 0
+    size = len(data)
+    while pos < size:
+        flag_index = len(out)
+        out.append(0)
+        for bit in range(8):
+            if pos >= size:
+                break
+            best_len = 0
+            best_src = 0
+            key = data[pos:pos + 3]
+            if len(key) == 3:
+                limit = min(18, size - pos)
+                for cand in reversed(chains.get(key, ())):
+                    if pos - cand >= 4096:
+                        break
+                    length = 3
+                    while length < limit and data[cand + length] == data[pos + length]:
+                        length += 1
+                    if length > best_len:
+                        best_len = length
+                        best_src = cand
+                        if length == limit:
+                            break
+            if best_len >= 3:
+                offset = (4078 + best_src) & 4095
+                out.append(offset & 0xFF)
+                out.append(((offset >> 4) & 0xF0) | (best_len - 3))
+                advance = best_len
+            else:
+                out[flag_index] |= 1 << bit
+                out.append(data[pos])
+                advance = 1
+            for p in range(pos, min(pos + advance, size - 2)):
+                chain = chains.setdefault(data[p:p + 3], [])
+                chain.append(p)
+                if len(chain) > max_chain:
+                    del chain[0]
+            pos += advance
+    return struct.pack('<II', len(out) + 8, size) + bytes(out)
+
+
+def synthetic_stage_payload(rng: random.Random, size: int) -> bytes:
+    """Stage-like data: float tables, repeated records, index runs and padding."""
+    out = bytearray()
+    while len(out) < size:
+        kind = rng.randrange(4)
+        if kind == 0:
+            count = rng.randrange(16, 256)
+            out += struct.pack(f'>{count}f', *(round(rng.uniform(-64, 64), 2) for _ in range(count)))
+        elif kind == 1:
+            record = struct.pack('>fffHHI', rng.random(), rng.random(), rng.random(),
+                                 rng.randrange(0x10000), rng.randrange(0x10000), rng.randrange(64))
+            out += record * rng.randrange(4, 64)
+        elif kind == 2:
+            base = rng.randrange(0x8000)
+            out += struct.pack('>64H', *((base + i) & 0xFFFF for i in range(64)))
+        else:
+            out += bytes(rng.randrange(4, 512))
+    return bytes(out[:size])
+
+
+def load_corpus(paths: List[Path]) -> List[Tuple[str, bytes]]:
+    corpus: List[Tuple[str, bytes]] = []
+    for path in paths:
+        files = sorted(path.rglob('*.lz')) if path.is_dir() else [path]
+        for file_path in files:
+            corpus.append((str(file_path), file_path.read_bytes()))
+    return corpus
+
+
+def synthetic_corpus(count: int, size: int, seed: int) -> List[Tuple[str, bytes]]:
+    rng = random.Random(seed)
+    return [
+        (f'synthetic{idx:03d}.lz', lzss_compress(synthetic_stage_payload(rng, size)))
+        for idx in range(count)
+    ]
+
+
+def time_decoder(
+    decoder: Callable[[bytes], bytes],
+    corpus: List[Tuple[str, bytes]],
+    repeat: int,
+) -> Tuple[float, Dict[str, str]]:
+    digests: Dict[str, str] = {}
+    total = 0.0
+    for name, raw in corpus:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            out = decoder(raw)
+        total += time.perf_counter() - start
+        digests[name] = hashlib.sha1(out).hexdigest()
+    return total, digests
+
+
+def run_node(corpus: List[Tuple[str, bytes]], repeat: int) -> Optional[Tuple[float, Dict[str, str]]]:
+    node = shutil.which('node')
+    if not node or not LZS_TS.exists():
+        return None
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        esbuild = REPO_ROOT / 'node_modules' / '.bin' / 'esbuild'
+        if esbuild.exists():
+            subprocess.run([str(esbuild), str(LZS_TS), '--format=esm', f'--outfile={tmp_dir / "lzs.mjs"}'],
+                           check=True, capture_output=True)
+        else:
+            # lzs.ts carries no type annotations, so it is valid JavaScript as-is.
+            shutil.copyfile(LZS_TS, tmp_dir / 'lzs.mjs')
+        (tmp_dir / 'bench.mjs').write_text(NODE_HARNESS, encoding='utf-8')
+        names: Dict[str, str] = {}
+        for idx, (name, raw) in enumerate(corpus):
+            file_path = tmp_dir / f'{idx:04d}.lz'
+            file_path.write_bytes(raw)
+            names[str(file_path)] = name
+        proc = subprocess.run([node, str(tmp_dir / 'bench.mjs'), str(repeat), *names.keys()],
+                              check=True, capture_output=True, text=True)
+    result = json.loads(proc.stdout)
+    total = sum(entry['seconds'] for entry in result.values())
+    return total, {names[path]: entry['sha1'] for path, entry in result.items()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark LZSS decoders on a stage corpus.')
+    parser.add_argument('--corpus', type=Path, nargs='*', default=[],
+                        help='.lz files or folders to scan for *.lz (default: synthetic corpus)')
+    parser.add_argument('--synthetic-count', type=int, default=8, help='Synthetic files to generate')
+    parser.add_argument('--synthetic-size', type=int, default=512 * 1024,
+                        help='Decompressed size of each synthetic file in bytes')
+    parser.add_argument('--seed', type=int, default=1, help='Synthetic corpus seed')
+    parser.add_argument('--repeat', type=int, default=3, help='Decodes per file per decoder')
+    parser.add_argument('--no-node', action='store_true', help='Skip the src/lzs.ts comparison')
+    args = parser.parse_args()
+
+    if args.corpus:
+        corpus = load_corpus(args.corpus)
+    else:
+        print('Generating synthetic corpus...', file=sys.stderr)
+        corpus = synthetic_corpus(args.synthetic_count, args.synthetic_size, args.seed)
+    if not corpus:
+        raise SystemExit('empty corpus')
+
+    reference = lzss_decompress_bytewise
+    out_bytes = sum(len(reference(raw)) for _, raw in corpus) * args.repeat
+    results: List[Tuple[str, float, Dict[str, str]]] = []
+    for label, decoder in (('bytewise', reference), ('bulk', lzss_decompress)):
+        seconds, digests = time_decoder(decoder, corpus, args.repeat)
+        results.append((label, seconds, digests))
+    if not args.no_node:
+        node_result = run_node(corpus, args.repeat)
+        if node_result is None:
+            print('node not found; skipping src/lzs.ts', file=sys.stderr)
+        else:
+            results.append(('lzs.ts', *node_result))
+
+    _, base_seconds, base_digests = results[0]
+    mismatches = 0
+    print(f'{len(corpus)} files, {out_bytes / args.repeat / 1e6:.2f} MB decompressed, x{args.repeat}')
+    for label, seconds, digests in results:
+        bad = [name for name, digest in digests.items() if digest != base_digests[name]]
+        mismatches += len(bad)
+        rate = out_bytes / 1e6 / seconds if seconds > 0 else float('inf')
+        print(f'  {label:<10} {seconds:8.3f}s {rate:9.2f} MB/s  x{base_seconds / seconds:6.2f}'
+              f'  {"OK" if not bad else f"{len(bad)} MISMATCHED"}')
+        for name in bad:
+            print(f'    mismatch: {name}')
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""Time the pack builder's phases on a synthetic (or real) extracted ROM.
+
+Each phase runs `--repeat` times on fresh state and the fastest run is kept:
+
+- rel_parse: REL header, section table and relocation index
+- rel_link: apply relocations to an in-memory image
+- rel_tables: WorldTheme, theme light and bg filename tables
+- scan_*: the fallback table locators over the whole REL
+- course_data: vanilla challenge/story tables (`load_vanilla_course_data`)
+- stage_env / stage_env_parallel: fog extraction for every stage, serial and
+  on `--jobs` workers
+- copy / zip: copy the pack files to a folder / stream them into pack.zip
+- build_pack_cold / build_pack_warm: the whole build without a cache, and a
+  rebuild against a warm build cache
+
+Results are written as JSON (`--output`) so runs can be compared across
+commits with `--compare`. Without `--rom` a ROM is generated with
+`synthetic_rom.write_synthetic_rom`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from dump_vanilla_conf import find_course_offsets, find_story_block_offsets, load_vanilla_course_data
+from pack_zip import ZIP_DEFAULT_LEVEL, PackZipWriter
+from smb2_pack_builder import (
+    DEFAULT_SYMBOLS,
+    RomSession,
+    build_pack,
+    copy_file,
+    extract_stage_fogs,
+    find_stage_world_themes_offsets,
+    list_pack_files,
+)
+from synthetic_rom import write_synthetic_rom
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+RESULTS_VERSION = 1
+
+
+def git_revision() -> Optional[str]:
+    try:
+        proc = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                              check=True, capture_output=True, text=True)
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_ROOT,
+                               check=True, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return proc.stdout.strip() + ('-dirty' if dirty else '')
+
+
+class PhaseTimer:
+    def __init__(self, repeat: int) -> None:
+        self.repeat = repeat
+        self.phases: Dict[str, Dict[str, object]] = {}
+
+    def run(self, name: str, func: Callable[[], object], setup: Optional[Callable[[], None]] = None) -> object:
+        runs: List[float] = []
+        result = None
+        for _ in range(self.repeat):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            result = func()
+            runs.append(time.perf_counter() - start)
+        self.phases[name] = {'seconds': min(runs), 'runs': runs}
+        print(f'  {name:<22} {min(runs):8.3f}s', file=sys.stderr)
+        return result
+
+
+def reset_dir(path: Path) -> None:
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def run_benchmarks(rom_dir: Path, work_dir: Path, repeat: int, jobs: int) -> Dict[str, Dict[str, object]]:
+    timer = PhaseTimer(repeat)
+    stage_world_addr = DEFAULT_SYMBOLS['STAGE_WORLD_THEMES']
+    theme_lights_addr = DEFAULT_SYMBOLS['theme_lights']
+    bg_list_addr = DEFAULT_SYMBOLS['g_bg_filename_list']
+
+    def fresh_session() -> RomSession:
+        return RomSession(rom_dir)
+
+    def rel_parse() -> RomSession:
+        session = fresh_session()
+        for attr in ('rel_header', 'rel_sections', 'relocations'):
+            getattr(session, attr)
+        return session
+
+    session = timer.run('rel_parse', rel_parse)
+    timer.run('rel_link', lambda: rel_parse().linked_rel(stage_world_addr))
+    rel_tables = timer.run('rel_tables', lambda: fresh_session().rel_tables(
+        stage_world_addr, theme_lights_addr, bg_list_addr))
+
+    data = session.rel_data
+    stage_ids = session.stage_id_set
+    named = {idx for idx, name in enumerate(session.stage_name_lines) if name and name != '-'}
+    timer.run('scan_stage_world', lambda: find_stage_world_themes_offsets(data, session.rel_sections[5]))
+    timer.run('scan_courses', lambda: find_course_offsets(data, stage_ids, named))
+    timer.run('scan_story', lambda: find_story_block_offsets(data, stage_ids, named))
+    timer.run('course_data', lambda: load_vanilla_course_data(rom_dir, session=fresh_session()))
+
+    stage_dir = rom_dir / 'stage'
+    ids = session.stage_ids
+    timer.run('stage_env', lambda: extract_stage_fogs(stage_dir, ids, 1))
+    timer.run('stage_env_parallel', lambda: extract_stage_fogs(stage_dir, ids, jobs))
+
+    stage_world_themes, _, bg_names = rel_tables
+    bgs = {bg_names[theme] for theme in (stage_world_themes[sid] for sid in ids if sid < len(stage_world_themes))
+           if theme < len(bg_names) and bg_names[theme]}
+    pack_files = list_pack_files(rom_dir, ids, bgs)
+    copy_dir = work_dir / 'copy'
+
+    def copy_all() -> None:
+        warnings: List[str] = []
+        for arcname, src in pack_files:
+            copy_file(src, copy_dir / arcname, warnings, mode='copy')
+
+    def zip_all() -> None:
+        writer = PackZipWriter(work_dir / 'pack.zip', ZIP_DEFAULT_LEVEL)
+        for arcname, src in pack_files:
+            writer.add_file(arcname, src)
+        writer.close()
+
+    timer.run('copy', copy_all, setup=lambda: reset_dir(copy_dir))
+    timer.run('zip', zip_all)
+
+    out_dir = work_dir / 'pack'
+    cache_dir = work_dir / 'cache'
+
+    def build(use_cache: bool) -> None:
+        with contextlib.redirect_stdout(io.StringIO()):
+            build_pack(rom_dir, out_dir, 'bench', 'Bench', None, False,
+                       jobs=jobs, use_cache=use_cache, cache_dir=cache_dir)
+
+    timer.run('build_pack_cold', lambda: build(False), setup=lambda: reset_dir(out_dir))
+    build(True)
+    timer.run('build_pack_warm', lambda: build(True))
+    session.close()
+    return timer.phases
+
+
+def rom_stats(rom_dir: Path) -> Dict[str, int]:
+    with RomSession(rom_dir) as session:
+        return {
+            'rel_bytes': len(session.rel_data),
+            'relocations': len(session.relocations),
+            'stages': len(session.stage_ids),
+            'stage_lz_bytes': sum(path.stat().st_size for path in session.stage_dir.glob('STAGE*.lz')),
+            'total_bytes': sum(path.stat().st_size for path in rom_dir.rglob('*') if path.is_file()),
+        }
+
+
+def print_comparison(current: Dict[str, object], baseline: Dict[str, object]) -> None:
+    print(f'{"phase":<22} {baseline.get("revision") or "baseline":>12} {current.get("revision") or "current":>12}')
+    base_phases = baseline.get('phases', {})
+    for name, entry in current['phases'].items():
+        new = entry['seconds']
+        old = base_phases.get(name, {}).get('seconds')
+        if old is None:
+            print(f'{name:<22} {"-":>12} {new:11.3f}s')
+            continue
+        print(f'{name:<22} {old:11.3f}s {new:11.3f}s  x{old / max(new, 1e-9):6.2f}')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark pack builder phases on a synthetic ROM.')
+    parser.add_argument('--rom', type=Path, help='Extracted ROM folder (default: generate a synthetic ROM)')
+    parser.add_argument('--stages', type=int, default=60, help='Synthetic ROM stage count')
+    parser.add_argument('--stage-kb', type=int, default=128, help='Synthetic stagedef size in KB')
+    parser.add_argument('--asset-kb', type=int, default=128, help='Synthetic .gma/.tpl size in KB')
+    parser.add_argument('--text-kb', type=int, default=1024, help='Synthetic REL .text size in KB')
+    parser.add_argument('--seed', type=int, default=1, help='Synthetic ROM seed')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per phase (the fastest is kept)')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='Workers for stage_env_parallel')
+    parser.add_argument('--output', type=Path, help='Write results JSON here')
+    parser.add_argument('--compare', type=Path, help='Results JSON from an earlier run to compare against')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='bench_pack_') as tmp:
+        work_dir = Path(tmp)
+        rom_dir = args.rom
+        params: Dict[str, object] = {'repeat': args.repeat, 'jobs': args.jobs}
+        if rom_dir is None:
+            params.update(stages=args.stages, stage_kb=args.stage_kb, asset_kb=args.asset_kb,
+                          text_kb=args.text_kb, seed=args.seed)
+            print('Generating synthetic ROM...', file=sys.stderr)
+            rom_dir = write_synthetic_rom(work_dir / 'rom', stages=args.stages, stage_size=args.stage_kb * 1024,
+                                          asset_size=args.asset_kb * 1024, text_size=args.text_kb * 1024,
+                                          seed=args.seed)
+        else:
+            params['rom'] = str(rom_dir)
+        stats = rom_stats(rom_dir)
+        print(f'{stats["stages"]} stages, {stats["relocations"]} relocations, '
+              f'{stats["total_bytes"] / 1e6:.1f} MB', file=sys.stderr)
+        phases = run_benchmarks(rom_dir, work_dir, args.repeat, args.jobs)
+
+    results = {
+        'version': RESULTS_VERSION,
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': params,
+        'rom': stats,
+        'phases': phases,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2), encoding='utf-8')
+    if args.compare:
+        print_comparison(results, json.loads(args.compare.read_text(encoding='utf-8')))
+    elif not args.output:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
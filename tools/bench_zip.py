@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Benchmark pack zip emission with single- and multi-threaded deflate.
+
+Writes a synthetic pack (compressible .gma/.tpl-like payloads plus stored .lz
+files) to a temp folder, zips it once per thread count, and checks that every
+archive is byte-identical to the single-threaded one.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+from pack_zip import ZIP_DEFAULT_LEVEL, PackZipWriter
+
+
+def write_synthetic_pack(root: Path, total_mb: int, seed: int) -> List[Tuple[str, Path]]:
+    rng = random.Random(seed)
+    # A 16-symbol alphabet deflates roughly like texture/model data.
+    alphabet = bytes(rng.randrange(256) for _ in range(16)) * 16
+    base = rng.randbytes(8 * 1024 * 1024).translate(alphabet)
+    noise = rng.randbytes(4 * 1024 * 1024)
+    files: List[Tuple[str, Path]] = []
+    remaining = total_mb * 1024 * 1024
+    idx = 0
+    while remaining > 0:
+        stage = f'st{idx // 3 + 1:03d}'
+        kind = idx % 3
+        size = min(remaining, rng.randrange(256 * 1024, 4 * 1024 * 1024))
+        start = rng.randrange(len(base) - size) if size < len(base) else 0
+        if kind == 0:
+            name = f'STAGE{idx // 3 + 1:03d}.lz'
+            data = noise[:size]
+        else:
+            name = f'{stage}.{"gma" if kind == 1 else "tpl"}'
+            data = (base[start:] + base)[:size]
+        path = root / stage / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        files.append((f'{stage}/{name}', path))
+        remaining -= size
+        idx += 1
+    return files
+
+
+def zip_pack(files: List[Tuple[str, Path]], zip_path: Path, level: int, threads: int) -> float:
+    start = time.perf_counter()
+    writer = PackZipWriter(zip_path, level, threads)
+    writer.add_bytes('pack.json', b'{}')
+    for arcname, path in files:
+        writer.add_file(arcname, path)
+    writer.close()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark threaded deflate for pack zips.')
+    parser.add_argument('--size-mb', type=int, default=300, help='Synthetic pack size in MB')
+    parser.add_argument('--threads', type=int, nargs='*', default=None,
+                        help='Thread counts to compare (default: 1 and the CPU count)')
+    parser.add_argument('--level', type=int, default=ZIP_DEFAULT_LEVEL, help='Deflate level')
+    parser.add_argument('--seed', type=int, default=1, help='Synthetic pack seed')
+    args = parser.parse_args()
+
+    thread_counts = args.threads or sorted({1, os.cpu_count() or 1})
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        print(f'Writing {args.size_mb} MB synthetic pack...', file=sys.stderr)
+        files = write_synthetic_pack(tmp_dir / 'pack', args.size_mb, args.seed)
+        total = sum(path.stat().st_size for _, path in files)
+        results = []
+        for threads in thread_counts:
+            zip_path = tmp_dir / f'pack_{threads}.zip'
+            seconds = zip_pack(files, zip_path, args.level, threads)
+            digest = hashlib.sha256(zip_path.read_bytes()).hexdigest()
+            results.append((threads, seconds, zip_path.stat().st_size, digest))
+            zip_path.unlink()
+
+    print(f'{len(files)} files, {total / 1e6:.1f} MB, level {args.level}')
+    base_seconds, base_digest = results[0][1], results[0][3]
+    mismatched = False
+    for threads, seconds, size, digest in results:
+        same = digest == base_digest
+        mismatched |= not same
+        print(f'  threads={threads:<3} {seconds:7.2f}s {total / 1e6 / seconds:8.1f} MB/s'
+              f'  x{base_seconds / seconds:5.2f}  zip {size / 1e6:.1f} MB  {"identical" if same else "DIFFERENT"}')
+    if mismatched:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,326 @@
+"""Persistent build cache for smb2_pack_builder.
+
+Everything is keyed by input content: files are identified by a SHA-256 digest
+that is only recomputed when their size or mtime changes. Derived data (parsed
+REL tables, per-stage env entries) lives in a size-bounded entry table that
+evicts least-recently-used rows, and copied outputs are recorded so unchanged
+files are not copied again on the next build.
+
+A separate layout database (layouts.sqlite3, next to the cache) records the
+table offsets found in each `mkb2.main_loop.rel` and the symbols parsed from
+each `.lst`. Those rows are never evicted automatically; run this module to
+list or prune them.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# Bump when the shape of cached values changes; old entries are then ignored.
+CACHE_VERSION = 2
+# Bump when the meaning of stored layout fields changes.
+LAYOUT_VERSION = 1
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+_FILES_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    digest TEXT NOT NULL
+);
+'''
+
+_SCHEMA = _FILES_SCHEMA + '''
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS outputs (
+    path TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+'''
+
+# Kept apart from the build cache so it is never evicted, and so layout writes
+# never wait on the long transaction a running build holds on the cache.
+_LAYOUT_SCHEMA = _FILES_SCHEMA + '''
+CREATE TABLE IF NOT EXISTS layouts (
+    rel_digest TEXT PRIMARY KEY,
+    rel_path TEXT NOT NULL,
+    layout TEXT NOT NULL,
+    updated REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS symbols (
+    lst_digest TEXT PRIMARY KEY,
+    lst_path TEXT NOT NULL,
+    symbols TEXT NOT NULL,
+    last_used REAL NOT NULL
+);
+'''
+
+
+def default_cache_dir() -> Path:
+    base = os.environ.get('XDG_CACHE_HOME')
+    root = Path(base) if base else Path.home() / '.cache'
+    return root / 'smb2_pack_builder'
+
+
+def hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open('rb') as handle:
+        for chunk in iter(lambda: handle.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _file_digest(db: sqlite3.Connection, path: Path) -> str:
+    key = str(path.resolve())
+    stat = path.stat()
+    row = db.execute('SELECT size, mtime_ns, digest FROM files WHERE path = ?', (key,)).fetchone()
+    if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+        return row[2]
+    digest = hash_file(path)
+    db.execute(
+        'INSERT OR REPLACE INTO files (path, size, mtime_ns, digest) VALUES (?, ?, ?, ?)',
+        (key, stat.st_size, stat.st_mtime_ns, digest),
+    )
+    return digest
+
+
+class BuildCache:
+    def __init__(self, cache_dir: Path, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._db = sqlite3.connect(str(cache_dir / 'build_cache.sqlite3'), timeout=30)
+        self._db.executescript(_SCHEMA)
+
+    def __enter__(self) -> 'BuildCache':
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.evict()
+        self._db.commit()
+        self._db.close()
+
+    def file_digest(self, path: Path) -> str:
+        """SHA-256 of a file, reusing the stored digest while size and mtime match."""
+        return _file_digest(self._db, path)
+
+    @staticmethod
+    def _entry_key(kind: str, key: str) -> str:
+        return f'{kind}:v{CACHE_VERSION}:{key}'
+
+    def get(self, kind: str, key: str) -> Optional[object]:
+        entry_key = self._entry_key(kind, key)
+        row = self._db.execute('SELECT value FROM entries WHERE key = ?', (entry_key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._db.execute('UPDATE entries SET last_used = ? WHERE key = ?', (time.time(), entry_key))
+        return json.loads(row[0])
+
+    def put(self, kind: str, key: str, value: object) -> None:
+        text = json.dumps(value)
+        self._db.execute(
+            'INSERT OR REPLACE INTO entries (key, value, size, last_used) VALUES (?, ?, ?, ?)',
+            (self._entry_key(kind, key), text, len(text), time.time()),
+        )
+
+    def _output_digest(self, src: Path, producer: Optional[str]) -> str:
+        digest = self.file_digest(src)
+        return f'{producer}:{digest}' if producer else digest
+
+    def output_is_current(self, src: Path, dst: Path, producer: Optional[str] = None) -> bool:
+        """True if `dst` is still the untouched output made from `src` by an earlier build.
+
+        `producer` names and versions the generator of a derived output, so a
+        changed generator rewrites outputs it made from unchanged sources.
+        """
+        try:
+            stat = dst.stat()
+        except OSError:
+            return False
+        row = self._db.execute(
+            'SELECT digest, size, mtime_ns FROM outputs WHERE path = ?', (str(dst.resolve()),)
+        ).fetchone()
+        if row is None or row[1] != stat.st_size or row[2] != stat.st_mtime_ns:
+            return False
+        return row[0] == self._output_digest(src, producer)
+
+    def record_output(self, src: Path, dst: Path, producer: Optional[str] = None) -> None:
+        stat = dst.stat()
+        self._db.execute(
+            'INSERT OR REPLACE INTO outputs (path, digest, size, mtime_ns) VALUES (?, ?, ?, ?)',
+            (str(dst.resolve()), self._output_digest(src, producer), stat.st_size, stat.st_mtime_ns),
+        )
+
+    def evict(self) -> None:
+        total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._db.execute('SELECT key, size FROM entries ORDER BY last_used').fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+            total -= size
+
+
+class LayoutDatabase:
+    """Per-ROM table offsets and per-.lst symbols, keyed by file content.
+
+    A layout is a JSON object of whatever the scanners discovered for one
+    `mkb2.main_loop.rel` (e.g. `stage_world_themes`, `courses`, `story`);
+    fields are merged as they are found. Every call opens its own short-lived
+    connection and commits, so a long-running GUI session never holds writes.
+    """
+
+    def __init__(self, cache_dir: Optional[Path] = None) -> None:
+        self.cache_dir = cache_dir or default_cache_dir()
+
+    def _connect(self) -> sqlite3.Connection:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(str(self.cache_dir / 'layouts.sqlite3'), timeout=30)
+        db.executescript(_LAYOUT_SCHEMA)
+        return db
+
+    def layout(self, rel_path: Path) -> Dict[str, object]:
+        with closing(self._connect()) as db, db:
+            digest = _file_digest(db, rel_path)
+            row = db.execute('SELECT layout FROM layouts WHERE rel_digest = ?', (digest,)).fetchone()
+            if row is None:
+                return {}
+            layout = json.loads(row[0])
+            if layout.get('version') != LAYOUT_VERSION:
+                return {}
+            db.execute('UPDATE layouts SET last_used = ? WHERE rel_digest = ?', (time.time(), digest))
+        return layout
+
+    def record_layout(self, rel_path: Path, **fields: object) -> None:
+        with closing(self._connect()) as db, db:
+            digest = _file_digest(db, rel_path)
+            row = db.execute('SELECT layout FROM layouts WHERE rel_digest = ?', (digest,)).fetchone()
+            layout = json.loads(row[0]) if row else {}
+            if layout.get('version') != LAYOUT_VERSION:
+                layout = {'version': LAYOUT_VERSION}
+            layout.update(fields)
+            now = time.time()
+            db.execute(
+                'INSERT OR REPLACE INTO layouts (rel_digest, rel_path, layout, updated, last_used) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (digest, str(rel_path.resolve()), json.dumps(layout, sort_keys=True), now, now),
+            )
+
+    def symbols(self, lst_path: Path) -> Optional[Dict[str, int]]:
+        with closing(self._connect()) as db, db:
+            digest = _file_digest(db, lst_path)
+            row = db.execute('SELECT symbols FROM symbols WHERE lst_digest = ?', (digest,)).fetchone()
+            if row is None:
+                return None
+            db.execute('UPDATE symbols SET last_used = ? WHERE lst_digest = ?', (time.time(), digest))
+        return json.loads(row[0])
+
+    def record_symbols(self, lst_path: Path, symbols: Dict[str, int]) -> None:
+        with closing(self._connect()) as db, db:
+            db.execute(
+                'INSERT OR REPLACE INTO symbols (lst_digest, lst_path, symbols, last_used) VALUES (?, ?, ?, ?)',
+                (_file_digest(db, lst_path), str(lst_path.resolve()), json.dumps(symbols), time.time()),
+            )
+
+    def entries(self) -> List[Tuple[str, str, str, float, Dict[str, object]]]:
+        """(kind, digest, path, last_used, data) for every layout and symbol table."""
+        with closing(self._connect()) as db:
+            rows = [
+                ('layout', digest, path, last_used, json.loads(layout))
+                for digest, path, layout, last_used in db.execute(
+                    'SELECT rel_digest, rel_path, layout, last_used FROM layouts ORDER BY last_used DESC')
+            ]
+            rows += [
+                ('symbols', digest, path, last_used, json.loads(symbols))
+                for digest, path, symbols, last_used in db.execute(
+                    'SELECT lst_digest, lst_path, symbols, last_used FROM symbols ORDER BY last_used DESC')
+            ]
+        return rows
+
+    def prune(
+        self,
+        digests: Tuple[str, ...] = (),
+        older_than: Optional[float] = None,
+        missing: bool = False,
+        everything: bool = False,
+    ) -> int:
+        """Delete rows by digest prefix, age in seconds, or whose source file is gone."""
+        removed = 0
+        cutoff = time.time() - older_than if older_than is not None else None
+        with closing(self._connect()) as db, db:
+            for table, key in (('layouts', 'rel_digest'), ('symbols', 'lst_digest')):
+                path_col = 'rel_path' if table == 'layouts' else 'lst_path'
+                rows = db.execute(f'SELECT {key}, {path_col}, last_used FROM {table}').fetchall()
+                for digest, path, last_used in rows:
+                    if (everything
+                            or any(digest.startswith(prefix) for prefix in digests)
+                            or (cutoff is not None and last_used < cutoff)
+                            or (missing and not Path(path).exists())):
+                        db.execute(f'DELETE FROM {table} WHERE {key} = ?', (digest,))
+                        removed += 1
+        return removed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Inspect or prune the ROM layout database.')
+    parser.add_argument('--cache-dir', type=Path, help='Build cache folder (default: ~/.cache/smb2_pack_builder)')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('list', help='List known ROM layouts and symbol files')
+    show = sub.add_parser('show', help='Print stored data for a digest prefix')
+    show.add_argument('digest')
+    prune = sub.add_parser('prune', help='Delete stored layouts/symbols')
+    prune.add_argument('digests', nargs='*', help='Digest prefixes to delete')
+    prune.add_argument('--older-than-days', type=float, help='Delete rows unused for this many days')
+    prune.add_argument('--missing', action='store_true', help='Delete rows whose source file no longer exists')
+    prune.add_argument('--all', action='store_true', help='Delete every row')
+    args = parser.parse_args()
+
+    db = LayoutDatabase(args.cache_dir)
+    if args.command == 'list':
+        for kind, digest, path, last_used, data in db.entries():
+            used = time.strftime('%Y-%m-%d %H:%M', time.localtime(last_used))
+            summary = ', '.join(sorted(k for k in data if k != 'version')) if kind == 'layout' else f'{len(data)} symbols'
+            print(f'{kind:<8} {digest[:12]}  {used}  {path}  [{summary}]')
+    elif args.command == 'show':
+        matches = [entry for entry in db.entries() if entry[1].startswith(args.digest)]
+        if not matches:
+            raise SystemExit(f'no layout or symbol table matches {args.digest}')
+        for kind, digest, path, _, data in matches:
+            print(f'{kind} {digest} {path}')
+            print(json.dumps(data, indent=2, sort_keys=True))
+    else:
+        if not (args.digests or args.older_than_days is not None or args.missing or args.all):
+            parser.error('prune needs digests, --older-than-days, --missing or --all')
+        older_than = args.older_than_days * 86400 if args.older_than_days is not None else None
+        removed = db.prune(tuple(args.digests), older_than, args.missing, args.all)
+        print(f'removed {removed} rows')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""Opt-in profiling for pack builds and ROM dumps (`--profile`).
+
+`Profiler` records spans (wall and CPU time, tracemalloc peak, free-form
+args) and byte counters, prints a summary table and writes a Chrome trace
+that chrome://tracing and https://ui.perfetto.dev load directly.
+
+Instrumented code takes a `profiler` argument defaulting to `NULL_PROFILER`,
+whose methods do nothing and whose `span()` hands back one shared null
+context, so an unprofiled run pays a method call per phase and nothing per
+byte. Per-stage numbers come from worker processes as plain dicts and are
+merged with `add_span()`.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import json
+import os
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, TextIO, Tuple
+
+TRACE_PROCESS_NAME = 'smb2 tools'
+
+
+def span_clock() -> Tuple[int, int]:
+    """(wall, CPU) nanoseconds; the wall clock is comparable across processes."""
+    return time.perf_counter_ns(), time.process_time_ns()
+
+
+def memory_peak_start() -> None:
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+
+
+def memory_peak() -> int:
+    return tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else 0
+
+
+class Profiler:
+    enabled = True
+
+    def __init__(self, track_memory: bool = True) -> None:
+        self.origin_ns = time.perf_counter_ns()
+        self.pid = os.getpid()
+        self.events: List[Dict[str, object]] = []
+        self.counters: Dict[str, int] = {}
+        self.peak_memory = 0
+        self._track_memory = track_memory
+        self._started_tracing = False
+        # Peak of every open span, innermost last, so a nested span's
+        # reset_peak() does not hide the outer span's earlier peak.
+        self._open_peaks: List[int] = []
+        if track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    @contextlib.contextmanager
+    def span(self, name: str, cat: str = 'phase', **args: object) -> Iterator[Dict[str, object]]:
+        """Time the body; it may add trace args to the dict it is given."""
+        if self._track_memory:
+            if self._open_peaks:
+                self._open_peaks[-1] = max(self._open_peaks[-1], memory_peak())
+            tracemalloc.reset_peak()
+            self._open_peaks.append(0)
+        wall, cpu = span_clock()
+        try:
+            yield args
+        finally:
+            end_wall, end_cpu = span_clock()
+            if self._track_memory:
+                peak = max(self._open_peaks.pop(), memory_peak())
+                if self._open_peaks:
+                    self._open_peaks[-1] = max(self._open_peaks[-1], peak)
+                self.peak_memory = max(self.peak_memory, peak)
+                args['peak_bytes'] = peak
+            self.add_span(name, cat, wall, end_wall, end_cpu - cpu, args=args)
+
+    def add_span(
+        self,
+        name: str,
+        cat: str,
+        start_ns: int,
+        end_ns: int,
+        cpu_ns: int,
+        pid: Optional[int] = None,
+        tid: Optional[int] = None,
+        args: Optional[Dict[str, object]] = None,
+    ) -> None:
+        self.events.append({
+            'name': name,
+            'cat': cat,
+            'ph': 'X',
+            'ts': (start_ns - self.origin_ns) / 1000,
+            'dur': (end_ns - start_ns) / 1000,
+            'pid': pid or self.pid,
+            'tid': tid or threading.get_native_id(),
+            'args': {'cpu_ms': cpu_ns / 1e6, **(args or {})},
+        })
+
+    def count(self, name: str, amount: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def close(self) -> None:
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def summary_rows(self, cat: str) -> List[Tuple[str, int, float, float, int]]:
+        """(name, calls, wall s, CPU s, peak bytes) per span name, in order of first start."""
+        rows: Dict[str, List[float]] = {}
+        for event in sorted(self.events, key=lambda event: event['ts']):
+            if event['cat'] != cat:
+                continue
+            row = rows.setdefault(event['name'], [0, 0.0, 0.0, 0])
+            row[0] += 1
+            row[1] += event['dur'] / 1e6
+            row[2] += event['args']['cpu_ms'] / 1e3
+            row[3] = max(row[3], event['args'].get('peak_bytes', 0))
+        return [(name, int(calls), wall, cpu, int(peak)) for name, (calls, wall, cpu, peak) in rows.items()]
+
+    def print_summary(self, file: Optional[TextIO] = None) -> None:
+        def out(line: str = '') -> None:
+            print(line, file=file)
+
+        out('Profile:')
+        out(f'  {"phase":<24} {"calls":>5} {"wall s":>9} {"cpu s":>9} {"peak MB":>9}')
+        for name, calls, wall, cpu, peak in self.summary_rows('phase'):
+            out(f'  {name:<24} {calls:5d} {wall:9.3f} {cpu:9.3f} {peak / 1e6:9.2f}')
+
+        stages = [event for event in self.events if event['cat'] == 'stage']
+        if stages:
+            walls = sorted((event['dur'] / 1e6, event['name']) for event in stages)
+            total = sum(wall for wall, _ in walls)
+            out(f'  stages: {len(stages)}, wall {total:.3f}s total, '
+                f'{total / len(stages) * 1e3:.1f} ms mean, {walls[-1][0] * 1e3:.1f} ms max ({walls[-1][1]})')
+            literal = sum(event['args'].get('literal_bytes', 0) for event in stages)
+            matched = sum(event['args'].get('match_bytes', 0) for event in stages)
+            if literal + matched:
+                out(f'  lzss: {literal} literal / {matched} match bytes decoded '
+                    f'({literal / (literal + matched):.1%} literal)')
+        for name, value in self.counters.items():
+            out(f'  {name:<24} {value:>14,}')
+        if self._track_memory:
+            out(f'  {"tracemalloc peak":<24} {self.peak_memory / 1e6:13.2f}M')
+
+    def write_trace(self, path: Path) -> None:
+        pids = sorted({event['pid'] for event in self.events} | {self.pid})
+        metadata = [
+            {'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0,
+             'args': {'name': TRACE_PROCESS_NAME if pid == self.pid else f'worker {pid}'}}
+            for pid in pids
+        ]
+        trace = {
+            'traceEvents': metadata + self.events,
+            'displayTimeUnit': 'ms',
+            'otherData': {'counters': self.counters, 'peak_memory': self.peak_memory},
+        }
+        path.write_text(json.dumps(trace), encoding='utf-8')
+
+
+class NullProfiler(Profiler):
+    """Disabled profiler: every method is a no-op."""
+
+    enabled = False
+
+    def __init__(self) -> None:
+        self._null_span = contextlib.nullcontext()
+
+    def span(self, name: str, cat: str = 'phase', **args: object):
+        return self._null_span
+
+    def add_span(self, *args: object, **kwargs: object) -> None:
+        pass
+
+    def count(self, name: str, amount: int = 1) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+NULL_PROFILER = NullProfiler()
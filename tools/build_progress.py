@@ -0,0 +1,84 @@
+"""Progress reporting and cancellation for builds running off the UI thread.
+
+`build_pack` takes a `progress` argument defaulting to `NULL_PROGRESS`. It
+announces each phase and every finished stage and file through it, and each
+of those calls is also a cancellation point: once `cancel()` has been called
+(from any thread) the next one raises `BuildCancelled`, so a build stops
+between two stages or two files rather than in the middle of one.
+"""
+
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass
+from typing import Callable
+
+
+class BuildCancelled(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class ProgressEvent:
+    phase: str
+    done: int = 0
+    total: int = 0
+    bytes: int = 0
+
+
+class BuildProgress:
+    enabled = True
+
+    def __init__(self, post: Callable[[ProgressEvent], None]) -> None:
+        # `post` runs on the building thread; hand events to a queue there.
+        self._post = post
+        self._cancel = threading.Event()
+        self._phase = ''
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def check(self) -> None:
+        if self._cancel.is_set():
+            raise BuildCancelled('cancelled')
+
+    def phase(self, name: str, total: int = 0) -> None:
+        self.check()
+        self._phase = name
+        self._post(ProgressEvent(name, 0, total))
+
+    def step(self, done: int, total: int, nbytes: int = 0) -> None:
+        self.check()
+        self._post(ProgressEvent(self._phase, done, total, nbytes))
+
+
+class NullProgress(BuildProgress):
+    """No reporting and no cancellation."""
+
+    enabled = False
+
+    def __init__(self) -> None:
+        pass
+
+    def cancel(self) -> None:
+        pass
+
+    @property
+    def cancelled(self) -> bool:
+        return False
+
+    def check(self) -> None:
+        pass
+
+    def phase(self, name: str, total: int = 0) -> None:
+        pass
+
+    def step(self, done: int, total: int, nbytes: int = 0) -> None:
+        pass
+
+
+NULL_PROGRESS = NullProgress()
@@ -0,0 +1,128 @@
+"""Editable challenge/story course lists for the pack builder GUI.
+
+`CourseModel` owns the course data the GUI edits and keeps two indexes next
+to it: a stage id -> reference count over every course and world, so
+"is this stage still used?" is a dict lookup, and the course names in sorted
+order, so a course's listbox row is found by bisection. Every edit returns
+the row it touched, letting the GUI insert or delete that single row rather
+than refill the listbox.
+"""
+
+from __future__ import annotations
+
+from bisect import bisect_left, insort
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+CourseEntry = Tuple[int, bool]
+
+
+class CourseModel:
+    def __init__(self) -> None:
+        self.challenge_courses: Dict[str, List[CourseEntry]] = {}
+        self.story_worlds: List[List[int]] = []
+        self.stage_time_overrides: Dict[int, int] = {}
+        self.course_names: List[str] = []
+        self._stage_refs: Counter = Counter()
+
+    def __bool__(self) -> bool:
+        return bool(self.challenge_courses or self.story_worlds)
+
+    def replace(
+        self,
+        challenge_courses: Dict[str, List[CourseEntry]],
+        story_worlds: Optional[List[List[int]]] = None,
+        stage_time_overrides: Optional[Dict[int, int]] = None,
+    ) -> None:
+        """Load new course data, keeping `story_worlds` unless one is given."""
+        self.challenge_courses = {name: list(entries) for name, entries in challenge_courses.items()}
+        if story_worlds is not None:
+            self.story_worlds = [list(world) for world in story_worlds]
+        self.stage_time_overrides = dict(stage_time_overrides or {})
+        self.course_names = sorted(self.challenge_courses)
+        self._stage_refs = Counter()
+        for entries in self.challenge_courses.values():
+            self._stage_refs.update(stage_id for stage_id, _ in entries)
+        for world in self.story_worlds:
+            self._stage_refs.update(world)
+
+    def stage_in_use(self, stage_id: int) -> bool:
+        return self._stage_refs[stage_id] > 0
+
+    def _release(self, stage_ids: Iterable[int], drop_overrides: bool) -> None:
+        for stage_id in stage_ids:
+            self._stage_refs[stage_id] -= 1
+            if self._stage_refs[stage_id] <= 0:
+                del self._stage_refs[stage_id]
+                if drop_overrides:
+                    self.stage_time_overrides.pop(stage_id, None)
+
+    def set_time_override(self, stage_id: int, time_limit: Optional[int]) -> bool:
+        """Record a time limit (frames); True if it changed."""
+        if time_limit is None or self.stage_time_overrides.get(stage_id) == time_limit:
+            return False
+        self.stage_time_overrides[stage_id] = time_limit
+        return True
+
+    def stage_label(self, stage_id: int, bonus: bool = False) -> str:
+        time_override = self.stage_time_overrides.get(stage_id)
+        time_label = f' ({time_override // 60}s)' if time_override else ''
+        return f'{stage_id}{time_label} {"(bonus)" if bonus else ""}'.strip()
+
+    # Challenge courses
+
+    def course_row(self, name: str) -> int:
+        return bisect_left(self.course_names, name)
+
+    def add_course(self, name: str) -> int:
+        if name in self.challenge_courses:
+            raise ValueError(f'course {name!r} already exists')
+        self.challenge_courses[name] = []
+        insort(self.course_names, name)
+        return self.course_row(name)
+
+    def remove_course(self, name: str) -> int:
+        """Drop a course; returns the listbox row it occupied."""
+        row = self.course_row(name)
+        entries = self.challenge_courses.pop(name)
+        del self.course_names[row]
+        self._release((stage_id for stage_id, _ in entries), drop_overrides=False)
+        return row
+
+    def add_stage(self, name: str, stage_id: int, bonus: bool = False) -> int:
+        entries = self.challenge_courses[name]
+        entries.append((stage_id, bonus))
+        self._stage_refs[stage_id] += 1
+        return len(entries) - 1
+
+    def remove_stage(self, name: str, idx: int) -> int:
+        """Drop one course entry; its time override goes with the stage's last use."""
+        stage_id, _ = self.challenge_courses[name].pop(idx)
+        self._release((stage_id,), drop_overrides=True)
+        return stage_id
+
+    def toggle_bonus(self, name: str, idx: int) -> CourseEntry:
+        entries = self.challenge_courses[name]
+        stage_id, bonus = entries[idx]
+        entries[idx] = (stage_id, not bonus)
+        return entries[idx]
+
+    # Story worlds
+
+    def add_world(self) -> int:
+        self.story_worlds.append([])
+        return len(self.story_worlds) - 1
+
+    def remove_world(self, idx: int) -> None:
+        self._release(self.story_worlds.pop(idx), drop_overrides=False)
+
+    def add_world_stage(self, world_idx: int, stage_id: int) -> int:
+        world = self.story_worlds[world_idx]
+        world.append(stage_id)
+        self._stage_refs[stage_id] += 1
+        return len(world) - 1
+
+    def remove_world_stage(self, world_idx: int, idx: int) -> int:
+        stage_id = self.story_worlds[world_idx].pop(idx)
+        self._release((stage_id,), drop_overrides=True)
+        return stage_id
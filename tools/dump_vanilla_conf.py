@@ -5,20 +5,35 @@ Script for generating default wsmod config from a vanilla game's files
 warning: bad
 """
 
+from array import array
 from pathlib import Path
+import bisect
+import operator
+import re
 import struct
-from collections import namedtuple
 import logging
 import sys
 import json
 from typing import Dict, List, Optional, Set, Tuple
 
+from build_cache import LayoutDatabase
+from build_profile import NULL_PROFILER, Profiler
+from rom_reader import ByteView
+from rom_schema import COURSE_COMMAND, STORY_ENTRY
+from smb2_pack_builder import RomSession
+
+try:
+    import numpy as np
+except ImportError:
+    # Optional: without numpy the table scanners fall back to pure Python.
+    np = None
+
 VANILLA_ROOT_PATH = Path(
     "/mnt/c/Users/ComplexPlane/Documents/projects/romhack/smb2imm/files"
 )
 
-CourseCommand = namedtuple("CourseCommand", ["opcode", "type", "value"])
-SmStageInfo = namedtuple("SmStageInfo", ["stage_id", "difficulty"])
+CourseCommand = COURSE_COMMAND.type
+SmStageInfo = STORY_ENTRY.type
 
 # CMD opcodes
 CMD_IF = 0
@@ -73,32 +88,18 @@ def parse_cm_course(
         raise ValueError(message)
 
     cmds: list[CourseCommand] = []
-    course_cmd_size = 0x1C
+    course_cmd_size = COURSE_COMMAND.size
 
     if count is None:
         i = 0
         while start + (i + 1) * course_cmd_size <= len(mainloop_buffer) and i < max_cmds:
-            course_cmd = CourseCommand._make(
-                struct.unpack_from(
-                    ">BBxxI20x",
-                    mainloop_buffer,
-                    start + i * course_cmd_size,
-                )
-            )
+            course_cmd = COURSE_COMMAND.unpack(mainloop_buffer, start + i * course_cmd_size)
             cmds.append(course_cmd)
             if course_cmd.opcode == CMD_COURSE_END:
                 break
             i += 1
     else:
-        for i in range(count):
-            course_cmd = CourseCommand._make(
-                struct.unpack_from(
-                    ">BBxxI20x",
-                    mainloop_buffer,
-                    start + i * course_cmd_size,
-                )
-            )
-            cmds.append(course_cmd)
+        cmds = COURSE_COMMAND.unpack_array(mainloop_buffer, start, count)
 
     # Course commands to stage infos
     cm_stage_infos = []
@@ -282,13 +283,7 @@ def dump_storymode_world_layout(
     theme_id_to_music_id_map,
     start,
 ):
-    stage_info_size = 0x4
-
-    stage_infos: list[SmStageInfo] = []
-    for i in range(10):
-        offs = start + i * stage_info_size
-        stage_info = SmStageInfo._make(struct.unpack_from(">hh", mainloop_buffer, offs))
-        stage_infos.append(stage_info)
+    stage_infos: list[SmStageInfo] = STORY_ENTRY.unpack_array(mainloop_buffer, start, 10)
 
     out_json_array = []
     for stage_info in stage_infos:
@@ -345,20 +340,6 @@ def annotate_story_layout_dump(dump: str) -> str:
     return "\n".join(out_lines)
 
 
-def list_stage_ids(stage_dir: Path) -> Set[int]:
-    ids: Set[int] = set()
-    if not stage_dir.exists():
-        return ids
-    for path in stage_dir.glob("STAGE*.lz"):
-        name = path.name
-        if len(name) == 11 and name.startswith("STAGE") and name.endswith(".lz"):
-            try:
-                ids.add(int(name[5:8]))
-            except ValueError:
-                continue
-    return ids
-
-
 def collect_stage_ids_from_cm(cm_layout: Dict[str, List[dict]]) -> List[int]:
     ids: List[int] = []
     for entries in cm_layout.values():
@@ -407,14 +388,20 @@ def validate_stage_ids(
     return ratio < 0.1
 
 
-def find_course_offsets(
-    data: bytes,
+COURSE_CMD_SIZE = COURSE_COMMAND.size
+
+# One course command record; only the opcode, type and value are inspected.
+COURSE_CMD_DTYPE = COURSE_COMMAND.dtype() if np is not None else None
+
+
+def _scan_course_candidates(
+    data: ByteView,
     stage_ids: Set[int],
     named_stage_ids: Set[int],
-    min_stages: int = 10,
-    max_cmds: int = 512,
-) -> List[Tuple[int, int]]:
-    course_cmd_size = 0x1C
+    min_stages: int,
+    max_cmds: int,
+) -> List[Tuple[int, int, float]]:
+    course_cmd_size = COURSE_CMD_SIZE
     candidates: List[Tuple[int, int, float]] = []
     for off in range(0, len(data) - course_cmd_size, 4):
         opcode = data[off]
@@ -453,7 +440,6 @@ def find_course_offsets(
                 break
         if not finished or stage_count < min_stages:
             continue
-        ratio = valid_stage_count / max(1, stage_count)
         named_count = 0
         if named_stage_ids:
             for i in range(max_cmds):
@@ -466,64 +452,212 @@ def find_course_offsets(
                     value = struct.unpack_from(">I", data, cmd_off + 4)[0]
                     if value in named_stage_ids:
                         named_count += 1
-            named_ratio = named_count / max(1, stage_count)
-        else:
-            named_ratio = 0.0
-        score = stage_count * ratio - cmd_count * 0.05 + named_ratio
-        candidates.append((off, cmd_count, score))
+        candidates.append(
+            _course_candidate(off, cmd_count, stage_count, valid_stage_count, named_count, named_stage_ids)
+        )
+    return candidates
+
+
+def _prefix_counts(mask):
+    # counts[j] - counts[i] == number of set entries in mask[i:j]
+    return np.concatenate(([0], np.cumsum(mask, dtype=np.int64)))
+
+
+def _scan_course_candidates_numpy(
+    data: ByteView,
+    stage_ids: Set[int],
+    named_stage_ids: Set[int],
+    min_stages: int,
+    max_cmds: int,
+) -> List[Tuple[int, int, float]]:
+    """Same candidates as `_scan_course_candidates`, one array pass per alignment.
+
+    Commands are 0x1C bytes and candidates sit on 4-byte boundaries, so every
+    candidate belongs to one of 7 record grids (offset % 0x1C). On each grid a
+    course starting at record k runs until the next record that is not a valid
+    IF/THEN/FLOOR command; prefix sums give its stage counts in O(1).
+    """
+    size = len(data)
+    stage_id_array = np.fromiter(stage_ids, dtype=np.int64, count=len(stage_ids))
+    named_id_array = np.fromiter(named_stage_ids, dtype=np.int64, count=len(named_stage_ids))
+    candidates: List[Tuple[int, int, float]] = []
+    for align in range(0, COURSE_CMD_SIZE, 4):
+        record_count = (size - align) // COURSE_CMD_SIZE
+        if record_count <= 0:
+            continue
+        records = np.frombuffer(data, dtype=COURSE_CMD_DTYPE, count=record_count, offset=align)
+        opcode = records["opcode"]
+        cmd_type = records["type"]
+        value = records["value"].astype(np.int64)
+
+        is_stage = (opcode == CMD_FLOOR) & (cmd_type == FLOOR_STAGE_ID)
+        is_if_then = (opcode == CMD_IF) | (opcode == CMD_THEN)
+        # IF_FLOOR_CLEAR/IF_GOAL_TYPE and THEN_JUMP_FLOOR/THEN_END_COURSE share values 0 and 2.
+        keeps_going = (
+            is_stage
+            | ((opcode == CMD_FLOOR) & (cmd_type == FLOOR_TIME))
+            | (is_if_then & ((cmd_type == IF_FLOOR_CLEAR) | (cmd_type == IF_GOAL_TYPE)))
+        )
+
+        offsets = align + np.arange(record_count, dtype=np.int64) * COURSE_CMD_SIZE
+        starts = np.flatnonzero(is_stage & (offsets < size - COURSE_CMD_SIZE))
+        if not starts.size:
+            continue
+        stops = np.flatnonzero(~keeps_going)
+        stop_pos = np.searchsorted(stops, starts)
+        ends = np.append(stops, record_count)[stop_pos]
+        finished = (ends < record_count) & (ends - starts < max_cmds)
+        finished &= opcode[np.minimum(ends, record_count - 1)] == CMD_COURSE_END
+        stage_prefix = _prefix_counts(is_stage)
+        stage_counts = stage_prefix[ends] - stage_prefix[starts]
+        keep = finished & (stage_counts >= min_stages)
+        if not keep.any():
+            continue
+        starts = starts[keep]
+        ends = ends[keep]
+        stage_counts = stage_counts[keep]
+        valid_prefix = _prefix_counts(is_stage & np.isin(value, stage_id_array))
+        valid_counts = valid_prefix[ends] - valid_prefix[starts]
+        # Named stages are counted over the full max_cmds window, not just the course.
+        named_prefix = _prefix_counts(is_stage & np.isin(value, named_id_array))
+        named_counts = named_prefix[np.minimum(starts + max_cmds, record_count)] - named_prefix[starts]
+        for start, end, stage_count, valid_count, named_count in zip(
+            starts.tolist(), ends.tolist(), stage_counts.tolist(), valid_counts.tolist(), named_counts.tolist()
+        ):
+            candidates.append(
+                _course_candidate(
+                    align + start * COURSE_CMD_SIZE,
+                    end - start + 1,
+                    stage_count,
+                    valid_count,
+                    named_count,
+                    named_stage_ids,
+                )
+            )
+    return candidates
+
+
+def _course_candidate(
+    off: int,
+    cmd_count: int,
+    stage_count: int,
+    valid_stage_count: int,
+    named_count: int,
+    named_stage_ids: Set[int],
+) -> Tuple[int, int, float]:
+    ratio = valid_stage_count / max(1, stage_count)
+    named_ratio = named_count / max(1, stage_count) if named_stage_ids else 0.0
+    score = stage_count * ratio - cmd_count * 0.05 + named_ratio
+    return (off, cmd_count, score)
+
+
+def find_course_offsets(
+    data: ByteView,
+    stage_ids: Set[int],
+    named_stage_ids: Set[int],
+    min_stages: int = 10,
+    max_cmds: int = 512,
+) -> List[Tuple[int, int]]:
+    scan = _scan_course_candidates_numpy if np is not None else _scan_course_candidates
+    candidates = scan(data, stage_ids, named_stage_ids, min_stages, max_cmds)
 
     candidates.sort(key=lambda item: (-item[2], item[0]))
     selected: List[Tuple[int, int]] = []
-    used_ranges: List[Tuple[int, int]] = []
+    # Selected ranges never overlap, so sorted by start they are sorted by end
+    # too and only the neighbours of a new range can intersect it.
+    used_starts: List[int] = []
+    used_ends: List[int] = []
     for off, cmd_count, _ in candidates:
         start = off
-        end = off + cmd_count * course_cmd_size
-        if any(start < rng_end and end > rng_start for rng_start, rng_end in used_ranges):
+        end = off + cmd_count * COURSE_CMD_SIZE
+        idx = bisect.bisect_right(used_starts, start)
+        if idx > 0 and used_ends[idx - 1] > start:
+            continue
+        if idx < len(used_starts) and used_starts[idx] < end:
             continue
         selected.append((off, cmd_count))
-        used_ranges.append((start, end))
+        used_starts.insert(idx, start)
+        used_ends.insert(idx, end)
         if len(selected) >= 8:
             break
     selected.sort(key=lambda item: item[0])
     return selected
 
 
-def find_story_block_offset(
-    data: bytes,
+STORY_ENTRY_SIZE = STORY_ENTRY.size
+STORY_BLOCK_ENTRIES = 10 * 10
+_STORY_VALID_RUN = re.compile(rb"\x01{%d,}" % STORY_BLOCK_ENTRIES)
+
+
+def find_story_block_offsets(
+    data: ByteView,
     stage_ids: Set[int],
     named_stage_ids: Set[int],
-) -> Optional[int]:
-    entry_size = 4
-    world_count = 10
-    stages_per_world = 10
-    block_size = world_count * stages_per_world * entry_size
-    for off in range(0, len(data) - block_size, 4):
-        valid = True
-        unique_ids: Set[int] = set()
+    first_only: bool = False,
+) -> List[int]:
+    """Every offset of a plausible 10x10 story block, in file order.
+
+    Entries are decoded once and marked valid/invalid; only runs of at least
+    100 valid entries are walked, with the unique and named stage counts
+    updated as each entry enters and leaves the window.
+    """
+    entry_count = len(data) // STORY_ENTRY_SIZE
+    halfwords = array("h")
+    halfwords.frombytes(memoryview(data)[: entry_count * STORY_ENTRY_SIZE])
+    if sys.byteorder == "little":
+        halfwords.byteswap()
+    entry_ids = halfwords[0::2]
+    valid = bytes(
+        map(
+            operator.and_,
+            map(stage_ids.__contains__, entry_ids),
+            map(range(6).__contains__, halfwords[1::2]),
+        )
+    )
+
+    last_off = len(data) - STORY_BLOCK_ENTRIES * STORY_ENTRY_SIZE
+    offsets: List[int] = []
+    for run in _STORY_VALID_RUN.finditer(valid):
+        id_counts: Dict[int, int] = {}
         named_count = 0
-        for idx in range(world_count * stages_per_world):
-            entry_off = off + idx * entry_size
-            stage_id, difficulty = struct.unpack_from(">hh", data, entry_off)
-            if stage_id not in stage_ids:
-                valid = False
-                break
-            if difficulty < 0 or difficulty > 5:
-                valid = False
-                break
-            unique_ids.add(stage_id)
+        for idx in range(run.start(), run.end()):
+            stage_id = entry_ids[idx]
+            id_counts[stage_id] = id_counts.get(stage_id, 0) + 1
             if stage_id in named_stage_ids:
                 named_count += 1
-        if valid:
-            if len(unique_ids) < 20:
+            first = idx - STORY_BLOCK_ENTRIES + 1
+            if first < run.start():
+                continue
+            if first > run.start():
+                old_id = entry_ids[first - 1]
+                id_counts[old_id] -= 1
+                if not id_counts[old_id]:
+                    del id_counts[old_id]
+                if old_id in named_stage_ids:
+                    named_count -= 1
+            if first * STORY_ENTRY_SIZE >= last_off:
+                return offsets
+            if len(id_counts) < 20:
                 continue
-            if named_stage_ids and named_count / max(1, world_count * stages_per_world) < 0.3:
+            if named_stage_ids and named_count / STORY_BLOCK_ENTRIES < 0.3:
                 continue
-            return off
-    return None
+            offsets.append(first * STORY_ENTRY_SIZE)
+            if first_only:
+                return offsets
+    return offsets
+
+
+def find_story_block_offset(
+    data: ByteView,
+    stage_ids: Set[int],
+    named_stage_ids: Set[int],
+) -> Optional[int]:
+    offsets = find_story_block_offsets(data, stage_ids, named_stage_ids, first_only=True)
+    return offsets[0] if offsets else None
 
 
 def is_story_world_valid(
-    data: bytes,
+    data: ByteView,
     offset: int,
     stage_ids: Set[int],
     named_stage_ids: Set[int],
@@ -531,7 +665,7 @@ def is_story_world_valid(
     unique_ids: Set[int] = set()
     named_count = 0
     for idx in range(10):
-        stage_id, difficulty = struct.unpack_from(">hh", data, offset + idx * 4)
+        stage_id, difficulty = STORY_ENTRY.struct.unpack_from(data, offset + idx * STORY_ENTRY.size)
         if stage_id not in stage_ids:
             return False
         if difficulty < 0 or difficulty > 5:
@@ -551,6 +685,8 @@ def load_vanilla_course_data(
     *,
     course_cmd_counts: Optional[Dict[str, int]] = None,
     world_offsets: Optional[List[int]] = None,
+    session: Optional[RomSession] = None,
+    profiler: Profiler = NULL_PROFILER,
 ) -> dict:
     mainloop_path = rom_dir / "mkb2.main_loop.rel"
     stgname_path = rom_dir / "stgname" / "usa.str"
@@ -559,17 +695,29 @@ def load_vanilla_course_data(
     if not stgname_path.exists():
         raise FileNotFoundError(f"missing {stgname_path}")
 
-    mainloop_buffer = mainloop_path.read_bytes()
-    stgname_lines = stgname_path.read_text(encoding="ascii", errors="ignore").splitlines()
-    named_stage_ids = {i for i, name in enumerate(stgname_lines) if name and name != "-"}
+    if session is not None:
+        return session.course_data(course_cmd_counts, world_offsets, profiler)
+    with RomSession(rom_dir) as session:
+        return session.course_data(course_cmd_counts, world_offsets, profiler)
+
 
-    bonus_stage_ids = struct.unpack_from(">9i", mainloop_buffer, 0x00176118)
-    stage_id_to_theme_id_map = struct.unpack_from(">428B", mainloop_buffer, 0x00204E48)
-    theme_id_to_music_id_map = struct.unpack_from(">43h", mainloop_buffer, 0x0016E738)
+def parse_vanilla_course_data(
+    session: RomSession,
+    *,
+    course_cmd_counts: Optional[Dict[str, int]] = None,
+    world_offsets: Optional[List[int]] = None,
+    profiler: Profiler = NULL_PROFILER,
+) -> dict:
+    mainloop_buffer = session.rel_data
+    stgname_lines = session.stage_name_lines
+    stage_ids = session.stage_id_set
+    named_stage_ids = {i for i, name in enumerate(stgname_lines) if name and name != "-"}
 
-    stage_ids = list_stage_ids(rom_dir / "stage")
+    bonus_stage_ids = session.bonus_stage_ids
+    stage_id_to_theme_id_map = session.stage_world_themes_full
+    theme_id_to_music_id_map = session.theme_music_ids
 
-    # Parse challenge mode entries using default offsets first.
+    # Parse challenge mode entries using recorded or default offsets first.
     counts = course_cmd_counts or {}
     default_course_offsets = [
         ("beginner", 0x002075B0),
@@ -581,22 +729,28 @@ def load_vanilla_course_data(
         ("master", 0x0020A8E0),
         ("master_extra", 0x0020ACB4),
     ]
+    known_courses = session.layout.get("courses") if course_cmd_counts is None else None
+    if known_courses:
+        course_table = [list(entry) for entry in known_courses]
+    else:
+        course_table = [[name, offset, counts.get(name)] for name, offset in default_course_offsets]
     cm_layout: Dict[str, List[dict]] = {}
-    for name, offset in default_course_offsets:
-        try:
-            cm_layout[name] = parse_cm_course(
-                mainloop_buffer,
-                stgname_lines,
-                bonus_stage_ids,
-                stage_id_to_theme_id_map,
-                theme_id_to_music_id_map,
-                offset,
-                counts.get(name),
-                strict=True,
-            )
-        except Exception:
-            cm_layout = {}
-            break
+    with profiler.span("challenge_tables"):
+        for name, offset, cmd_count in course_table:
+            try:
+                cm_layout[name] = parse_cm_course(
+                    mainloop_buffer,
+                    stgname_lines,
+                    bonus_stage_ids,
+                    stage_id_to_theme_id_map,
+                    theme_id_to_music_id_map,
+                    offset,
+                    cmd_count,
+                    strict=not known_courses,
+                )
+            except (Exception, SystemExit):
+                cm_layout = {}
+                break
 
     if cm_layout:
         cm_ids = collect_stage_ids_from_cm(cm_layout)
@@ -605,8 +759,10 @@ def load_vanilla_course_data(
 
     if not cm_layout and stage_ids:
         logging.warning("Default course offsets invalid; scanning for course tables.")
-        offsets = find_course_offsets(mainloop_buffer, stage_ids, named_stage_ids)
+        with profiler.span("challenge_scan"):
+            offsets = find_course_offsets(mainloop_buffer, stage_ids, named_stage_ids)
         order = [name for name, _ in default_course_offsets]
+        course_table = []
         for idx, (offset, cmd_count) in enumerate(offsets[: len(order)]):
             name = order[idx]
             try:
@@ -623,12 +779,17 @@ def load_vanilla_course_data(
             except Exception:
                 cm_layout = {}
                 break
+            course_table.append([name, offset, cmd_count])
 
     if not cm_layout:
         raise SystemExit("Failed to locate challenge course tables.")
+    if course_cmd_counts is None and course_table != known_courses:
+        session.record_layout(courses=course_table)
 
+    record_story = world_offsets is None
+    known_story = session.layout.get("story") if record_story else None
     if world_offsets is None:
-        world_offsets = [
+        world_offsets = known_story or [
             0x0020b448,
             0x0020b470,
             0x0020b498,
@@ -641,18 +802,19 @@ def load_vanilla_course_data(
             0x0020b5b0,
         ]
     worlds = []
-    for offs in world_offsets:
-        if stage_ids and not is_story_world_valid(mainloop_buffer, offs, stage_ids, named_stage_ids):
-            worlds = []
-            break
-        world = dump_storymode_world_layout(
-            mainloop_buffer,
-            stgname_lines,
-            stage_id_to_theme_id_map,
-            theme_id_to_music_id_map,
-            offs,
-        )
-        worlds.append(world)
+    with profiler.span("story_tables"):
+        for offs in world_offsets:
+            if stage_ids and not is_story_world_valid(mainloop_buffer, offs, stage_ids, named_stage_ids):
+                worlds = []
+                break
+            world = dump_storymode_world_layout(
+                mainloop_buffer,
+                stgname_lines,
+                stage_id_to_theme_id_map,
+                theme_id_to_music_id_map,
+                offs,
+            )
+            worlds.append(world)
 
     if worlds:
         story_ids = collect_stage_ids_from_story(worlds)
@@ -667,7 +829,8 @@ def load_vanilla_course_data(
 
     if not worlds and stage_ids:
         logging.warning("Default story offsets invalid; scanning for story table.")
-        base_off = find_story_block_offset(mainloop_buffer, stage_ids, named_stage_ids)
+        with profiler.span("story_scan"):
+            base_off = find_story_block_offset(mainloop_buffer, stage_ids, named_stage_ids)
         if base_off is not None:
             world_offsets = [base_off + i * 0x28 for i in range(10)]
             for offs in world_offsets:
@@ -680,6 +843,9 @@ def load_vanilla_course_data(
                 )
                 worlds.append(world)
 
+    if worlds and record_story and list(world_offsets) != known_story:
+        session.record_layout(story=list(world_offsets))
+
     if not worlds:
         logging.warning("Story world data not found; output will omit story worlds.")
 
@@ -701,16 +867,43 @@ def main() -> None:
         default=VANILLA_ROOT_PATH,
         help="Path to extracted ROM folder (containing mkb2.main_loop.rel)",
     )
+    parser.add_argument(
+        "--no-layout-db",
+        action="store_true",
+        help="Do not read or record table offsets in the layout database",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        type=Path,
+        const=Path("dump_vanilla_conf.trace.json"),
+        metavar="TRACE_JSON",
+        help="Print per-phase timings to stderr and write a Chrome trace "
+        "(default: dump_vanilla_conf.trace.json)",
+    )
     args = parser.parse_args()
 
-    data = load_vanilla_course_data(args.rom)
-    cm_layout_dump = json.dumps(data["challenge"], indent=4)
-    annotated_cm_layout_dump = annotate_cm_layout_dump(cm_layout_dump)
-    print(annotated_cm_layout_dump)
-
-    story_layout_dump = json.dumps(data["story"], indent=4)
-    annotated_story_layout_dump = annotate_story_layout_dump(story_layout_dump)
-    # print(annotated_story_layout_dump)
+    profiler = Profiler() if args.profile else NULL_PROFILER
+    layouts = None if args.no_layout_db else LayoutDatabase()
+    with RomSession(args.rom, layouts) as session:
+        with profiler.span("open_rom"):
+            profiler.count("rel_bytes_read", len(session.rel_data))
+        with profiler.span("course_data"):
+            data = load_vanilla_course_data(args.rom, session=session, profiler=profiler)
+    with profiler.span("dump"):
+        cm_layout_dump = json.dumps(data["challenge"], indent=4)
+        annotated_cm_layout_dump = annotate_cm_layout_dump(cm_layout_dump)
+        print(annotated_cm_layout_dump)
+
+        story_layout_dump = json.dumps(data["story"], indent=4)
+        annotated_story_layout_dump = annotate_story_layout_dump(story_layout_dump)
+        # print(annotated_story_layout_dump)
+
+    if args.profile:
+        profiler.close()
+        profiler.print_summary(sys.stderr)
+        profiler.write_trace(args.profile)
+        print(f"Trace written to {args.profile}", file=sys.stderr)
 
 
 if __name__ == "__main__":
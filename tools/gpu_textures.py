@@ -0,0 +1,361 @@
+"""GPU-ready texture sidecars for pack TPLs (`--gpu-textures`).
+
+The client decodes every TPL texture to RGBA8 on the CPU before uploading
+it. The builder does that work once instead and stores each texture in the
+smallest format that keeps every texel the client would decode:
+
+    CMPR                         BC1: the same DXT1 blocks in standard order
+                                 and byte order (eighth of RGBA8 on the GPU)
+    RGB565                       RGB565
+    RGB5A3, all opaque           RGBA5551
+    RGB5A3, alpha all 0 or max   RGBA4444
+    RGBA8, alpha all 255         RGB8
+    I8                           L8
+    IA8                          LA8 (L8 when alpha is all 255)
+
+No sidecar level is larger than the TPL level it replaces. I4 and IA4 stay
+in the TPL: at 4 bits per channel they would double in L8 and LA8, costing
+more download and GPU memory than the tile decode they save.
+
+Everything except BC1 is stored untiled and row-major, so the client skips
+the per-texel tile decode. RGB565, RGBA5551 and RGB8 upload as-is; the client
+widens L8, LA8 and RGBA4444 to RGB8/RGBA8 with a plain copy loop, since its
+GPU layer has no luminance or 4444 formats. RGB5A3 with partial alpha and
+RGBA8 with alpha have no smaller lossless format and stay in the TPL.
+
+For `foo.tpl` the sidecar is `foo.gtx`, little-endian:
+
+    header   magic 'GTEX', version, TPL entry count, reserved (16 bytes)
+    entries  per TPL entry: u16 format, u16 mip count, u16 width,
+             u16 height, u32 data offset, u32 data size (16 bytes)
+    data     each entry's mip levels back to back, largest first; entries
+             start 4-byte aligned, 16-bit texels are little-endian
+
+Format 0 means "not converted, decode the TPL entry"; the TPL stays in the
+pack, so clients without a format (or without sidecar support) are
+unaffected.
+"""
+
+from __future__ import annotations
+
+import struct
+from dataclasses import dataclass
+from operator import or_
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from rom_reader import ByteView, RomFile
+from rom_schema import TPL_TEXTURE
+
+try:
+    import numpy as np
+except ImportError:
+    # Optional: without numpy the block re-ordering runs in pure Python.
+    np = None
+
+GTX_MAGIC = b'GTEX'
+GTX_VERSION = 1
+GTX_HEADER = struct.Struct('<4sIII')
+GTX_ENTRY = struct.Struct('<HHHHII')
+# Bump when the sidecar made from the same TPL changes, so build caches rewrite it.
+GTX_ENCODER_VERSION = 3
+
+GPU_FORMAT_NONE = 0
+GPU_FORMAT_BC1 = 1
+GPU_FORMAT_RGB565 = 2
+GPU_FORMAT_RGBA5551 = 3
+GPU_FORMAT_RGBA4444 = 4
+GPU_FORMAT_L8 = 5
+GPU_FORMAT_LA8 = 6
+GPU_FORMAT_RGB8 = 7
+
+TPL_MAGIC = 0x1234
+GX_TF_I4 = 0x00
+GX_TF_I8 = 0x01
+GX_TF_IA4 = 0x02
+GX_TF_IA8 = 0x03
+GX_TF_RGB565 = 0x04
+GX_TF_RGB5A3 = 0x05
+GX_TF_RGBA8 = 0x06
+GX_TF_CMPR = 0x0E
+
+# GX tile (block width, block height, bits per texel) per TPL format.
+_TILE_GEOMETRY = {
+    GX_TF_I4: (8, 8, 4),
+    GX_TF_I8: (8, 4, 8),
+    GX_TF_IA4: (8, 4, 8),
+    GX_TF_IA8: (4, 4, 16),
+    GX_TF_RGB565: (4, 4, 16),
+    GX_TF_RGB5A3: (4, 4, 16),
+    GX_TF_RGBA8: (4, 4, 32),
+    GX_TF_CMPR: (8, 8, 4),
+}
+
+# DXT1 index bytes hold the first texel of a row in bits 0-1; CMPR in bits 6-7.
+_BC1_INDEX_BYTES = bytes(
+    ((b >> 6) & 3) | ((b >> 2) & 0x0c) | ((b << 2) & 0x30) | ((b << 6) & 0xc0)
+    for b in range(256)
+)
+
+
+def _byte_table(fn) -> bytes:
+    return bytes(fn(b) & 0xff for b in range(256))
+
+
+_LOW_SHL4 = _byte_table(lambda b: b << 4)
+_SHR4 = _byte_table(lambda b: b >> 4)
+_SHL1 = _byte_table(lambda b: b << 1)
+_SHL1_OR1 = _byte_table(lambda b: (b << 1) | 1)
+_SHR7 = _byte_table(lambda b: b >> 7)
+_RGB5A3_ALPHA = _byte_table(lambda b: (b >> 4) & 7)
+_RGB5A3_ALPHA4 = _byte_table(lambda b: 0x0f if (b >> 4) & 7 == 7 else 0)
+
+
+@dataclass
+class TplTexture:
+    format: int
+    offset: int
+    width: int
+    height: int
+    mip_count: int
+
+
+def sidecar_arcname(tpl_arcname: str) -> str:
+    return tpl_arcname[:-len('.tpl')] + '.gtx'
+
+
+def parse_tpl(data: ByteView) -> Optional[List[Optional[TplTexture]]]:
+    """The entries of an AV TPL (None for empty slots), or None if `data` is not one."""
+    if len(data) < 4:
+        return None
+    count = struct.unpack_from('>I', data, 0)[0]
+    if count == 0 or 4 + count * TPL_TEXTURE.size > len(data):
+        return None
+    textures: List[Optional[TplTexture]] = []
+    for header in TPL_TEXTURE.unpack_array(data, 4, count):
+        if header.magic != TPL_MAGIC:
+            return None
+        if header.width == 0 and header.height == 0 and header.mip_count == 0:
+            textures.append(None)
+            continue
+        textures.append(TplTexture(header.format, header.offset, header.width, header.height, header.mip_count))
+    return textures
+
+
+def tpl_has_gpu_textures(path: Path) -> bool:
+    """True if `path` is a TPL with a texture format the sidecar can hold; reads only its header table."""
+    with RomFile(path) as rom:
+        textures = parse_tpl(rom.view)
+    return bool(textures) and any(tex and tex.format in _TILE_GEOMETRY for tex in textures)
+
+
+def _halvable(size: int, levels: int) -> bool:
+    # The client halves width and height per level without rounding.
+    return size > 0 and size % (1 << (levels - 1)) == 0
+
+
+def _cmpr_level_to_bc1_numpy(data: ByteView, offset: int, width: int, height: int) -> bytes:
+    tiles_x, tiles_y = (width + 7) // 8, (height + 7) // 8
+    tiles = np.frombuffer(data, np.uint8, tiles_x * tiles_y * 32, offset).reshape(tiles_y, tiles_x, 2, 2, 8)
+    blocks = tiles.transpose(0, 2, 1, 3, 4).reshape(tiles_y * 2, tiles_x * 2, 8)
+    blocks = blocks[:(height + 3) // 4, :(width + 3) // 4]
+    out = np.empty(blocks.shape, np.uint8)
+    out[..., 0:4:2] = blocks[..., 1:4:2]
+    out[..., 1:4:2] = blocks[..., 0:4:2]
+    out[..., 4:] = np.frombuffer(_BC1_INDEX_BYTES, np.uint8)[blocks[..., 4:]]
+    return out.tobytes()
+
+
+def _cmpr_level_to_bc1_python(data: ByteView, offset: int, width: int, height: int) -> bytes:
+    blocks_x, blocks_y = (width + 3) // 4, (height + 3) // 4
+    tiles_x = (width + 7) // 8
+    row_bytes = blocks_x * 8
+    # The two blocks side by side in a tile row are already adjacent in CMPR.
+    parts = []
+    for by in range(blocks_y):
+        row = offset + (by >> 1) * tiles_x * 32 + (by & 1) * 16
+        parts.extend(bytes(data[row + tx * 32:row + tx * 32 + 16]) for tx in range(tiles_x))
+    blocks = b''.join(parts) if blocks_x & 1 == 0 else b''.join(
+        b''.join(parts[by * tiles_x:(by + 1) * tiles_x])[:row_bytes] for by in range(blocks_y)
+    )
+    out = bytearray(len(blocks))
+    out[0::8] = blocks[1::8]
+    out[1::8] = blocks[0::8]
+    out[2::8] = blocks[3::8]
+    out[3::8] = blocks[2::8]
+    for k in range(4, 8):
+        out[k::8] = blocks[k::8].translate(_BC1_INDEX_BYTES)
+    return bytes(out)
+
+
+def cmpr_level_to_bc1(data: ByteView, offset: int, width: int, height: int) -> bytes:
+    """One CMPR mip level at `offset` as BC1 blocks in row-major order."""
+    if np is not None:
+        return _cmpr_level_to_bc1_numpy(data, offset, width, height)
+    return _cmpr_level_to_bc1_python(data, offset, width, height)
+
+
+def _untile_numpy(data: ByteView, offset: int, width: int, height: int, gx_format: int) -> bytes:
+    block_w, block_h, bits = _TILE_GEOMETRY[gx_format]
+    tiles_x, tiles_y = (width + block_w - 1) // block_w, (height + block_h - 1) // block_h
+    tiles = np.frombuffer(data, np.uint8, tiles_x * tiles_y * block_w * block_h * bits // 8, offset)
+    if gx_format == GX_TF_RGBA8:
+        # Each 4x4 tile is 16 AR pairs, then 16 GB pairs.
+        texels = tiles.reshape(tiles_y, tiles_x, 2, 4, 4, 2).transpose(0, 3, 1, 4, 2, 5)
+        texels = texels.reshape(tiles_y * 4, tiles_x * 4, 4)
+    else:
+        row_bytes = block_w * bits // 8
+        rows = tiles.reshape(tiles_y, tiles_x, block_h, row_bytes).transpose(0, 2, 1, 3)
+        rows = rows.reshape(tiles_y * block_h, tiles_x * row_bytes)
+        texels = rows.reshape(rows.shape[0], -1, bits // 8)
+    return np.ascontiguousarray(texels[:height, :width]).tobytes()
+
+
+def _untile_python(data: ByteView, offset: int, width: int, height: int, gx_format: int) -> bytes:
+    block_w, block_h, bits = _TILE_GEOMETRY[gx_format]
+    tiles_x = (width + block_w - 1) // block_w
+    tile_bytes = block_w * block_h * bits // 8
+    row_bytes = block_w * bits // 8
+    unit = bits // 8
+    rows = []
+    for y in range(height):
+        base = offset + (y // block_h) * tiles_x * tile_bytes
+        if gx_format == GX_TF_RGBA8:
+            line = base + (y % 4) * 8
+            ar = b''.join(data[line + tx * 64:line + tx * 64 + 8] for tx in range(tiles_x))
+            gb = b''.join(data[line + tx * 64 + 32:line + tx * 64 + 40] for tx in range(tiles_x))
+            row = bytearray(len(ar) * 2)
+            row[0::4], row[1::4], row[2::4], row[3::4] = ar[0::2], ar[1::2], gb[0::2], gb[1::2]
+            rows.append(bytes(row[:width * 4]))
+            continue
+        line = base + (y % block_h) * row_bytes
+        row = b''.join(data[line + tx * tile_bytes:line + tx * tile_bytes + row_bytes] for tx in range(tiles_x))
+        rows.append(bytes(row[:width * unit]))
+    return b''.join(rows)
+
+
+def untile_level(data: ByteView, offset: int, width: int, height: int, gx_format: int) -> bytes:
+    """One non-CMPR mip level at `offset` as row-major texels, cropped to `width` x `height`.
+
+    Texels keep their TPL byte order (RGBA8 comes out as ARGB). Not for I4 or
+    CMPR, whose texels are smaller than a byte.
+    """
+    if np is not None:
+        return _untile_numpy(data, offset, width, height, gx_format)
+    return _untile_python(data, offset, width, height, gx_format)
+
+
+def _pick_format(gx_format: int, texels: bytes) -> int:
+    """The smallest lossless GPU format for a texture whose levels untile to `texels`."""
+    if gx_format == GX_TF_I8:
+        return GPU_FORMAT_L8
+    if gx_format == GX_TF_IA8:
+        return GPU_FORMAT_L8 if min(texels[1::2]) == 0xff else GPU_FORMAT_LA8
+    if gx_format == GX_TF_RGB565:
+        return GPU_FORMAT_RGB565
+    if gx_format == GX_TF_RGB5A3:
+        high = texels[0::2]
+        if min(high) >= 0x80:
+            return GPU_FORMAT_RGBA5551
+        # 3-bit alpha only survives 4 bits at its ends (0 and 255).
+        if max(high) < 0x80 and set(high.translate(_RGB5A3_ALPHA)) <= {0, 7}:
+            return GPU_FORMAT_RGBA4444
+        return GPU_FORMAT_NONE
+    if gx_format == GX_TF_RGBA8:
+        return GPU_FORMAT_RGB8 if min(texels[0::4]) == 0xff else GPU_FORMAT_NONE
+    return GPU_FORMAT_NONE
+
+
+def _convert_level(gx_format: int, gpu_format: int, texels: bytes) -> bytes:
+    if gpu_format == GPU_FORMAT_L8:
+        return texels[0::2] if gx_format == GX_TF_IA8 else texels
+    if gpu_format == GPU_FORMAT_LA8:
+        return texels
+    if gpu_format == GPU_FORMAT_RGB8:
+        out = bytearray(len(texels) // 4 * 3)
+        out[0::3], out[1::3], out[2::3] = texels[1::4], texels[2::4], texels[3::4]
+        return bytes(out)
+    out = bytearray(len(texels))
+    high, low = texels[0::2], texels[1::2]
+    if gpu_format == GPU_FORMAT_RGB565:
+        # GX and GL share the 5:6:5 bit layout; only the byte order differs.
+        out[0::2], out[1::2] = low, high
+    elif gpu_format == GPU_FORMAT_RGBA5551:
+        # 1rrrrrgggggbbbbb -> rrrrrgggggbbbbb1
+        out[0::2] = low.translate(_SHL1_OR1)
+        out[1::2] = bytes(map(or_, high.translate(_SHL1), low.translate(_SHR7)))
+    elif gpu_format == GPU_FORMAT_RGBA4444:
+        # 0aaarrrrggggbbbb -> rrrrggggbbbbaaaa
+        out[0::2] = bytes(map(or_, low.translate(_LOW_SHL4), high.translate(_RGB5A3_ALPHA4)))
+        out[1::2] = bytes(map(or_, high.translate(_LOW_SHL4), low.translate(_SHR4)))
+    return bytes(out)
+
+
+def gx_level_size(gx_format: int, width: int, height: int) -> int:
+    """Bytes of one tiled mip level, as the client's `calcTextureSize` computes it."""
+    block_w, block_h, bits = _TILE_GEOMETRY[gx_format]
+    return ((width + block_w - 1) // block_w) * ((height + block_h - 1) // block_h) * block_w * block_h * bits // 8
+
+
+def mip_chain(tex: TplTexture, data_size: int) -> List[Tuple[int, int, int]]:
+    """(offset, width, height) of the levels the client loads for `tex`; empty if it is not convertible."""
+    if tex.format not in _TILE_GEOMETRY or tex.mip_count == 0:
+        return []
+    if not (_halvable(tex.width, tex.mip_count) and _halvable(tex.height, tex.mip_count)):
+        return []
+    chain: List[Tuple[int, int, int]] = []
+    offset = tex.offset
+    width, height = tex.width, tex.height
+    for _ in range(tex.mip_count):
+        size = gx_level_size(tex.format, width, height)
+        if offset + size > data_size:
+            # The client drops a truncated level and everything after it.
+            break
+        chain.append((offset, width, height))
+        offset += size
+        width //= 2
+        height //= 2
+    return chain
+
+
+def _transcode_texture(data: ByteView, tex: TplTexture) -> Optional[Tuple[int, List[bytes]]]:
+    chain = mip_chain(tex, len(data))
+    if not chain:
+        return None
+    if tex.format == GX_TF_CMPR:
+        return GPU_FORMAT_BC1, [cmpr_level_to_bc1(data, *level) for level in chain]
+    if tex.format in (GX_TF_I4, GX_TF_IA4):
+        # L8 and LA8 would double these; see the module docstring.
+        return None
+    texels = [untile_level(data, *level, tex.format) for level in chain]
+    gpu_format = _pick_format(tex.format, b''.join(texels))
+    if gpu_format == GPU_FORMAT_NONE:
+        return None
+    return gpu_format, [_convert_level(tex.format, gpu_format, level) for level in texels]
+
+
+def transcode_tpl(data: ByteView) -> bytes:
+    """The .gtx sidecar for TPL `data`; entries that cannot be converted get format 0."""
+    textures = parse_tpl(data) or []
+    data_off = GTX_HEADER.size + len(textures) * GTX_ENTRY.size
+    table = bytearray()
+    body = bytearray()
+    for tex in textures:
+        converted = _transcode_texture(data, tex) if tex else None
+        if converted is None:
+            table += GTX_ENTRY.pack(GPU_FORMAT_NONE, 0, 0, 0, 0, 0)
+            continue
+        gpu_format, levels = converted
+        # 16-bit levels are read through a Uint16Array, which needs an even offset.
+        body += bytes(-len(body) % 4)
+        start = len(body)
+        for level in levels:
+            body += level
+        table += GTX_ENTRY.pack(gpu_format, len(levels), tex.width, tex.height, data_off + start, len(body) - start)
+    header = GTX_HEADER.pack(GTX_MAGIC, GTX_VERSION, len(textures), 0)
+    return b''.join((header, table, body))
+
+
+def transcode_tpl_file(src: Path) -> bytes:
+    with RomFile(src) as rom:
+        return transcode_tpl(rom.view)
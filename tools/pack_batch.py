@@ -0,0 +1,280 @@
+"""Build many SMB2 packs in one run (`smb2_pack_builder.py --batch SPEC`).
+
+A spec file lists packs in JSON or TOML (TOML needs Python 3.11+):
+
+    {
+      "defaults": {"rom": "roms/us", "zip": true},
+      "packs": [
+        {"id": "beginner", "name": "Beginner", "out": "out/beginner", "courses": "beginner.json"},
+        {"id": "cm", "name": "CM Mod", "out": "out/cm", "cmmod": "cmmod.txt", "zip_only": true}
+      ]
+    }
+
+A bare list of packs is accepted too. Keys per pack: `rom`, `out`, `id`,
+`name`, `courses` or `cmmod`, `lst`, `zip`, `zip_only`, `zip_level`,
+`zip_threads`, `copy_mode`, `stage_encoding`, `gpu_textures`,
+`texture_tiers`; relative paths resolve against the spec file.
+
+Packs built from the same ROM folder share one `RomSession`, so the REL, its
+tables and the stage list are parsed once, and every stage any of them needs
+is decoded once, up front, on a single process pool shared by the whole
+batch. A pack that fails is reported and the batch moves on.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+import time
+import traceback
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from build_cache import DEFAULT_MAX_BYTES, BuildCache, LayoutDatabase, default_cache_dir
+from build_profile import NULL_PROFILER, Profiler
+from pack_zip import ZIP_DEFAULT_LEVEL
+from smb2_pack_builder import (
+    COPY_MODES,
+    STAGE_ENCODINGS,
+    RomSession,
+    build_pack,
+    extract_stage_fogs,
+    make_courses_data,
+    parse_cmmod_config,
+    select_stage_ids,
+    stage_pool,
+)
+
+try:
+    import tomllib
+except ImportError:
+    tomllib = None
+
+SPEC_KEYS = frozenset({
+    'rom', 'out', 'id', 'name', 'courses', 'cmmod', 'lst',
+    'zip', 'zip_only', 'zip_level', 'zip_threads', 'copy_mode', 'stage_encoding', 'gpu_textures',
+    'texture_tiers',
+})
+
+
+@dataclass
+class PackSpec:
+    rom: Path
+    out: Path
+    pack_id: str
+    pack_name: str
+    courses: Optional[Path] = None
+    cmmod: Optional[Path] = None
+    lst: Optional[Path] = None
+    zip_output: bool = False
+    zip_only: bool = False
+    zip_level: int = ZIP_DEFAULT_LEVEL
+    zip_threads: int = 1
+    copy_mode: str = 'auto'
+    stage_encoding: str = 'lzss'
+    gpu_textures: bool = False
+    texture_tiers: bool = False
+
+    @classmethod
+    def from_entry(cls, entry: Dict[str, object], base_dir: Path) -> 'PackSpec':
+        unknown = sorted(set(entry) - SPEC_KEYS)
+        if unknown:
+            raise ValueError(f'unknown keys: {", ".join(unknown)}')
+        for key in ('rom', 'out', 'id', 'name'):
+            if not entry.get(key):
+                raise ValueError(f'missing "{key}"')
+        if entry.get('courses') and entry.get('cmmod'):
+            raise ValueError('"courses" and "cmmod" are mutually exclusive')
+        copy_mode = entry.get('copy_mode', 'auto')
+        if copy_mode not in COPY_MODES:
+            raise ValueError(f'copy_mode must be one of {", ".join(COPY_MODES)}')
+        stage_encoding = entry.get('stage_encoding', 'lzss')
+        if stage_encoding not in STAGE_ENCODINGS:
+            raise ValueError(f'stage_encoding must be one of {", ".join(STAGE_ENCODINGS)}')
+        zip_level = int(entry.get('zip_level', ZIP_DEFAULT_LEVEL))
+        if not 0 <= zip_level <= 9:
+            raise ValueError('zip_level must be 0-9')
+
+        def path(key: str) -> Optional[Path]:
+            value = entry.get(key)
+            return base_dir / str(value) if value else None
+
+        return cls(
+            rom=path('rom'),
+            out=path('out'),
+            pack_id=str(entry['id']),
+            pack_name=str(entry['name']),
+            courses=path('courses'),
+            cmmod=path('cmmod'),
+            lst=path('lst'),
+            zip_output=bool(entry.get('zip', False)),
+            zip_only=bool(entry.get('zip_only', False)),
+            zip_level=zip_level,
+            zip_threads=int(entry.get('zip_threads', 1)),
+            copy_mode=copy_mode,
+            stage_encoding=stage_encoding,
+            gpu_textures=bool(entry.get('gpu_textures', False)),
+            texture_tiers=bool(entry.get('texture_tiers', False)),
+        )
+
+    def load_courses(self) -> Tuple[Optional[Dict[str, object]], Optional[Dict[int, int]], List[str]]:
+        """(courses, stage time overrides, warnings) from the spec's courses JSON or cmmod config."""
+        if self.courses:
+            return json.loads(self.courses.read_text(encoding='utf-8')), None, []
+        if self.cmmod:
+            challenge_courses, overrides, warnings = parse_cmmod_config(self.cmmod)
+            return make_courses_data(challenge_courses), overrides, warnings
+        return None, None, []
+
+
+@dataclass
+class PackResult:
+    label: str
+    ok: bool
+    seconds: float
+    error: Optional[str] = None
+
+
+def read_spec_file(spec_path: Path) -> List[Tuple[str, object]]:
+    """(label, entry) per pack, with defaults merged in; entries are not validated yet."""
+    text = spec_path.read_text(encoding='utf-8')
+    if spec_path.suffix.lower() == '.toml':
+        if tomllib is None:
+            raise SystemExit('TOML batch specs need Python 3.11+ (tomllib); use JSON instead')
+        data = tomllib.loads(text)
+    else:
+        data = json.loads(text)
+    defaults: Dict[str, object] = {}
+    if isinstance(data, dict):
+        defaults = data.get('defaults') or {}
+        data = data.get('packs')
+    if not isinstance(data, list) or not isinstance(defaults, dict):
+        raise SystemExit(f'{spec_path}: expected a list of packs or {{"defaults": ..., "packs": [...]}}')
+    entries: List[Tuple[str, object]] = []
+    for idx, entry in enumerate(data):
+        if isinstance(entry, dict):
+            entry = {**defaults, **entry}
+            label = str(entry.get('id') or f'#{idx + 1}')
+        else:
+            label = f'#{idx + 1}'
+        entries.append((label, entry))
+    return entries
+
+
+def build_batch(
+    spec_path: Path,
+    jobs: Optional[int] = None,
+    use_cache: bool = True,
+    cache_dir: Optional[Path] = None,
+    cache_max_bytes: int = DEFAULT_MAX_BYTES,
+    verify_copies: bool = False,
+    profiler: Profiler = NULL_PROFILER,
+) -> List[PackResult]:
+    base_dir = spec_path.resolve().parent
+    results: Dict[int, PackResult] = {}
+    planned: List[Tuple[int, str, PackSpec, Optional[Dict[str, object]], Optional[Dict[int, int]]]] = []
+
+    def fail(idx: int, label: str, seconds: float, exc: BaseException) -> None:
+        message = str(exc) or type(exc).__name__
+        print(f'[{label}] failed: {message}', file=sys.stderr)
+        if not isinstance(exc, (SystemExit, OSError, ValueError)):
+            traceback.print_exception(type(exc), exc, exc.__traceback__, file=sys.stderr)
+        results[idx] = PackResult(label, False, seconds, message)
+
+    with profiler.span('batch_specs'):
+        for idx, (label, entry) in enumerate(read_spec_file(spec_path)):
+            try:
+                if not isinstance(entry, dict):
+                    raise ValueError('pack entry must be an object')
+                spec = PackSpec.from_entry(entry, base_dir)
+                courses, overrides, warnings = spec.load_courses()
+            except (Exception, SystemExit) as exc:
+                fail(idx, label, 0.0, exc)
+                continue
+            for warning in warnings:
+                print(f'[{label}] warning: {warning}')
+            planned.append((idx, label, spec, courses, overrides))
+
+    jobs = jobs or os.cpu_count() or 1
+    sessions: Dict[Path, RomSession] = {}
+    pool = stage_pool(jobs) if jobs > 1 else None
+    try:
+        # Decode the union of every pack's stages per ROM once; the packs below
+        # then find their stage fogs in the session memo.
+        with profiler.span('prefetch_stages'):
+            wanted: Dict[Path, set] = {}
+            for _, _, spec, courses, _ in planned:
+                session = sessions.get(spec.rom)
+                if session is None:
+                    session = sessions[spec.rom] = RomSession(spec.rom, LayoutDatabase(cache_dir) if use_cache else None)
+                if not session.stage_dir.is_dir():
+                    continue
+                wanted.setdefault(spec.rom, set()).update(select_stage_ids(session.stage_ids, courses)[0])
+            for rom, stage_ids in wanted.items():
+                cache = BuildCache(cache_dir or default_cache_dir(), cache_max_bytes) if use_cache else None
+                try:
+                    extract_stage_fogs(sessions[rom].stage_dir, sorted(stage_ids), jobs, cache, profiler, pool,
+                                       sessions[rom].stage_fog_memo)
+                except Exception as exc:
+                    # Each pack retries on its own and reports the error against itself.
+                    print(f'Warning: prefetching stages from {rom} failed: {exc}', file=sys.stderr)
+                finally:
+                    if cache:
+                        cache.close()
+
+        for idx, label, spec, courses, overrides in planned:
+            print(f'[{label}] building {spec.out}')
+            start = time.perf_counter()
+            try:
+                with profiler.span(f'pack {label}', 'pack'):
+                    build_pack(
+                        spec.rom,
+                        spec.out,
+                        spec.pack_id,
+                        spec.pack_name,
+                        None,
+                        spec.zip_output,
+                        courses_data=courses,
+                        lst_path=spec.lst,
+                        stage_time_overrides=overrides,
+                        jobs=jobs,
+                        use_cache=use_cache,
+                        cache_dir=cache_dir,
+                        cache_max_bytes=cache_max_bytes,
+                        copy_mode=spec.copy_mode,
+                        verify_copies=verify_copies,
+                        zip_only=spec.zip_only,
+                        zip_level=spec.zip_level,
+                        zip_threads=spec.zip_threads,
+                        session=sessions[spec.rom],
+                        profiler=profiler,
+                        pool=pool,
+                        stage_encoding=spec.stage_encoding,
+                        gpu_textures=spec.gpu_textures,
+                        texture_tiers=spec.texture_tiers,
+                    )
+            except (Exception, SystemExit) as exc:
+                fail(idx, label, time.perf_counter() - start, exc)
+                continue
+            results[idx] = PackResult(label, True, time.perf_counter() - start)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        for session in sessions.values():
+            session.close()
+    return [results[idx] for idx in sorted(results)]
+
+
+def print_batch_summary(results: List[PackResult], file=None) -> None:
+    failed = [result for result in results if not result.ok]
+    print(f'Batch: {len(results) - len(failed)} built, {len(failed)} failed', file=file)
+    for result in results:
+        status = 'ok' if result.ok else 'FAILED'
+        detail = f'  {result.error}' if result.error else ''
+        print(f'  {result.label:<24} {status:<6} {result.seconds:8.3f}s{detail}', file=file)
+
+
+def write_batch_report(results: List[PackResult], path: Path) -> None:
+    path.write_text(json.dumps([asdict(result) for result in results], indent=2), encoding='utf-8')
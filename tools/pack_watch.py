@@ -0,0 +1,121 @@
+"""Resident pack builder (`smb2_pack_builder.py --watch`).
+
+Builds the pack once, then polls the inputs (REL, stage names, .lst, courses
+JSON and the stage/bg/init folders) and rebuilds whenever one changes. The
+`RomSession` stays open between rebuilds, so a rebuild only redoes what the
+change touched:
+
+- an edited stage is the only one decoded again (the session's stage memo is
+  keyed by file stamp), and only its stageEnv entry changes;
+- copies are skipped for every file whose size and mtime still match, so only
+  edited files are copied again;
+- pack.json is written to a temporary file and renamed over the old one, so
+  a page loading the pack never sees half of it;
+- a new REL, stage names or .lst opens a fresh session; stage files being
+  added or removed only rescans the stage list.
+
+Polling uses nothing outside the standard library; one poll stats a few
+hundred files and takes a few milliseconds.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from build_cache import LayoutDatabase
+from smb2_pack_builder import RomSession
+
+DEFAULT_INTERVAL = 0.5
+# A change is built once the inputs stay unchanged for this long, so an
+# editor writing several files (or one file in pieces) triggers one rebuild.
+SETTLE_SECONDS = 0.1
+
+Stamps = Dict[str, Tuple[int, int]]
+
+
+def snapshot_inputs(files: Iterable[Path], dirs: Iterable[Path]) -> Stamps:
+    """(mtime_ns, size) of `files` and of every file directly inside `dirs`."""
+    stamps: Stamps = {}
+    for path in files:
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        stamps[str(path)] = (stat.st_mtime_ns, stat.st_size)
+    for directory in dirs:
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        stamps[entry.path] = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            continue
+    return stamps
+
+
+def changed_paths(old: Stamps, new: Stamps) -> List[str]:
+    return sorted(path for path in old.keys() | new.keys() if old.get(path) != new.get(path))
+
+
+def watch_pack(
+    rom_dir: Path,
+    build: Callable[[RomSession], None],
+    extra_files: Iterable[Optional[Path]] = (),
+    use_cache: bool = True,
+    cache_dir: Optional[Path] = None,
+    interval: float = DEFAULT_INTERVAL,
+) -> None:
+    """Call `build(session)` now and again after every input change, until interrupted."""
+    session = RomSession(rom_dir, LayoutDatabase(cache_dir) if use_cache else None)
+    session_files = {str(session.main_loop_rel), str(session.stgname)}
+    session_files.update(str(path) for path in extra_files if path and path.suffix == '.lst')
+    stage_prefix = os.path.join(str(session.stage_dir), '')
+    files = [session.main_loop_rel, session.stgname, *(path for path in extra_files if path)]
+    dirs = [session.stage_dir, rom_dir / 'bg', rom_dir / 'init']
+
+    def rebuild(reason: str) -> None:
+        start = time.perf_counter()
+        try:
+            build(session)
+        except (Exception, SystemExit) as exc:
+            print(f'Build failed ({reason}): {exc or type(exc).__name__}', file=sys.stderr)
+            return
+        print(f'Built in {time.perf_counter() - start:.3f}s ({reason})', flush=True)
+
+    stamps = snapshot_inputs(files, dirs)
+    rebuild('initial build')
+    print(f'Watching {rom_dir} every {interval:g}s; press Ctrl+C to stop.', flush=True)
+    try:
+        while True:
+            time.sleep(interval)
+            current = snapshot_inputs(files, dirs)
+            if current == stamps:
+                continue
+            while True:
+                time.sleep(SETTLE_SECONDS)
+                settled = snapshot_inputs(files, dirs)
+                if settled == current:
+                    break
+                current = settled
+            changed = changed_paths(stamps, current)
+            added_or_removed = [path for path in changed if (path in stamps) != (path in current)]
+            stamps = current
+
+            if session_files.intersection(changed):
+                memo = session.stage_fog_memo
+                session.close()
+                session = RomSession(rom_dir, session.layouts)
+                session.stage_fog_memo = memo
+            elif any(path.startswith(stage_prefix) for path in added_or_removed):
+                session.rescan_stages()
+            names = ', '.join(os.path.basename(path) for path in changed[:5])
+            rebuild(names + (f' and {len(changed) - 5} more' if len(changed) > 5 else ''))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        session.close()
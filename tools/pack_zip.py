@@ -0,0 +1,265 @@
+"""Deterministic zip writer for SMB2 web packs.
+
+Entries are written in the order they are added, with a fixed timestamp and a
+per-type compression policy: LZSS and zlib stage files are stored as-is, and
+anything whose first chunk deflates by less than 5% is treated as
+incompressible.
+
+`zipfile` cannot accept pre-compressed payloads, so the archive format is
+written here directly. That lets deflate run on a thread pool (zlib releases
+the GIL) while the single-threaded path streams each entry straight from disk;
+both feed the same compressor with the same chunking and emit the same headers,
+so the archives are byte-identical for a given level.
+"""
+
+from __future__ import annotations
+
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO, Deque, List, Optional, Tuple
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+ZIP_STORED_SUFFIXES = {'.lz', '.zlib'}
+ZIP_SNIFF_SIZE = 64 * 1024
+ZIP_MIN_DEFLATE_RATIO = 0.95
+ZIP_DEFAULT_LEVEL = 6
+ZIP_FIXED_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+ZIP_CHUNK_SIZE = 1 << 20
+
+_ZIP64_LIMIT = (1 << 31) - 1
+_MAX_U32 = 0xFFFFFFFF
+_MAX_U16 = 0xFFFF
+_LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+_CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+_END_RECORD = struct.Struct('<IHHHHIIH')
+_ZIP64_END_RECORD = struct.Struct('<IQHHIIQQQQ')
+_ZIP64_END_LOCATOR = struct.Struct('<IIQI')
+_EXTERNAL_ATTR = 0o100644 << 16
+_DOS_TIME = 0
+_DOS_DATE = ((ZIP_FIXED_DATE_TIME[0] - 1980) << 9) | (ZIP_FIXED_DATE_TIME[1] << 5) | ZIP_FIXED_DATE_TIME[2]
+
+
+def zip_compress_type(arcname: str, head: bytes) -> int:
+    """Pick STORED for already-compressed data and DEFLATED for everything else."""
+    if PurePosixPath(arcname).suffix.lower() in ZIP_STORED_SUFFIXES:
+        return ZIP_STORED
+    if len(head) >= 1024 and len(zlib.compress(head, 1)) > len(head) * ZIP_MIN_DEFLATE_RATIO:
+        return ZIP_STORED
+    return ZIP_DEFLATED
+
+
+class _Entry:
+    __slots__ = ('name', 'method', 'crc', 'size', 'compress_size', 'offset', 'zip64')
+
+    def __init__(self, name: bytes, method: int, size: int) -> None:
+        self.name = name
+        self.method = method
+        self.size = size
+        self.crc = 0
+        self.compress_size = 0
+        self.offset = 0
+        # Decided from the uncompressed size alone (as zipfile does), so the
+        # header layout never depends on how well the entry compressed.
+        self.zip64 = size * 1.05 > _ZIP64_LIMIT
+
+
+class _EntryEncoder:
+    """CRC + optional deflate over a sequence of chunks."""
+
+    def __init__(self, method: int, level: int) -> None:
+        self.crc = 0
+        self.compress_size = 0
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, -15) if method == ZIP_DEFLATED else None
+
+    def feed(self, chunk: bytes) -> bytes:
+        self.crc = zlib.crc32(chunk, self.crc)
+        if self._compressor:
+            chunk = self._compressor.compress(chunk)
+        self.compress_size += len(chunk)
+        return chunk
+
+    def finish(self) -> bytes:
+        tail = self._compressor.flush() if self._compressor else b''
+        self.compress_size += len(tail)
+        return tail
+
+
+def _read_chunks(handle: BinaryIO, head: bytes):
+    if head:
+        yield head
+    while True:
+        chunk = handle.read(ZIP_CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _split_chunks(data: bytes):
+    for start in range(0, len(data), ZIP_CHUNK_SIZE):
+        yield data[start:start + ZIP_CHUNK_SIZE]
+
+
+def _encode_file(src: Path, arcname: str, level: int) -> Tuple[_Entry, List[bytes]]:
+    with src.open('rb') as handle:
+        head = handle.read(ZIP_SNIFF_SIZE)
+        entry = _Entry(arcname.encode('utf-8'), zip_compress_type(arcname, head),
+                       os.fstat(handle.fileno()).st_size)
+        return _encode_chunks(entry, _read_chunks(handle, head), level)
+
+
+def _encode_bytes(data: bytes, arcname: str, level: int) -> Tuple[_Entry, List[bytes]]:
+    entry = _Entry(arcname.encode('utf-8'), zip_compress_type(arcname, data[:ZIP_SNIFF_SIZE]), len(data))
+    return _encode_chunks(entry, _split_chunks(data), level)
+
+
+def _encode_chunks(entry: _Entry, chunks, level: int) -> Tuple[_Entry, List[bytes]]:
+    encoder = _EntryEncoder(entry.method, level)
+    payload = [encoder.feed(chunk) for chunk in chunks]
+    payload.append(encoder.finish())
+    entry.crc = encoder.crc
+    entry.compress_size = encoder.compress_size
+    return entry, payload
+
+
+class PackZipWriter:
+    """Writes a pack zip entry by entry; `threads > 1` deflates on a thread pool.
+
+    The archive is written next to `zip_path` and moved into place on close(),
+    so an interrupted build never leaves a truncated zip behind.
+    """
+
+    def __init__(self, zip_path: Path, deflate_level: int = ZIP_DEFAULT_LEVEL, threads: int = 1) -> None:
+        self.zip_path = zip_path
+        self.deflate_level = deflate_level
+        zip_path.parent.mkdir(parents=True, exist_ok=True)
+        self._tmp_path = zip_path.with_name(f'.{zip_path.name}.tmp')
+        self._fp = self._tmp_path.open('wb')
+        self._entries: List[_Entry] = []
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pending: Deque[Future] = deque()
+        self._window = threads * 2
+        if threads > 1:
+            self._pool = ThreadPoolExecutor(max_workers=threads)
+
+    def add_bytes(self, arcname: str, data: bytes) -> None:
+        if self._pool:
+            self._submit(_encode_bytes, data, arcname)
+            return
+        entry, payload = _encode_bytes(data, arcname, self.deflate_level)
+        self._write_entry(entry, payload)
+
+    def add_file(self, arcname: str, src: Path) -> None:
+        if self._pool:
+            self._submit(_encode_file, src, arcname)
+            return
+        # Stream: write the header with placeholder sizes, then patch it.
+        with src.open('rb') as handle:
+            head = handle.read(ZIP_SNIFF_SIZE)
+            entry = _Entry(arcname.encode('utf-8'), zip_compress_type(arcname, head),
+                           os.fstat(handle.fileno()).st_size)
+            entry.offset = self._fp.tell()
+            self._write_local_header(entry)
+            encoder = _EntryEncoder(entry.method, self.deflate_level)
+            for chunk in _read_chunks(handle, head):
+                self._fp.write(encoder.feed(chunk))
+            self._fp.write(encoder.finish())
+        entry.crc = encoder.crc
+        entry.compress_size = encoder.compress_size
+        end = self._fp.tell()
+        self._fp.seek(entry.offset)
+        self._write_local_header(entry)
+        self._fp.seek(end)
+        self._entries.append(entry)
+
+    def _submit(self, func, source, arcname: str) -> None:
+        # Entries are compressed out of order but always written in order;
+        # the window bounds how much compressed data is held in memory.
+        while len(self._pending) >= self._window:
+            self._write_entry(*self._pending.popleft().result())
+        self._pending.append(self._pool.submit(func, source, arcname, self.deflate_level))
+
+    def _drain(self) -> None:
+        while self._pending:
+            self._write_entry(*self._pending.popleft().result())
+
+    def _write_entry(self, entry: _Entry, payload: List[bytes]) -> None:
+        entry.offset = self._fp.tell()
+        self._write_local_header(entry)
+        for chunk in payload:
+            self._fp.write(chunk)
+        self._entries.append(entry)
+
+    def _write_local_header(self, entry: _Entry) -> None:
+        extra = b''
+        size = entry.size
+        compress_size = entry.compress_size
+        version = 20
+        if entry.zip64:
+            extra = struct.pack('<HHQQ', 1, 16, size, compress_size)
+            size = compress_size = _MAX_U32
+            version = 45
+        self._fp.write(_LOCAL_HEADER.pack(
+            0x04034b50, version, 0, entry.method, _DOS_TIME, _DOS_DATE,
+            entry.crc, compress_size, size, len(entry.name), len(extra),
+        ))
+        self._fp.write(entry.name)
+        self._fp.write(extra)
+
+    def _write_central_directory(self) -> None:
+        cd_offset = self._fp.tell()
+        for entry in self._entries:
+            fields: List[int] = []
+            size = entry.size
+            compress_size = entry.compress_size
+            offset = entry.offset
+            if entry.zip64 or size > _ZIP64_LIMIT or compress_size > _ZIP64_LIMIT:
+                fields += [size, compress_size]
+                size = compress_size = _MAX_U32
+            if offset > _ZIP64_LIMIT:
+                fields.append(offset)
+                offset = _MAX_U32
+            extra = struct.pack(f'<HH{len(fields)}Q', 1, 8 * len(fields), *fields) if fields else b''
+            version = 45 if fields else 20
+            self._fp.write(_CENTRAL_HEADER.pack(
+                0x02014b50, (3 << 8) | version, version, 0, entry.method, _DOS_TIME, _DOS_DATE,
+                entry.crc, compress_size, size, len(entry.name), len(extra), 0, 0, 0,
+                _EXTERNAL_ATTR, offset,
+            ))
+            self._fp.write(entry.name)
+            self._fp.write(extra)
+        cd_end = self._fp.tell()
+        count = len(self._entries)
+        cd_size = cd_end - cd_offset
+        if count > _MAX_U16 or cd_offset > _ZIP64_LIMIT or cd_size > _ZIP64_LIMIT:
+            self._fp.write(_ZIP64_END_RECORD.pack(
+                0x06064b50, _ZIP64_END_RECORD.size - 12, 45, 45, 0, 0, count, count, cd_size, cd_offset,
+            ))
+            self._fp.write(_ZIP64_END_LOCATOR.pack(0x07064b50, 0, cd_end, 1))
+            count = min(count, _MAX_U16)
+            cd_size = min(cd_size, _MAX_U32)
+            cd_offset = min(cd_offset, _MAX_U32)
+        self._fp.write(_END_RECORD.pack(0x06054b50, 0, 0, count, count, cd_size, cd_offset, 0))
+
+    def close(self) -> None:
+        try:
+            self._drain()
+            self._write_central_directory()
+        except BaseException:
+            self.abort()
+            raise
+        if self._pool:
+            self._pool.shutdown()
+        self._fp.close()
+        os.replace(self._tmp_path, self.zip_path)
+
+    def abort(self) -> None:
+        if self._pool:
+            self._pool.shutdown(cancel_futures=True)
+        self._fp.close()
+        self._tmp_path.unlink(missing_ok=True)
@@ -0,0 +1,71 @@
+"""Zero-copy access to extracted ROM files.
+
+`RomFile` memory-maps a file read-only and hands out `memoryview` windows into
+it, so table parsers and scanners can slice freely without copying. Pages are
+only faulted in when touched, which keeps peak RSS low for the large
+`mkb2.main_loop.rel` scans.
+"""
+
+from __future__ import annotations
+
+import mmap
+from pathlib import Path
+from typing import Union
+
+ByteView = Union[bytes, bytearray, memoryview, mmap.mmap]
+
+
+class RomFile:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._mm = None
+        with path.open('rb') as handle:
+            try:
+                self._mm = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files cannot be mapped.
+                self.view = memoryview(b'')
+                return
+        self.view = memoryview(self._mm)
+
+    def __enter__(self) -> 'RomFile':
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.view)
+
+    def window(self, offset: int, length: int) -> memoryview:
+        return self.view[offset:offset + length]
+
+    def close(self) -> None:
+        self.view.release()
+        if self._mm is not None:
+            try:
+                self._mm.close()
+            except BufferError:
+                # A caller still holds a window; the map is released with it.
+                pass
+
+
+# How far a memoryview is copied at a time while looking for a terminator.
+_CSTRING_CHUNK = 256
+
+
+def read_cstring(data: ByteView, offset: int) -> str:
+    if isinstance(data, memoryview):
+        # memoryview has no find(); search it a chunk at a time instead of copying the rest.
+        end = offset
+        while end < len(data):
+            nul = bytes(data[end:end + _CSTRING_CHUNK]).find(0)
+            if nul >= 0:
+                end += nul
+                break
+            end += _CSTRING_CHUNK
+    else:
+        end = data.find(b'\0', offset)
+    if end < 0 or end > len(data):
+        end = len(data)
+    return bytes(data[offset:end]).decode('ascii', errors='ignore')
@@ -0,0 +1,125 @@
+"""Declarative big-endian record layouts shared by the ROM tools.
+
+Each record is declared once as `(field, format)` pairs (`None` for padding)
+and compiled to a cached `struct.Struct`, a namedtuple type and, on request, a
+numpy structured dtype. Arrays of records decode in a single `iter_unpack`
+call instead of one `unpack_from` per field.
+"""
+
+from __future__ import annotations
+
+import struct
+from collections import namedtuple
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from rom_reader import ByteView
+
+_NUMPY_FORMATS = {
+    'b': 'i1', 'B': 'u1', 'h': '>i2', 'H': '>u2',
+    'i': '>i4', 'I': '>u4', 'f': '>f4',
+}
+
+
+class Record:
+    def __init__(self, name: str, fields: Sequence[Tuple[Optional[str], str]]) -> None:
+        self.name = name
+        self.layout = tuple(fields)
+        self.fields = tuple(field for field, _ in fields if field)
+        self.struct = struct.Struct('>' + ''.join(fmt for _, fmt in fields))
+        self.size = self.struct.size
+        self.type = namedtuple(name, self.fields)
+
+    def unpack(self, data: ByteView, offset: int = 0):
+        return self.type._make(self.struct.unpack_from(data, offset))
+
+    def iter_unpack(self, data: ByteView, offset: int, count: int) -> Iterator[tuple]:
+        """Plain tuples for `count` consecutive records; fastest for bulk decoding."""
+        block = memoryview(data)[offset:offset + count * self.size]
+        if len(block) != count * self.size:
+            raise struct.error(f'{self.name}: need {count * self.size} bytes at {offset:#x}, got {len(block)}')
+        return self.struct.iter_unpack(block)
+
+    def unpack_array(self, data: ByteView, offset: int, count: int) -> List[tuple]:
+        return list(map(self.type._make, self.iter_unpack(data, offset, count)))
+
+    def dtype(self):
+        """numpy structured dtype with the same field names and offsets."""
+        import numpy as np
+
+        names: List[str] = []
+        formats: List[str] = []
+        offsets: List[int] = []
+        prefix = '>'
+        for field, fmt in self.layout:
+            if field:
+                names.append(field)
+                formats.append(_NUMPY_FORMATS[fmt])
+                offsets.append(struct.calcsize(prefix))
+            prefix += fmt
+        return np.dtype({'names': names, 'formats': formats, 'offsets': offsets, 'itemsize': self.size})
+
+
+# Stagedef animation keyframe.
+KEYFRAME = Record('Keyframe', [
+    ('ease', 'i'),
+    ('time', 'f'),
+    ('value', 'f'),
+    ('tangent_in', 'f'),
+    ('tangent_out', 'f'),
+])
+
+# AmusementVision TPL texture header (one per entry after the u32 entry count).
+TPL_TEXTURE = Record('TplTexture', [
+    ('format', 'I'),
+    ('offset', 'I'),
+    ('width', 'H'),
+    ('height', 'H'),
+    ('mip_count', 'H'),
+    ('magic', 'H'),
+])
+
+# Stagedef fog.
+FOG = Record('Fog', [
+    ('fog_type', 'I'),
+    ('start', 'f'),
+    ('end', 'f'),
+    ('r', 'f'),
+    ('g', 'f'),
+    ('b', 'f'),
+])
+
+# Stagedef fog animation header: a (count, pointer) keyframe list per channel.
+FOG_ANIM_CHANNELS = ('start', 'end', 'r', 'g', 'b')
+FOG_ANIM = Record('FogAnimHeader', [
+    (f'{channel}_{part}', 'I') for channel in FOG_ANIM_CHANNELS for part in ('count', 'ptr')
+])
+
+# theme_lights entry in mkb2.main_loop.rel.
+THEME_LIGHT = Record('ThemeLight', [
+    (None, '4x'),
+    ('ambient_r', 'f'),
+    ('ambient_g', 'f'),
+    ('ambient_b', 'f'),
+    (None, '36x'),
+    ('inf_light_r', 'f'),
+    ('inf_light_g', 'f'),
+    ('inf_light_b', 'f'),
+    ('rot_x', 'h'),
+    ('rot_y', 'h'),
+    (None, '4x'),
+])
+
+# Challenge mode course command.
+COURSE_COMMAND = Record('CourseCommand', [
+    ('opcode', 'B'),
+    ('type', 'B'),
+    (None, '2x'),
+    ('value', 'I'),
+    (None, '20x'),
+])
+
+# Story mode stage entry.
+STORY_ENTRY = Record('SmStageInfo', [
+    ('stage_id', 'h'),
+    ('difficulty', 'h'),
+])
@@ -9,20 +9,55 @@ from __future__ import annotations
 
 import argparse
 import json
+import multiprocessing
 import os
+import queue
 import re
 import shutil
 import struct
 import sys
-import zipfile
+import threading
+import zlib
+from array import array
+from bisect import bisect_left
+from concurrent.futures import Executor, ProcessPoolExecutor
 from dataclasses import dataclass
-from pathlib import Path
-from typing import Dict, Iterable, List, Optional, Tuple
+from functools import cached_property, partial
+from pathlib import Path, PurePosixPath
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from build_cache import DEFAULT_MAX_BYTES, BuildCache, LayoutDatabase, default_cache_dir, hash_file
+from build_profile import NULL_PROFILER, Profiler, memory_peak, memory_peak_start, span_clock
+from build_progress import NULL_PROGRESS, BuildCancelled, BuildProgress, ProgressEvent
+from course_model import CourseModel
+from gpu_textures import GTX_ENCODER_VERSION, sidecar_arcname, tpl_has_gpu_textures, transcode_tpl, transcode_tpl_file
+from pack_zip import ZIP_DEFAULT_LEVEL, PackZipWriter
+from rom_reader import ByteView, RomFile, read_cstring
+from rom_schema import FOG, FOG_ANIM, KEYFRAME, THEME_LIGHT
+from texture_tiers import TEXTURE_TIERS, TIER_ENCODER_VERSION, tier_arcname, tier_size, trim_tpl_file
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 STAGE_WORLD_THEMES_LEN = 420
+# The full stage id -> theme map; the last entries are past the window the locator checks.
+STAGE_WORLD_THEMES_FULL_LEN = 428
 BG_NAME_COUNT = 43
 THEME_LIGHT_COUNT = 41
-KEYFRAME_SIZE = 0x14
+
+COPY_MODES = ('auto', 'hardlink', 'copy')
+# How stagedefs are shipped: 'lzss' copies STAGE###.lz as-is, 'raw' writes the
+# decompressed stagedef and 'deflate' a zlib stream of it, which browsers
+# inflate natively instead of running the byte-serial LZSS decoder in JS.
+STAGE_ENCODINGS = ('lzss', 'raw', 'deflate')
+STAGE_ENCODING_SUFFIXES = {'lzss': '.lz', 'raw': '.bin', 'deflate': '.zlib'}
+STAGE_DEFLATE_LEVEL = 9
+# Bump when a re-encoded stagedef made from the same STAGE###.lz changes.
+STAGE_ENCODER_VERSION = 1
+# ioctl request number for FICLONE (Linux, <linux/fs.h>).
+FICLONE = 0x40049409
 
 # Default symbol addresses from mkb2.us.lst (NTSC SMB2).
 DEFAULT_SYMBOLS = {
@@ -33,8 +68,14 @@ DEFAULT_SYMBOLS = {
 
 # Default file offset for STAGE_WORLD_THEMES table in mkb2.main_loop.rel (NTSC SMB2).
 DEFAULT_STAGE_WORLD_FILE_OFF = 0x204E48
-
-# Hard-coded bg filename table (WorldTheme -> bg file), SMB2 NTSC.
+# Default file offsets of the bonus stage list and WorldTheme -> music table.
+DEFAULT_BONUS_STAGES_FILE_OFF = 0x176118
+DEFAULT_THEME_MUSIC_FILE_OFF = 0x16E738
+BONUS_STAGE_COUNT = 9
+THEME_MUSIC_COUNT = 43
+
+# Fallback bg filename table (WorldTheme -> bg file), SMB2 NTSC. Normally the
+# names are read from g_bg_filename_list in the linked REL instead.
 BG_NAME_TABLE: List[Optional[str]] = [
     None,  # 0
     None,  # 1
@@ -83,7 +124,17 @@ BG_NAME_TABLE: List[Optional[str]] = [
 
 # REL relocation constants (PowerPC REL format)
 R_PPC_NONE = 0
+R_PPC_ADDR32 = 1
+R_PPC_ADDR16_LO = 4
+R_PPC_ADDR16_HI = 5
+R_PPC_ADDR16_HA = 6
+R_PPC_REL24 = 10
+R_DOLPHIN_NOP = 201
 R_PPC_SECTION = 202
+R_DOLPHIN_END = 203
+
+# Imports against module 0 (main.dol) carry absolute addresses in the addend.
+DOL_MODULE_ID = 0
 
 
 @dataclass
@@ -95,21 +146,13 @@ class RelSection:
 
 @dataclass
 class RelHeader:
+    module_id: int
     section_table_off: int
     section_count: int
     imp_off: int
     imp_size: int
 
 
-@dataclass
-class Relocation:
-    patch_section: int
-    patch_offset: int
-    rel_type: int
-    target_section: int
-    addend: int
-
-
 @dataclass
 class FogAnim:
     start: Optional[List[Dict[str, float]]]
@@ -128,89 +171,181 @@ class StageFog:
     anim: Optional[FogAnim]
 
 
-def read_u32_be(data: bytes, offset: int) -> int:
+def read_u32_be(data: ByteView, offset: int) -> int:
     return struct.unpack_from('>I', data, offset)[0]
 
 
-def read_s32_be(data: bytes, offset: int) -> int:
-    return struct.unpack_from('>i', data, offset)[0]
+LZSS_RING_SIZE = 4096
+LZSS_RING_START = 4078
 
 
-def read_f32_be(data: bytes, offset: int) -> float:
-    return struct.unpack_from('>f', data, offset)[0]
+def _lzss_literal_run(flags: int) -> int:
+    # Consecutive literal bits at the bottom of a flag word, not counting the
+    # sentinel bit that marks how many flags remain.
+    remaining = flags.bit_length() - 1
+    bits = flags & ((1 << remaining) - 1)
+    return min((~bits & (bits + 1)).bit_length() - 1, remaining)
 
 
-def read_u16_be(data: bytes, offset: int) -> int:
-    return struct.unpack_from('>H', data, offset)[0]
+_LZSS_LITERAL_RUN = bytes(_lzss_literal_run(v) if v else 0 for v in range(512))
 
 
-def read_s16_be(data: bytes, offset: int) -> int:
-    return struct.unpack_from('>h', data, offset)[0]
+class LzssStream:
+    """Resumable LZSS decoder for an SMB `.lz` blob (8-byte size header + flag stream).
 
+    Output is produced on demand: `read()` decodes just far enough to cover the
+    requested range and remembers its position, so a later read further into
+    the file resumes where the previous one stopped. `len()` is the declared
+    decompressed size, available without decoding anything.
 
-def lzss_decompress(buffer: bytes) -> bytes:
-    if len(buffer) < 8:
-        return b''
-    src_size = struct.unpack_from('<I', buffer, 0)[0]
-    dest_size = struct.unpack_from('<I', buffer, 4)[0]
-    if src_size <= 8 or dest_size <= 0:
-        return b''
-    src = buffer[8:8 + (src_size - 8)]
-    dest = bytearray(dest_size)
-    ring = bytearray(4096)
-    buf_pos = 4078
-    flags = 0
-    srcp = 0
-    destp = 0
-    while True:
-        flags >>= 1
-        if (flags & 0x100) == 0:
-            if srcp >= len(src):
-                break
-            flags = src[srcp] | 0xFF00
-            srcp += 1
-        if flags & 1:
-            if srcp >= len(src):
-                break
-            byte = src[srcp]
-            srcp += 1
-            if destp >= len(dest):
-                break
-            dest[destp] = byte
-            ring[buf_pos] = byte
-            buf_pos = (buf_pos + 1) & 4095
-            destp += 1
-        else:
-            if srcp + 1 >= len(src):
+    The 4 KiB ring buffer of the original decoder is never materialized: a ring
+    offset is translated into a distance back into the output, so literal runs
+    and back-references are appended as whole slices. Ring slots that were never
+    written read as zero, exactly like the zero-filled ring in `src/lzs.ts`.
+    """
+
+    def __init__(self, buffer: ByteView) -> None:
+        self.size = 0
+        self._src = memoryview(b'')
+        if len(buffer) >= 8:
+            src_size, dest_size = struct.unpack_from('<II', buffer, 0)
+            if src_size > 8 and dest_size > 0:
+                self.size = dest_size
+                self._src = memoryview(buffer)[8:src_size]
+        self._srcp = 0
+        self._flags = 1
+        self._out = bytearray()
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def decoded(self) -> int:
+        return len(self._out)
+
+    def ensure(self, end: int) -> None:
+        out = self._out
+        target = min(end, self.size)
+        if len(out) >= target:
+            return
+        src = self._src
+        src_len = len(src)
+        literal_run = _LZSS_LITERAL_RUN
+        srcp = self._srcp
+        flags = self._flags
+        exhausted = False
+        while len(out) < target:
+            if flags == 1:
+                if srcp >= src_len:
+                    exhausted = True
+                    break
+                flags = src[srcp] | 0x100
+                srcp += 1
+            if flags & 1:
+                run = literal_run[flags]
+                out += src[srcp:srcp + run]
+                srcp += run
+                flags >>= run
+                if srcp > src_len:
+                    srcp = src_len
+                    exhausted = True
+                    break
+                continue
+            if srcp + 1 >= src_len:
+                srcp = src_len
+                exhausted = True
                 break
-            offset = src[srcp]
             r8 = src[srcp + 1]
+            offset = src[srcp] | ((r8 & 0xF0) << 4)
             srcp += 2
-            length = (r8 & 0x0F) + 2
-            offset |= (r8 & 0xF0) << 4
-            for i in range(length + 1):
-                byte = ring[(offset + i) & 4095]
-                if destp >= len(dest):
+            count = (r8 & 0x0F) + 3
+            destp = len(out)
+            dist = ((LZSS_RING_START + destp - offset - 1) & (LZSS_RING_SIZE - 1)) + 1
+            start = destp - dist
+            if start < 0:
+                # Reads before the first output byte hit the zero-filled ring.
+                for i in range(count):
+                    pos = start + i
+                    out.append(out[pos] if pos >= 0 else 0)
+            elif dist >= count:
+                out += out[start:start + count]
+            else:
+                # Overlapping copy: the source repeats with period `dist`.
+                pattern = out[start:destp]
+                out += (pattern * (count // dist + 1))[:count]
+            flags >>= 1
+        self._srcp = srcp
+        self._flags = flags
+        if len(out) > self.size:
+            del out[self.size:]
+        elif exhausted:
+            # A truncated stream leaves the rest of the output zero-filled.
+            out += bytes(self.size - len(out))
+
+    def read(self, offset: int, length: int) -> bytes:
+        self.ensure(offset + length)
+        return bytes(self._out[offset:offset + length])
+
+    def read_all(self) -> bytes:
+        self.ensure(self.size)
+        return bytes(self._out)
+
+    @property
+    def consumed(self) -> int:
+        """Compressed bytes read so far, including the 8-byte header."""
+        return self._srcp + 8 if self.size else 0
+
+    def token_stats(self) -> Dict[str, int]:
+        """Literal and back-reference counts for the part of the stream decoded so far.
+
+        Walks the consumed flag stream again without producing output, so the
+        decoder itself carries no bookkeeping; only `--profile` calls this.
+        """
+        src = self._src
+        end = self._srcp
+        literal_run = _LZSS_LITERAL_RUN
+        literal_bytes = matches = match_bytes = 0
+        srcp = 0
+        flags = 1
+        while srcp < end:
+            if flags == 1:
+                flags = src[srcp] | 0x100
+                srcp += 1
+            elif flags & 1:
+                run = min(literal_run[flags], end - srcp)
+                literal_bytes += run
+                srcp += run
+                flags >>= run
+            else:
+                if srcp + 1 >= end:
                     break
-                dest[destp] = byte
-                ring[buf_pos] = byte
-                buf_pos = (buf_pos + 1) & 4095
-                destp += 1
-    return bytes(dest)
+                matches += 1
+                match_bytes += (src[srcp + 1] & 0x0F) + 3
+                srcp += 2
+                flags >>= 1
+        return {'literal_bytes': literal_bytes, 'matches': matches, 'match_bytes': match_bytes}
+
+    def close(self) -> None:
+        self._src.release()
+
+
+def lzss_decompress(buffer: ByteView) -> bytes:
+    return LzssStream(buffer).read_all()
 
 
-def parse_rel_header(data: bytes) -> RelHeader:
+def parse_rel_header(data: ByteView) -> RelHeader:
     header = struct.unpack_from('>IIIIIIIIIIIIIIII', data, 0)
-    (_, _, _, section_count, section_table_off,
+    (module_id, _, _, section_count, section_table_off,
      _, _, _, _, _, imp_off, imp_size,
      _, _, _, _) = header
-    return RelHeader(section_table_off=section_table_off,
+    return RelHeader(module_id=module_id,
+                     section_table_off=section_table_off,
                      section_count=section_count,
                      imp_off=imp_off,
                      imp_size=imp_size)
 
 
-def parse_rel_sections(data: bytes, header: RelHeader) -> List[RelSection]:
+def parse_rel_sections(data: ByteView, header: RelHeader) -> List[RelSection]:
     sections: List[RelSection] = []
     for i in range(header.section_count):
         off_flags, size = struct.unpack_from('>II', data, header.section_table_off + i * 8)
@@ -220,51 +355,184 @@ def parse_rel_sections(data: bytes, header: RelHeader) -> List[RelSection]:
     return sections
 
 
-def parse_relocations(data: bytes, header: RelHeader) -> List[Relocation]:
-    relocs: List[Relocation] = []
+class RelocationIndex:
+    """Relocations of one REL as parallel arrays, sorted by (patch section, offset).
+
+    mkb2.main_loop.rel carries tens of thousands of entries; one typed array per
+    field keeps them compact, and `find()` bisects packed (section, offset) keys.
+    """
+
+    def __init__(self, entries: Iterable[Tuple[int, int, int, int, int, int]] = ()) -> None:
+        rows = sorted(entries)
+        self.patch_section = array('B', (row[0] for row in rows))
+        self.patch_offset = array('I', (row[1] for row in rows))
+        self.rel_type = array('B', (row[2] for row in rows))
+        self.module_id = array('I', (row[3] for row in rows))
+        self.target_section = array('B', (row[4] for row in rows))
+        self.addend = array('I', (row[5] for row in rows))
+        self._keys = array('Q', ((row[0] << 32) | row[1] for row in rows))
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def find(self, section: int, offset: int) -> int:
+        """Index of the relocation patching `section`+`offset`, or -1."""
+        key = (section << 32) | offset
+        idx = bisect_left(self._keys, key)
+        if idx < len(self._keys) and self._keys[idx] == key:
+            return idx
+        return -1
+
+
+_REL_RELOC = struct.Struct('>HBBI')
+
+
+def parse_relocations(data: ByteView, header: RelHeader) -> RelocationIndex:
+    entries: List[Tuple[int, int, int, int, int, int]] = []
+    size = len(data)
     for i in range(0, header.imp_size, 8):
-        _, relocs_off = struct.unpack_from('>II', data, header.imp_off + i)
+        module_id, relocs_off = struct.unpack_from('>II', data, header.imp_off + i)
         off = relocs_off
         curr_section = None
         curr_offset = 0
-        while off + 8 <= len(data):
-            delta, rel_type, rel_section = struct.unpack_from('>HBB', data, off)
-            addend = struct.unpack_from('>I', data, off + 4)[0]
+        while off + 8 <= size:
+            delta, rel_type, rel_section, addend = _REL_RELOC.unpack_from(data, off)
             off += 8
-            if rel_type == R_PPC_NONE:
+            if rel_type == R_DOLPHIN_END:
                 break
             if rel_type == R_PPC_SECTION:
                 curr_section = rel_section
                 curr_offset = 0
                 continue
-            if curr_section is None:
-                continue
             curr_offset += delta
-            relocs.append(Relocation(
-                patch_section=curr_section,
-                patch_offset=curr_offset,
-                rel_type=rel_type,
-                target_section=rel_section,
-                addend=addend,
-            ))
-    return relocs
+            if curr_section is None or rel_type in (R_PPC_NONE, R_DOLPHIN_NOP):
+                continue
+            entries.append((curr_section, curr_offset, rel_type, module_id, rel_section, addend))
+    return RelocationIndex(entries)
+
+
+class LinkedRel:
+    """A REL image with every relocation applied, addressed by virtual address.
+
+    Sections are placed at `load_base` plus their file offset, the way OSLink
+    lays out a module loaded in place, so pointer tables can be followed with
+    plain reads. BSS sections have no file image; relocations that patch or
+    target them are skipped.
+    """
+
+    def __init__(
+        self,
+        data: ByteView,
+        header: RelHeader,
+        sections: List[RelSection],
+        relocs: RelocationIndex,
+        load_base: int,
+    ) -> None:
+        self.load_base = load_base
+        self.sections = sections
+        self.relocs = relocs
+        self.image = bytearray(data)
+        self._link(header.module_id)
+
+    def _link(self, module_id: int) -> None:
+        image = self.image
+        limit = len(image) - 4
+        bases = [sec.offset or None for sec in self.sections]
+        relocs = self.relocs
+        for i in range(len(relocs)):
+            patch_section = relocs.patch_section[i]
+            patch_base = bases[patch_section] if patch_section < len(bases) else None
+            if patch_base is None:
+                continue
+            where = patch_base + relocs.patch_offset[i]
+            if where > limit:
+                continue
+            if relocs.module_id[i] == module_id:
+                target = relocs.target_section[i]
+                target_base = bases[target] if target < len(bases) else None
+                if target_base is None:
+                    continue
+                value = self.load_base + target_base + relocs.addend[i]
+            elif relocs.module_id[i] == DOL_MODULE_ID:
+                value = relocs.addend[i]
+            else:
+                continue
+            value &= 0xFFFFFFFF
+            rel_type = relocs.rel_type[i]
+            if rel_type == R_PPC_ADDR32:
+                struct.pack_into('>I', image, where, value)
+            elif rel_type == R_PPC_ADDR16_LO:
+                struct.pack_into('>H', image, where, value & 0xFFFF)
+            elif rel_type == R_PPC_ADDR16_HI:
+                struct.pack_into('>H', image, where, value >> 16)
+            elif rel_type == R_PPC_ADDR16_HA:
+                struct.pack_into('>H', image, where, ((value + 0x8000) >> 16) & 0xFFFF)
+            elif rel_type == R_PPC_REL24:
+                insn = read_u32_be(image, where)
+                delta = (value - (self.load_base + where)) & 0x03FFFFFC
+                struct.pack_into('>I', image, where, (insn & 0xFC000003) | delta)
+
+    def file_offset(self, addr: int) -> Optional[int]:
+        off = addr - self.load_base
+        if 0 <= off < len(self.image):
+            return off
+        return None
+
+    def read_ptr(self, addr: int) -> Optional[int]:
+        off = self.file_offset(addr)
+        if off is None or off + 4 > len(self.image):
+            return None
+        value = read_u32_be(self.image, off)
+        if value == 0 or self.file_offset(value) is None:
+            return None
+        return value
+
+    def read_cstring(self, addr: int) -> str:
+        off = self.file_offset(addr)
+        if off is None:
+            return ''
+        return read_cstring(self.image, off)
+
+
+_BG_PATH = re.compile(re.escape(b'bg/'))
+STAGE_WORLD_THEME_MAX = 41
+_THEME_ID_BYTES = bytes(range(STAGE_WORLD_THEME_MAX + 1))
+# How far past the end of STAGE_WORLD_THEMES a "bg/" path may start.
+STAGE_WORLD_TAIL_LEN = 16
+
 
+def find_stage_world_themes_offsets(data: ByteView, section: RelSection) -> List[int]:
+    """Every offset in `section` that looks like STAGE_WORLD_THEMES, in file order.
 
-def find_stage_world_themes_offset(data: bytes, section: RelSection) -> Optional[int]:
+    A match is 420 WorldTheme ids followed within 16 bytes by a "bg/" path, so
+    only windows ending just before some "bg/" can match. For each of those the
+    count of out-of-range bytes is taken once and then slid one byte at a time.
+    """
+    view = memoryview(data)
     start = section.offset
     end = section.offset + section.size
-    max_val = 41
-    for off in range(start, end - STAGE_WORLD_THEMES_LEN):
-        chunk = data[off:off + STAGE_WORLD_THEMES_LEN]
-        if not chunk:
-            break
-        if max(chunk) > max_val:
+    max_val = STAGE_WORLD_THEME_MAX
+    tail_slack = STAGE_WORLD_TAIL_LEN - len(b'bg/')
+    offsets: List[int] = []
+    next_end = start + STAGE_WORLD_THEMES_LEN
+    for match in _BG_PATH.finditer(view, next_end, min(end + tail_slack + 2, len(view))):
+        pos = match.start()
+        first_end = max(pos - tail_slack, next_end)
+        last_end = min(pos, end - 1)
+        if first_end > last_end:
             continue
-        tail = data[off + STAGE_WORLD_THEMES_LEN:off + STAGE_WORLD_THEMES_LEN + 16]
-        if b'bg/' not in tail:
-            continue
-        return off
-    return None
+        bad = len(bytes(view[first_end - STAGE_WORLD_THEMES_LEN:first_end]).translate(None, _THEME_ID_BYTES))
+        for table_end in range(first_end, last_end + 1):
+            if not bad:
+                offsets.append(table_end - STAGE_WORLD_THEMES_LEN)
+            bad += (view[table_end] > max_val) - (view[table_end - STAGE_WORLD_THEMES_LEN] > max_val)
+        next_end = last_end + 1
+    return offsets
+
+
+def find_stage_world_themes_offset(data: ByteView, section: RelSection) -> Optional[int]:
+    offsets = find_stage_world_themes_offsets(data, section)
+    return offsets[0] if offsets else None
 
 
 def parse_symbol_addresses(lst_path: Path) -> Dict[str, int]:
@@ -282,166 +550,262 @@ def resolve_section_base(symbol_addr: int, symbol_file_off: int, section: RelSec
     return symbol_addr - (symbol_file_off - section.offset)
 
 
-def read_cstring(data: bytes, offset: int) -> str:
-    end = data.find(b'\x00', offset)
-    if end == -1:
-        end = len(data)
-    return data[offset:end].decode('ascii', errors='ignore')
-
-
-def parse_bg_name_list(
-    data: bytes,
-    section: RelSection,
-    relocs: List[Relocation],
-    list_file_off: int,
-    base_addr: int,
-) -> List[Optional[str]]:
-    list_offset = list_file_off - section.offset
-    relocs_by_offset = {
-        r.patch_offset: r
-        for r in relocs
-        if r.patch_section == 5 and list_offset <= r.patch_offset < list_offset + BG_NAME_COUNT * 4
-    }
+def parse_bg_name_list(rel: LinkedRel, list_addr: int) -> List[Optional[str]]:
+    """Follow g_bg_filename_list (one string pointer per WorldTheme) to bg file stems."""
     names: List[Optional[str]] = []
     for idx in range(BG_NAME_COUNT):
-        entry_offset = list_offset + idx * 4
-        reloc = relocs_by_offset.get(entry_offset)
-        if not reloc:
-            ptr = read_u32_be(data, section.offset + entry_offset)
-            if ptr == 0:
-                names.append(None)
-                continue
-            if base_addr <= ptr < base_addr + section.size:
-                names.append((5, ptr - base_addr))
-            else:
-                names.append(None)
-            continue
-        target_section = reloc.target_section
-        if target_section <= 0:
-            names.append(None)
-            continue
-        if target_section < 0 or target_section >= 18:
-            names.append(None)
-            continue
-        # We only need section offsets; index lookup is fine.
-        # The caller has the full section list; we patch this later.
-        names.append((target_section, reloc.addend))
+        ptr = rel.read_ptr(list_addr + idx * 4)
+        name = rel.read_cstring(ptr) if ptr is not None else ''
+        names.append(PurePosixPath(name).stem or None)
     return names
 
 
-def resolve_bg_name_entries(
-    data: bytes,
-    sections: List[RelSection],
-    entries: List[Optional[Tuple[int, int]]],
-) -> List[Optional[str]]:
-    resolved: List[Optional[str]] = []
-    for entry in entries:
-        if not entry:
-            resolved.append(None)
-            continue
-        sec_idx, addend = entry
-        if sec_idx < 0 or sec_idx >= len(sections):
-            resolved.append(None)
-            continue
-        sec = sections[sec_idx]
-        if sec.offset == 0:
-            resolved.append(None)
-            continue
-        resolved.append(read_cstring(data, sec.offset + addend))
-    return resolved
-
-
-def parse_theme_lights(data: bytes, section: RelSection, base_addr: int, theme_addr: int) -> List[Dict[str, object]]:
+def parse_theme_lights(data: ByteView, section: RelSection, base_addr: int, theme_addr: int) -> List[Dict[str, object]]:
     file_off = section.offset + (theme_addr - base_addr)
-    lights = []
-    for i in range(THEME_LIGHT_COUNT):
-        off = file_off + i * 72
-        floats = struct.unpack_from('>16f', data, off)
-        rot_x = read_s16_be(data, off + 16 * 4)
-        rot_y = read_s16_be(data, off + 16 * 4 + 2)
-        lights.append({
-            'ambient': [floats[1], floats[2], floats[3]],
-            'infLight': [floats[13], floats[14], floats[15]],
+    return [
+        {
+            'ambient': [amb_r, amb_g, amb_b],
+            'infLight': [inf_r, inf_g, inf_b],
             'rotX': rot_x,
             'rotY': rot_y,
-        })
-    return lights
+        }
+        for amb_r, amb_g, amb_b, inf_r, inf_g, inf_b, rot_x, rot_y
+        in THEME_LIGHT.iter_unpack(data, file_off, THEME_LIGHT_COUNT)
+    ]
+
+
+def parse_stage_world_themes_at(data: ByteView, file_off: int, length: int = STAGE_WORLD_THEMES_LEN) -> List[int]:
+    return list(data[file_off:file_off + length])
 
 
-def parse_stage_world_themes_at(data: bytes, file_off: int) -> List[int]:
-    return list(data[file_off:file_off + STAGE_WORLD_THEMES_LEN])
+def _stage_ptr(data: LzssStream, value: int) -> Optional[int]:
+    return value if 0 < value < len(data) else None
 
 
-def read_ptr_be(data: bytes, offset: int) -> Optional[int]:
+def read_ptr_be(data: LzssStream, offset: int) -> Optional[int]:
     if offset is None or offset < 0 or offset + 4 > len(data):
         return None
-    value = read_u32_be(data, offset)
-    if value == 0 or value >= len(data):
-        return None
-    return value
+    return _stage_ptr(data, read_u32_be(data.read(offset, 4), 0))
 
 
-def parse_keyframes(data: bytes, offset: Optional[int], count: int) -> Optional[List[Dict[str, float]]]:
+def parse_keyframes(data: LzssStream, offset: Optional[int], count: int) -> Optional[List[Dict[str, float]]]:
     if offset is None or count <= 0:
         return None
-    frames = []
-    for i in range(count):
-        base = offset + i * KEYFRAME_SIZE
-        frames.append({
-            'ease': float(read_s32_be(data, base)),
-            't': read_f32_be(data, base + 4),
-            'v': read_f32_be(data, base + 8),
-            'in': read_f32_be(data, base + 0x0c),
-            'out': read_f32_be(data, base + 0x10),
-        })
-    return frames
-
-
-def parse_stage_fog(data: bytes, fog_ptr: Optional[int], fog_anim_ptr: Optional[int]) -> Optional[StageFog]:
+    block = data.read(offset, count * KEYFRAME.size)
+    return [
+        {'ease': float(ease), 't': t, 'v': v, 'in': tan_in, 'out': tan_out}
+        for ease, t, v, tan_in, tan_out in KEYFRAME.iter_unpack(block, 0, count)
+    ]
+
+
+def parse_stage_fog(data: LzssStream, fog_ptr: Optional[int], fog_anim_ptr: Optional[int]) -> Optional[StageFog]:
     if fog_ptr is None:
         return None
-    fog_type = read_u32_be(data, fog_ptr)
-    start = read_f32_be(data, fog_ptr + 4)
-    end = read_f32_be(data, fog_ptr + 8)
-    color = (
-        read_f32_be(data, fog_ptr + 0x0c),
-        read_f32_be(data, fog_ptr + 0x10),
-        read_f32_be(data, fog_ptr + 0x14),
-    )
+    fog = FOG.unpack(data.read(fog_ptr, FOG.size))
     anim = None
     if fog_anim_ptr is not None:
-        start_count = read_u32_be(data, fog_anim_ptr)
-        start_ptr = read_ptr_be(data, fog_anim_ptr + 4)
-        end_count = read_u32_be(data, fog_anim_ptr + 8)
-        end_ptr = read_ptr_be(data, fog_anim_ptr + 0x0c)
-        r_count = read_u32_be(data, fog_anim_ptr + 0x10)
-        r_ptr = read_ptr_be(data, fog_anim_ptr + 0x14)
-        g_count = read_u32_be(data, fog_anim_ptr + 0x18)
-        g_ptr = read_ptr_be(data, fog_anim_ptr + 0x1c)
-        b_count = read_u32_be(data, fog_anim_ptr + 0x20)
-        b_ptr = read_ptr_be(data, fog_anim_ptr + 0x24)
+        header = data.read(fog_anim_ptr, FOG_ANIM.size)
+        if len(header) >= FOG_ANIM.size - 4:
+            # A trailing pointer past the end of the stagedef reads as null.
+            header = header.ljust(FOG_ANIM.size, b'\0')
+        channels = FOG_ANIM.unpack(header)
         anim = FogAnim(
-            start=parse_keyframes(data, start_ptr, start_count),
-            end=parse_keyframes(data, end_ptr, end_count),
-            r=parse_keyframes(data, r_ptr, r_count),
-            g=parse_keyframes(data, g_ptr, g_count),
-            b=parse_keyframes(data, b_ptr, b_count),
+            start=parse_keyframes(data, _stage_ptr(data, channels.start_ptr), channels.start_count),
+            end=parse_keyframes(data, _stage_ptr(data, channels.end_ptr), channels.end_count),
+            r=parse_keyframes(data, _stage_ptr(data, channels.r_ptr), channels.r_count),
+            g=parse_keyframes(data, _stage_ptr(data, channels.g_ptr), channels.g_count),
+            b=parse_keyframes(data, _stage_ptr(data, channels.b_ptr), channels.b_count),
         )
-    return StageFog(fog_type=fog_type, start=start, end=end, color=color, anim=anim)
+    return StageFog(fog_type=fog.fog_type, start=fog.start, end=fog.end, color=(fog.r, fog.g, fog.b), anim=anim)
 
 
-def parse_stage_env(stage_path: Path) -> Optional[StageFog]:
-    raw = stage_path.read_bytes()
-    decompressed = lzss_decompress(raw)
-    if not decompressed:
-        return None
-    fog_anim_ptr = read_ptr_be(decompressed, 0xb0)
-    fog_ptr = read_ptr_be(decompressed, 0xbc)
-    return parse_stage_fog(decompressed, fog_ptr, fog_anim_ptr)
+def parse_stage_env(stage_path: Path, stats: Optional[Dict[str, object]] = None) -> Optional[StageFog]:
+    # Only the stagedef header and the fog structs it points to are decoded;
+    # the (much larger) collision and object data behind them is never touched.
+    with RomFile(stage_path) as rom:
+        stage = LzssStream(rom.view)
+        try:
+            if not len(stage):
+                return None
+            fog_anim_ptr = read_ptr_be(stage, 0xb0)
+            fog_ptr = read_ptr_be(stage, 0xbc)
+            return parse_stage_fog(stage, fog_ptr, fog_anim_ptr)
+        finally:
+            if stats is not None:
+                stats.update(file_bytes=len(rom), bytes_read=stage.consumed,
+                             bytes_decompressed=stage.decoded, **stage.token_stats())
+            stage.close()
+
+
+def stage_fog_entry(fog: StageFog) -> Dict[str, object]:
+    fog_obj: Dict[str, object] = {
+        'type': fog.fog_type,
+        'start': fog.start,
+        'end': fog.end,
+        'color': list(fog.color),
+    }
+    if fog.anim:
+        anim = {
+            'start': fog.anim.start,
+            'end': fog.anim.end,
+            'r': fog.anim.r,
+            'g': fog.anim.g,
+            'b': fog.anim.b,
+        }
+        if any(anim.values()):
+            fog_obj['anim'] = anim
+    return fog_obj
 
 
-def read_stage_names(stgname_path: Path) -> Dict[int, str]:
-    lines = stgname_path.read_text(encoding='ascii', errors='ignore').splitlines()
+def extract_stage_fog(
+    stage_path: Path,
+    stats: Optional[Dict[str, object]] = None,
+) -> Tuple[Optional[Dict[str, object]], List[str]]:
+    """Worker entry point: the pack.json fog entry for one stage plus any warnings."""
+    try:
+        fog = parse_stage_env(stage_path, stats)
+    except (OSError, struct.error) as exc:
+        return None, [f'failed to read fog from {stage_path.name}: {exc}']
+    if not fog:
+        return None, []
+    return stage_fog_entry(fog), []
+
+
+def extract_stage_fog_profiled(
+    stage_path: Path,
+) -> Tuple[Tuple[Optional[Dict[str, object]], List[str]], Dict[str, object]]:
+    """Worker entry point under --profile: extract_stage_fog plus its span stats."""
+    memory_peak_start()
+    stats: Dict[str, object] = {}
+    wall, cpu = span_clock()
+    result = extract_stage_fog(stage_path, stats)
+    end_wall, end_cpu = span_clock()
+    stats.update(start_ns=wall, end_ns=end_wall, cpu_ns=end_cpu - cpu, pid=os.getpid(), peak_bytes=memory_peak())
+    return result, stats
+
+
+def count_stage_bytes(profiler: Profiler, stats: Dict[str, object]) -> None:
+    profiler.count('stage_bytes_read', stats.get('bytes_read', 0))
+    profiler.count('stage_bytes_decompressed', stats.get('bytes_decompressed', 0))
+
+
+# Extracted fog per stage file, keyed by path and validated by (mtime_ns, size).
+StageFogResult = Tuple[Optional[Dict[str, object]], List[str]]
+StageFogMemo = Dict[Path, Tuple[Tuple[int, int], StageFogResult]]
+
+
+def stage_pool(jobs: int) -> ProcessPoolExecutor:
+    """A process pool for stage decoding that is safe to start from any thread.
+
+    A fork copies only the calling thread, so forking from the GUI's worker
+    thread while Tk runs on the main one can deadlock the child. Pools started
+    off the main thread spawn their workers instead.
+    """
+    if threading.current_thread() is threading.main_thread():
+        return ProcessPoolExecutor(max_workers=jobs)
+    return ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('spawn'))
+
+
+def extract_stage_fogs(
+    stage_dir: Path,
+    stage_ids: List[int],
+    jobs: int,
+    cache: Optional[BuildCache] = None,
+    profiler: Profiler = NULL_PROFILER,
+    pool: Optional[Executor] = None,
+    memo: Optional[StageFogMemo] = None,
+    progress: BuildProgress = NULL_PROGRESS,
+) -> Tuple[Dict[int, Dict[str, object]], List[str]]:
+    """Fog entries for `stage_ids`, decoding only stages not found in `memo` or `cache`.
+
+    Work goes to `pool` when one is given (the batch builder shares one across
+    packs); otherwise a pool of `jobs` workers is started for this call.
+    `progress` gets a step per decoded stage and may cancel between stages.
+    """
+    paths = {stage_id: stage_dir / f'STAGE{stage_id:03d}.lz' for stage_id in stage_ids}
+    results: Dict[int, StageFogResult] = {}
+    stamps: Dict[int, Tuple[int, int]] = {}
+    if memo is not None:
+        for stage_id, path in paths.items():
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            stamps[stage_id] = (stat.st_mtime_ns, stat.st_size)
+            hit = memo.get(path)
+            if hit is not None and hit[0] == stamps[stage_id]:
+                results[stage_id] = hit[1]
+    digests: Dict[int, str] = {}
+    if cache:
+        for stage_id, path in paths.items():
+            if stage_id in results:
+                continue
+            try:
+                digests[stage_id] = cache.file_digest(path)
+            except OSError:
+                continue
+            cached = cache.get('stage_fog', digests[stage_id])
+            if cached is not None:
+                results[stage_id] = (cached[0], cached[1])
+    pending = [stage_id for stage_id in stage_ids if stage_id not in results]
+    pending_paths = [paths[stage_id] for stage_id in pending]
+    profiler.count('stage_fog_cache_hits', len(results))
+    owns_pool = pool is None and jobs > 1 and len(pending_paths) > 1
+    if owns_pool:
+        pool = stage_pool(jobs)
+    computed: List[StageFogResult] = []
+    try:
+        if pool is not None and pending_paths:
+            chunksize = max(1, len(pending_paths) // (jobs * 4))
+            # map() yields in submission order, so the merge below is the same
+            # as the serial path regardless of which worker finished first.
+            if profiler.enabled:
+                for path, (result, stats) in zip(pending_paths, pool.map(
+                        extract_stage_fog_profiled, pending_paths, chunksize=chunksize)):
+                    pid = stats.pop('pid')
+                    profiler.add_span(path.stem, 'stage', stats.pop('start_ns'), stats.pop('end_ns'),
+                                      stats.pop('cpu_ns'), pid=pid, tid=pid, args=stats)
+                    count_stage_bytes(profiler, stats)
+                    computed.append(result)
+                    progress.step(len(computed), len(pending_paths))
+            elif progress.enabled:
+                for result in pool.map(extract_stage_fog, pending_paths, chunksize=chunksize):
+                    computed.append(result)
+                    progress.step(len(computed), len(pending_paths))
+            else:
+                computed = list(pool.map(extract_stage_fog, pending_paths, chunksize=chunksize))
+        elif profiler.enabled:
+            for path in pending_paths:
+                with profiler.span(path.stem, 'stage') as stats:
+                    computed.append(extract_stage_fog(path, stats))
+                count_stage_bytes(profiler, stats)
+                progress.step(len(computed), len(pending_paths))
+        else:
+            for path in pending_paths:
+                computed.append(extract_stage_fog(path))
+                progress.step(len(computed), len(pending_paths))
+    finally:
+        if owns_pool:
+            # On cancellation, drop the stages no worker has started yet.
+            pool.shutdown(cancel_futures=len(computed) < len(pending_paths))
+    for stage_id, result in zip(pending, computed):
+        results[stage_id] = result
+        if cache and stage_id in digests:
+            cache.put('stage_fog', digests[stage_id], list(result))
+    if memo is not None:
+        for stage_id, stamp in stamps.items():
+            memo[paths[stage_id]] = (stamp, results[stage_id])
+    fogs: Dict[int, Dict[str, object]] = {}
+    warnings: List[str] = []
+    for stage_id in stage_ids:
+        fog_obj, stage_warnings = results[stage_id]
+        warnings.extend(stage_warnings)
+        if fog_obj:
+            fogs[stage_id] = fog_obj
+    return fogs, warnings
+
+
+def stage_names_from_lines(lines: List[str]) -> Dict[int, str]:
     names: Dict[int, str] = {}
     for idx, line in enumerate(lines):
         name = line.strip()
@@ -478,12 +842,298 @@ def collect_stage_ids_from_courses(courses: Dict[str, object]) -> List[int]:
     return stage_ids
 
 
-def copy_file(src: Path, dst: Path, warnings: List[str]) -> None:
+def select_stage_ids(available: List[int], courses: Optional[Dict[str, object]]) -> Tuple[List[int], List[int]]:
+    """(stage ids to pack, ids the courses reference but the ROM lacks); all of `available` without courses."""
+    requested = collect_stage_ids_from_courses(courses) if courses else []
+    if not requested:
+        return available, []
+    available_set = set(available)
+    missing = sorted({sid for sid in requested if sid not in available_set})
+    return sorted({sid for sid in requested if sid in available_set}), missing
+
+
+def make_courses_data(
+    challenge_courses: Dict[str, List[Tuple[int, bool]]],
+    story_worlds: Optional[List[List[int]]] = None,
+) -> Dict[str, object]:
+    """pack.json `courses` from (stage id, bonus) lists per challenge course and story worlds."""
+    order = {}
+    bonus = {}
+    for name, entries in challenge_courses.items():
+        order[name] = [stage_id for stage_id, _ in entries]
+        bonus[name] = [flag for _, flag in entries]
+    courses: Dict[str, object] = {
+        'challenge': {
+            'order': order,
+            'bonus': bonus,
+        },
+    }
+    if story_worlds:
+        courses['story'] = story_worlds
+    return courses
+
+
+def files_match(src: Path, dst: Path, verify_digest: bool = False) -> bool:
+    try:
+        src_stat = src.stat()
+        dst_stat = dst.stat()
+    except OSError:
+        return False
+    if os.path.samestat(src_stat, dst_stat):
+        return True
+    if src_stat.st_size != dst_stat.st_size:
+        return False
+    if verify_digest:
+        return hash_file(src) == hash_file(dst)
+    return src_stat.st_mtime_ns == dst_stat.st_mtime_ns
+
+
+def _clone_file(src: Path, dst: Path) -> bool:
+    if fcntl is None:
+        return False
+    try:
+        with src.open('rb') as src_file, dst.open('wb') as dst_file:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+    except OSError:
+        return False
+    shutil.copystat(src, dst)
+    return True
+
+
+def _copy_file_range(src: Path, dst: Path) -> bool:
+    if not hasattr(os, 'copy_file_range'):
+        return False
+    try:
+        with src.open('rb') as src_file, dst.open('wb') as dst_file:
+            remaining = os.fstat(src_file.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(src_file.fileno(), dst_file.fileno(), remaining)
+                if copied == 0:
+                    return False
+                remaining -= copied
+    except OSError:
+        return False
+    shutil.copystat(src, dst)
+    return True
+
+
+def transfer_file(src: Path, dst: Path, mode: str) -> str:
+    """Place a copy of `src` at `dst` using the cheapest method `mode` allows.
+
+    The new file is built next to `dst` and moved over it, so an existing
+    hardlinked output is replaced instead of written through to the ROM file.
+    """
+    tmp = dst.with_name(f'.{dst.name}.tmp')
+    tmp.unlink(missing_ok=True)
+    method = 'copy'
+    if mode == 'hardlink':
+        try:
+            os.link(src, tmp)
+            method = 'hardlink'
+        except OSError:
+            pass
+    if method == 'copy' and mode != 'copy':
+        if _clone_file(src, tmp):
+            method = 'reflink'
+        elif _copy_file_range(src, tmp):
+            method = 'copy_file_range'
+    if method == 'copy':
+        shutil.copy2(src, tmp)
+    os.replace(tmp, dst)
+    return method
+
+
+def copy_file(
+    src: Path,
+    dst: Path,
+    warnings: List[str],
+    cache: Optional[BuildCache] = None,
+    mode: str = 'auto',
+    verify_digest: bool = False,
+) -> Optional[str]:
+    """Copy one pack file; returns the method used or 'unchanged' when skipped.
+
+    `mode` is one of COPY_MODES: 'copy' always does a plain copy, 'auto' skips
+    files that already match and otherwise tries a reflink, then
+    copy_file_range, then a plain copy; 'hardlink' tries a hardlink first.
+    """
     if not src.exists():
         warnings.append(f'missing file: {src}')
-        return
+        return None
+    if mode != 'copy':
+        if cache and cache.output_is_current(src, dst):
+            return 'unchanged'
+        if files_match(src, dst, verify_digest):
+            if cache:
+                cache.record_output(src, dst)
+            return 'unchanged'
     dst.parent.mkdir(parents=True, exist_ok=True)
-    shutil.copy2(src, dst)
+    method = transfer_file(src, dst, mode)
+    if cache:
+        cache.record_output(src, dst)
+    return method
+
+
+def write_text_atomic(path: Path, text: str) -> None:
+    """Replace `path` in one rename so readers never see a partly written file."""
+    tmp_path = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    try:
+        tmp_path.write_text(text, encoding='utf-8')
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def stagedef_arcname(stage_id: int, encoding: str = 'lzss') -> str:
+    return f'st{stage_id:03d}/STAGE{stage_id:03d}{STAGE_ENCODING_SUFFIXES[encoding]}'
+
+
+def encode_stagedef(src: Path, encoding: str) -> bytes:
+    """STAGE###.lz re-encoded for a pack with a non-'lzss' stage encoding."""
+    stagedef = lzss_decompress(src.read_bytes())
+    if encoding == 'deflate':
+        return zlib.compress(stagedef, STAGE_DEFLATE_LEVEL)
+    return stagedef
+
+
+@dataclass(frozen=True)
+class DerivedOutput:
+    """A pack output generated from a ROM file rather than copied."""
+    # Generator name and version; part of the cached digest, so a new version rewrites old outputs.
+    producer: str
+    make_data: Callable[[Path], bytes]
+
+
+def write_derived(
+    src: Path,
+    dst: Path,
+    output: DerivedOutput,
+    cache: Optional[BuildCache] = None,
+    mode: str = 'auto',
+    want_data: bool = False,
+) -> Tuple[str, Optional[bytes]]:
+    """Write `output.make_data(src)` to `dst`; returns (method, written bytes).
+
+    Used for re-encoded stagedefs, texture tiers and texture sidecars. An
+    output the cache knows was made from the current `src` by the same
+    producer is left alone, and its bytes are only read back when
+    `want_data` (for the zip) is set.
+    """
+    if mode != 'copy' and cache and cache.output_is_current(src, dst, output.producer):
+        return 'unchanged', dst.read_bytes() if want_data else None
+    data = output.make_data(src)
+    method = 'encoded'
+    if mode != 'copy' and dst.exists() and dst.stat().st_size == len(data) and dst.read_bytes() == data:
+        method = 'unchanged'
+    else:
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        dst.write_bytes(data)
+    if cache:
+        cache.record_output(src, dst, output.producer)
+    return method, data
+
+
+def transcode_derived_tpl(src: Path, make_tpl: Callable[[Path], bytes]) -> bytes:
+    """The .gtx sidecar for a TPL the pack writes rather than copies (a texture tier)."""
+    return transcode_tpl(make_tpl(src))
+
+
+@dataclass
+class TextureTier:
+    name: str
+    drop_mips: int
+    # (TPL archive path, tier archive path, source TPL, tier size)
+    files: List[Tuple[str, str, Path, int]]
+    full_bytes: int
+    bytes: int
+    # .gtx sidecar bytes for the full TPLs and for this tier's; known once the files are written.
+    full_sidecar_bytes: int = 0
+    sidecar_bytes: int = 0
+
+    @property
+    def saved_bytes(self) -> int:
+        return self.full_bytes - self.bytes
+
+    def count_sidecars(self, full_sidecar_bytes: int, sidecar_sizes: Dict[str, int]) -> None:
+        """Fill in the sidecar totals from the written sidecars' sizes (by archive path)."""
+        self.full_sidecar_bytes = full_sidecar_bytes
+        self.sidecar_bytes = full_sidecar_bytes + sum(
+            sidecar_sizes.get(sidecar_arcname(tier_arc), 0) - sidecar_sizes.get(sidecar_arcname(arcname), 0)
+            for arcname, tier_arc, _, _ in self.files
+        )
+
+    def manifest(self) -> Dict[str, object]:
+        return {
+            'dropMips': self.drop_mips,
+            'bytes': self.bytes,
+            'savedBytes': self.saved_bytes,
+            'files': {arcname: {'path': tier_arc, 'bytes': size} for arcname, tier_arc, _, size in self.files},
+        }
+
+
+def list_texture_tiers(pack_files: Iterable[Tuple[str, Path]]) -> List[TextureTier]:
+    """The texture tiers of a pack, from the TPL headers alone.
+
+    `bytes` is what a client on the tier downloads for TPLs: each tier file,
+    or the original where the tier has none.
+    """
+    tpls = [
+        (arcname, src, src.stat().st_size)
+        for arcname, src in pack_files
+        if arcname.endswith('.tpl') and src.exists()
+    ]
+    full_bytes = sum(size for _, _, size in tpls)
+    tiers: List[TextureTier] = []
+    for name, drop in TEXTURE_TIERS.items():
+        files: List[Tuple[str, str, Path, int]] = []
+        total = 0
+        for arcname, src, size in tpls:
+            trimmed = tier_size(src, drop)
+            if trimmed is None or trimmed >= size:
+                total += size
+                continue
+            files.append((arcname, tier_arcname(arcname, name), src, trimmed))
+            total += trimmed
+        tiers.append(TextureTier(name, drop, files, full_bytes, total))
+    return tiers
+
+
+def list_texture_sidecars(pack_files: Iterable[Tuple[str, Path]]) -> List[Tuple[str, str, Path]]:
+    """(TPL archive path, sidecar archive path, source TPL) for every pack TPL with textures to transcode."""
+    return [
+        (arcname, sidecar_arcname(arcname), src)
+        for arcname, src in pack_files
+        if arcname.endswith('.tpl') and src.exists() and tpl_has_gpu_textures(src)
+    ]
+
+
+def list_pack_files(
+    rom_dir: Path,
+    stage_ids: Iterable[int],
+    bg_names: Iterable[str],
+    stage_encoding: str = 'lzss',
+) -> List[Tuple[str, Path]]:
+    """Everything a pack contains, as (archive path, source file), in a fixed order.
+
+    With a non-'lzss' `stage_encoding` the stagedef entries keep their .lz
+    source but get the encoding's archive name; see `write_derived`.
+    """
+    init_dir = rom_dir / 'init'
+    stage_dir = rom_dir / 'stage'
+    bg_dir = rom_dir / 'bg'
+    pack_files: List[Tuple[str, Path]] = [
+        (f'init/{name}', init_dir / name)
+        for name in ('common.lz', 'common_p.lz', 'common.gma', 'common.tpl')
+    ]
+    for stage_id in stage_ids:
+        pack_files.append((stagedef_arcname(stage_id, stage_encoding), stage_dir / f'STAGE{stage_id:03d}.lz'))
+        for name in (f'st{stage_id:03d}.gma', f'st{stage_id:03d}.tpl'):
+            pack_files.append((f'st{stage_id:03d}/{name}', stage_dir / name))
+    for bg_name in sorted(bg_names):
+        for name in (f'{bg_name}.gma', f'{bg_name}.tpl'):
+            pack_files.append((f'bg/{name}', bg_dir / name))
+    return pack_files
 
 
 def find_lst_path(rom_dir: Path) -> Optional[Path]:
@@ -494,6 +1144,199 @@ def find_lst_path(rom_dir: Path) -> Optional[Path]:
     return None
 
 
+class RomSession:
+    """One extracted ROM folder, parsed lazily and at most once.
+
+    build_pack and the vanilla course loader need overlapping data (REL header,
+    sections and tables, stage names, the stage list); a session reads each of
+    them on first use and hands out the memoized result afterwards. The GUI
+    keeps one session per ROM folder and replaces it when `is_current()` says
+    the inputs changed on disk.
+
+    With a `LayoutDatabase`, offsets that had to be found by scanning and parsed
+    .lst symbols are remembered per file content, so later sessions for the same
+    ROM skip the scans entirely.
+    """
+
+    def __init__(self, rom_dir: Path, layouts: Optional[LayoutDatabase] = None) -> None:
+        self.rom_dir = rom_dir
+        self.layouts = layouts
+        self.main_loop_rel = rom_dir / 'mkb2.main_loop.rel'
+        self.stgname = rom_dir / 'stgname' / 'usa.str'
+        self.stage_dir = rom_dir / 'stage'
+        self._rel: Optional[RomFile] = None
+        self._memo: Dict[object, object] = {}
+        self._stamp = self._input_stamp()
+        # Extracted stage fogs, validated per file so one edited stage only invalidates itself.
+        self.stage_fog_memo: StageFogMemo = {}
+
+    def __enter__(self) -> 'RomSession':
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        # Parsed tables stay usable; the REL is mapped again if it is needed.
+        if self._rel is not None:
+            self._rel.close()
+            self._rel = None
+
+    def _input_stamp(self) -> Tuple[Optional[Tuple[int, int]], ...]:
+        stamp = []
+        for path in (self.main_loop_rel, self.stgname, self.stage_dir):
+            try:
+                stat = path.stat()
+            except OSError:
+                stamp.append(None)
+                continue
+            stamp.append((stat.st_size, stat.st_mtime_ns))
+        return tuple(stamp)
+
+    def is_current(self) -> bool:
+        """False once the REL, stage names or stage folder changed since the session opened."""
+        return self._input_stamp() == self._stamp
+
+    def rescan_stages(self) -> None:
+        """Forget the stage list after stage files were added or removed."""
+        for attr in ('stage_ids', 'stage_id_set'):
+            self.__dict__.pop(attr, None)
+        self._stamp = self._input_stamp()
+
+    def _memoized(self, key: object, compute):
+        if key not in self._memo:
+            self._memo[key] = compute()
+        return self._memo[key]
+
+    @property
+    def rel_data(self) -> memoryview:
+        if self._rel is None:
+            self._rel = RomFile(self.main_loop_rel)
+        return self._rel.view
+
+    @cached_property
+    def rel_header(self) -> RelHeader:
+        return parse_rel_header(self.rel_data)
+
+    @cached_property
+    def rel_sections(self) -> List[RelSection]:
+        return parse_rel_sections(self.rel_data, self.rel_header)
+
+    @cached_property
+    def relocations(self) -> RelocationIndex:
+        return parse_relocations(self.rel_data, self.rel_header)
+
+    @cached_property
+    def layout(self) -> Dict[str, object]:
+        """Offsets previously recorded for this REL (empty without a layout database)."""
+        return self.layouts.layout(self.main_loop_rel) if self.layouts else {}
+
+    def record_layout(self, **fields: object) -> None:
+        self.layout.update(fields)
+        if self.layouts:
+            self.layouts.record_layout(self.main_loop_rel, **fields)
+
+    def symbol_addresses(self, lst_path: Path) -> Dict[str, int]:
+        def load() -> Dict[str, int]:
+            symbols = self.layouts.symbols(lst_path) if self.layouts else None
+            if symbols is None:
+                symbols = parse_symbol_addresses(lst_path)
+                if self.layouts:
+                    self.layouts.record_symbols(lst_path, symbols)
+            return symbols
+        return self._memoized(('symbols', lst_path), load)
+
+    @cached_property
+    def stage_world_offset(self) -> int:
+        known = self.layout.get('stage_world_themes')
+        if isinstance(known, int):
+            return known
+        section5 = self.rel_sections[5]
+        stage_world_off = DEFAULT_STAGE_WORLD_FILE_OFF
+        if not (section5.offset <= stage_world_off < section5.offset + section5.size):
+            stage_world_off = find_stage_world_themes_offset(self.rel_data, section5)
+        if stage_world_off is None:
+            raise SystemExit('failed to locate STAGE_WORLD_THEMES table')
+        self.record_layout(stage_world_themes=stage_world_off)
+        return stage_world_off
+
+    @cached_property
+    def stage_world_themes(self) -> List[int]:
+        return parse_stage_world_themes_at(self.rel_data, self.stage_world_offset)
+
+    @cached_property
+    def stage_world_themes_full(self) -> List[int]:
+        """All `STAGE_WORLD_THEMES_FULL_LEN` entries, as the vanilla config dump reads them."""
+        return parse_stage_world_themes_at(self.rel_data, self.stage_world_offset, STAGE_WORLD_THEMES_FULL_LEN)
+
+    @cached_property
+    def theme_music_ids(self) -> Tuple[int, ...]:
+        return struct.unpack_from(f'>{THEME_MUSIC_COUNT}h', self.rel_data, DEFAULT_THEME_MUSIC_FILE_OFF)
+
+    @cached_property
+    def bonus_stage_ids(self) -> Tuple[int, ...]:
+        return struct.unpack_from(f'>{BONUS_STAGE_COUNT}i', self.rel_data, DEFAULT_BONUS_STAGES_FILE_OFF)
+
+    @cached_property
+    def stage_name_lines(self) -> List[str]:
+        return self.stgname.read_text(encoding='ascii', errors='ignore').splitlines()
+
+    @cached_property
+    def stage_names(self) -> Dict[int, str]:
+        return stage_names_from_lines(self.stage_name_lines)
+
+    @cached_property
+    def stage_ids(self) -> List[int]:
+        return list_stage_ids(self.stage_dir)
+
+    @cached_property
+    def stage_id_set(self) -> FrozenSet[int]:
+        return frozenset(self.stage_ids)
+
+    def section_base(self, stage_world_addr: int) -> int:
+        """Virtual address of section 5, anchored on the STAGE_WORLD_THEMES symbol."""
+        return resolve_section_base(stage_world_addr, self.stage_world_offset, self.rel_sections[5])
+
+    def linked_rel(self, stage_world_addr: int) -> LinkedRel:
+        def link() -> LinkedRel:
+            load_base = self.section_base(stage_world_addr) - self.rel_sections[5].offset
+            return LinkedRel(self.rel_data, self.rel_header, self.rel_sections, self.relocations, load_base)
+        return self._memoized(('linked_rel', stage_world_addr), link)
+
+    def rel_tables(
+        self,
+        stage_world_addr: int,
+        theme_lights_addr: int,
+        bg_list_addr: Optional[int] = None,
+    ) -> Tuple[List[int], List[Dict[str, object]], List[Optional[str]]]:
+        def load() -> Tuple[List[int], List[Dict[str, object]], List[Optional[str]]]:
+            section5 = self.rel_sections[5]
+            base_addr = self.section_base(stage_world_addr)
+            theme_lights = parse_theme_lights(self.rel_data, section5, base_addr, theme_lights_addr)
+            bg_names: List[Optional[str]] = []
+            if bg_list_addr is not None:
+                bg_names = parse_bg_name_list(self.linked_rel(stage_world_addr), bg_list_addr)
+            return self.stage_world_themes, theme_lights, bg_names
+        return self._memoized(('rel_tables', stage_world_addr, theme_lights_addr, bg_list_addr), load)
+
+    def course_data(
+        self,
+        course_cmd_counts: Optional[Dict[str, int]] = None,
+        world_offsets: Optional[List[int]] = None,
+        profiler: Profiler = NULL_PROFILER,
+    ) -> dict:
+        """Vanilla challenge/story tables, as returned by dump_vanilla_conf."""
+        from dump_vanilla_conf import parse_vanilla_course_data
+
+        key = (
+            'course_data',
+            tuple(sorted(course_cmd_counts.items())) if course_cmd_counts else None,
+            tuple(world_offsets) if world_offsets is not None else None,
+        )
+        return self._memoized(key, lambda: parse_vanilla_course_data(
+            self, course_cmd_counts=course_cmd_counts, world_offsets=world_offsets, profiler=profiler))
+
+
 def build_pack(
     rom_dir: Path,
     out_dir: Path,
@@ -504,177 +1347,283 @@ def build_pack(
     courses_data: Optional[Dict[str, object]] = None,
     lst_path: Optional[Path] = None,
     stage_time_overrides: Optional[Dict[int, int]] = None,
+    jobs: Optional[int] = None,
+    use_cache: bool = True,
+    cache_dir: Optional[Path] = None,
+    cache_max_bytes: int = DEFAULT_MAX_BYTES,
+    copy_mode: str = 'auto',
+    verify_copies: bool = False,
+    zip_only: bool = False,
+    zip_level: int = ZIP_DEFAULT_LEVEL,
+    zip_threads: int = 1,
+    session: Optional[RomSession] = None,
+    profiler: Profiler = NULL_PROFILER,
+    pool: Optional[Executor] = None,
+    progress: BuildProgress = NULL_PROGRESS,
+    stage_encoding: str = 'lzss',
+    gpu_textures: bool = False,
+    texture_tiers: bool = False,
 ) -> None:
-    main_loop_rel = rom_dir / 'mkb2.main_loop.rel'
-    stgname = rom_dir / 'stgname' / 'usa.str'
-    stage_dir = rom_dir / 'stage'
+    owns_session = session is None
+    if session is None:
+        session = RomSession(rom_dir, LayoutDatabase(cache_dir) if use_cache else None)
+    main_loop_rel = session.main_loop_rel
+    stgname = session.stgname
+    stage_dir = session.stage_dir
     bg_dir = rom_dir / 'bg'
     init_dir = rom_dir / 'init'
     lst_path = lst_path or find_lst_path(rom_dir)
 
     warnings: List[str] = []
+    cache: Optional[BuildCache] = None
 
-    if not main_loop_rel.exists():
-        raise SystemExit(f'missing {main_loop_rel}')
-    if not stgname.exists():
-        raise SystemExit(f'missing {stgname}')
-    if not stage_dir.exists():
-        raise SystemExit(f'missing {stage_dir}')
-    if not bg_dir.exists():
-        warnings.append(f'missing {bg_dir}')
-    if not init_dir.exists():
-        warnings.append(f'missing {init_dir}')
-    if lst_path and lst_path.exists():
-        symbols = parse_symbol_addresses(lst_path)
-    else:
-        symbols = DEFAULT_SYMBOLS.copy()
-        print('Warning: mkb2.us.lst not found; using default symbol addresses.')
-
-    rel_data = main_loop_rel.read_bytes()
-    rel_header = parse_rel_header(rel_data)
-    sections = parse_rel_sections(rel_data, rel_header)
-    relocs = parse_relocations(rel_data, rel_header)
-
-    section5 = sections[5]
-    stage_world_off = DEFAULT_STAGE_WORLD_FILE_OFF
-    if not (section5.offset <= stage_world_off < section5.offset + section5.size):
-        stage_world_off = find_stage_world_themes_offset(rel_data, section5)
-    if stage_world_off is None:
-        raise SystemExit('failed to locate STAGE_WORLD_THEMES table')
-
-    stage_world_addr = symbols.get('STAGE_WORLD_THEMES')
-    theme_lights_addr = symbols.get('theme_lights')
-    if stage_world_addr is None or theme_lights_addr is None:
-        raise SystemExit('missing symbols in mkb2.us.lst (STAGE_WORLD_THEMES/theme_lights)')
-
-    base_addr = resolve_section_base(stage_world_addr, stage_world_off, section5)
-
-    stage_world_themes = parse_stage_world_themes_at(rel_data, stage_world_off)
-
-    bg_names = BG_NAME_TABLE
-
-    theme_lights = parse_theme_lights(rel_data, section5, base_addr, theme_lights_addr)
-
-    stage_ids = list_stage_ids(stage_dir)
-    stage_names = read_stage_names(stgname)
-
-    courses = None
-    if courses_path:
-        courses = json.loads(courses_path.read_text(encoding='utf-8'))
-    elif courses_data is not None:
-        courses = courses_data
-
-    if courses:
-        requested = collect_stage_ids_from_courses(courses)
-        if requested:
-            available = set(stage_ids)
-            missing = sorted({sid for sid in requested if sid not in available})
-            if missing:
-                warnings.append(f'missing stages from courses: {missing}')
-            stage_ids = sorted({sid for sid in requested if sid in available})
-            stage_names = {k: v for k, v in stage_names.items() if k in stage_ids}
-
-    stage_env: Dict[str, Dict[str, object]] = {}
-    referenced_bgs = set()
-
-    for stage_id in stage_ids:
-        env: Dict[str, object] = {}
-        if stage_id < len(stage_world_themes):
-            theme_id = stage_world_themes[stage_id]
-            bg_name = bg_names[theme_id] if theme_id < len(bg_names) else None
-            if bg_name:
-                light = theme_lights[theme_id] if theme_id < len(theme_lights) else None
-                if light:
-                    env['bgInfo'] = {
-                        'fileName': bg_name,
-                        'clearColor': [1.0, 1.0, 1.0, 1.0],
-                        'ambientColor': light['ambient'],
-                        'infLightColor': light['infLight'],
-                        'infLightRotX': light['rotX'],
-                        'infLightRotY': light['rotY'],
-                    }
-                else:
-                    env['bgInfo'] = {
-                        'fileName': bg_name,
-                        'clearColor': [1.0, 1.0, 1.0, 1.0],
-                    }
-                referenced_bgs.add(bg_name)
-        fog = parse_stage_env(stage_dir / f'STAGE{stage_id:03d}.lz')
-        if fog:
-            fog_obj = {
-                'type': fog.fog_type,
-                'start': fog.start,
-                'end': fog.end,
-                'color': list(fog.color),
+    try:
+        progress.phase('inputs')
+        with profiler.span('inputs'):
+            if not main_loop_rel.exists():
+                raise SystemExit(f'missing {main_loop_rel}')
+            if not stgname.exists():
+                raise SystemExit(f'missing {stgname}')
+            if not stage_dir.exists():
+                raise SystemExit(f'missing {stage_dir}')
+            if not bg_dir.exists():
+                warnings.append(f'missing {bg_dir}')
+            if not init_dir.exists():
+                warnings.append(f'missing {init_dir}')
+            if lst_path and lst_path.exists():
+                symbols = session.symbol_addresses(lst_path)
+            else:
+                symbols = DEFAULT_SYMBOLS.copy()
+                print('Warning: mkb2.us.lst not found; using default symbol addresses.')
+
+            stage_world_addr = symbols.get('STAGE_WORLD_THEMES')
+            theme_lights_addr = symbols.get('theme_lights')
+            bg_list_addr = symbols.get('g_bg_filename_list')
+            if stage_world_addr is None or theme_lights_addr is None:
+                raise SystemExit('missing symbols in mkb2.us.lst (STAGE_WORLD_THEMES/theme_lights)')
+
+            cache = BuildCache(cache_dir or default_cache_dir(), cache_max_bytes) if use_cache else None
+
+        progress.phase('rel_tables')
+        with profiler.span('rel_tables'):
+            rel_tables = None
+            if cache:
+                rel_key = (f'{cache.file_digest(main_loop_rel)}:{stage_world_addr:08x}:{theme_lights_addr:08x}'
+                           f':{bg_list_addr or 0:08x}')
+                rel_tables = cache.get('rel_tables', rel_key)
+            if rel_tables is None:
+                rel_tables = session.rel_tables(stage_world_addr, theme_lights_addr, bg_list_addr)
+                profiler.count('rel_bytes_read', len(session.rel_data))
+                if cache:
+                    cache.put('rel_tables', rel_key, rel_tables)
+            stage_world_themes, theme_lights, bg_names = rel_tables
+            if not any(bg_names):
+                warnings.append('could not resolve g_bg_filename_list; using built-in bg name table')
+                bg_names = BG_NAME_TABLE
+
+        progress.phase('stage_list')
+        with profiler.span('stage_list'):
+            stage_ids = session.stage_ids
+            stage_names = session.stage_names
+
+            courses = None
+            if courses_path:
+                courses = json.loads(courses_path.read_text(encoding='utf-8'))
+            elif courses_data is not None:
+                courses = courses_data
+
+            if courses:
+                stage_ids, missing = select_stage_ids(stage_ids, courses)
+                if missing:
+                    warnings.append(f'missing stages from courses: {missing}')
+                stage_names = {k: v for k, v in stage_names.items() if k in stage_ids}
+
+        stage_env: Dict[str, Dict[str, object]] = {}
+        referenced_bgs = set()
+
+        progress.phase('stage_env', len(stage_ids))
+        with profiler.span('stage_env', stages=len(stage_ids)):
+            stage_fogs, fog_warnings = extract_stage_fogs(stage_dir, stage_ids, jobs or os.cpu_count() or 1, cache,
+                                                          profiler, pool, session.stage_fog_memo, progress)
+            warnings.extend(fog_warnings)
+
+        progress.phase('manifest')
+        with profiler.span('manifest'):
+            for stage_id in stage_ids:
+                env: Dict[str, object] = {}
+                if stage_id < len(stage_world_themes):
+                    theme_id = stage_world_themes[stage_id]
+                    bg_name = bg_names[theme_id] if theme_id < len(bg_names) else None
+                    if bg_name:
+                        light = theme_lights[theme_id] if theme_id < len(theme_lights) else None
+                        if light:
+                            env['bgInfo'] = {
+                                'fileName': bg_name,
+                                'clearColor': [1.0, 1.0, 1.0, 1.0],
+                                'ambientColor': light['ambient'],
+                                'infLightColor': light['infLight'],
+                                'infLightRotX': light['rotX'],
+                                'infLightRotY': light['rotY'],
+                            }
+                        else:
+                            env['bgInfo'] = {
+                                'fileName': bg_name,
+                                'clearColor': [1.0, 1.0, 1.0, 1.0],
+                            }
+                        referenced_bgs.add(bg_name)
+                fog_obj = stage_fogs.get(stage_id)
+                if fog_obj:
+                    env['fog'] = fog_obj
+                if env:
+                    stage_env[str(stage_id)] = env
+
+            if not referenced_bgs:
+                warnings.append('no backgrounds referenced from stage env data')
+
+            content = {
+                'stages': stage_ids,
+                'stageNames': {str(k): v for k, v in stage_names.items()},
+            }
+            if stage_time_overrides:
+                content['stageTimeOverrides'] = {str(k): v for k, v in stage_time_overrides.items()}
+            if stage_encoding != 'lzss':
+                content['stageEncoding'] = stage_encoding
+
+            pack_manifest = {
+                'id': pack_id,
+                'name': pack_name,
+                'gameSource': 'smb2',
+                'version': 1,
+                'content': content,
+                'courses': courses,
+                'stageEnv': stage_env,
             }
-            if fog.anim:
-                anim = {
-                    'start': fog.anim.start,
-                    'end': fog.anim.end,
-                    'r': fog.anim.r,
-                    'g': fog.anim.g,
-                    'b': fog.anim.b,
-                }
-                if any(anim.values()):
-                    fog_obj['anim'] = anim
-            env['fog'] = fog_obj
-        if env:
-            stage_env[str(stage_id)] = env
-
-    if not referenced_bgs:
-        warnings.append('no backgrounds referenced from stage env data')
-
-    content = {
-        'stages': stage_ids,
-        'stageNames': {str(k): v for k, v in stage_names.items()},
-    }
-    if stage_time_overrides:
-        content['stageTimeOverrides'] = {str(k): v for k, v in stage_time_overrides.items()}
-
-    pack_manifest = {
-        'id': pack_id,
-        'name': pack_name,
-        'gameSource': 'smb2',
-        'version': 1,
-        'content': content,
-        'courses': courses,
-        'stageEnv': stage_env,
-    }
-
-    out_dir.mkdir(parents=True, exist_ok=True)
-    (out_dir / 'init').mkdir(exist_ok=True)
-    (out_dir / 'bg').mkdir(exist_ok=True)
-
-    # Copy init
-    copy_file(init_dir / 'common.lz', out_dir / 'init' / 'common.lz', warnings)
-    copy_file(init_dir / 'common_p.lz', out_dir / 'init' / 'common_p.lz', warnings)
-    copy_file(init_dir / 'common.gma', out_dir / 'init' / 'common.gma', warnings)
-    copy_file(init_dir / 'common.tpl', out_dir / 'init' / 'common.tpl', warnings)
 
-    # Copy stages
-    for stage_id in stage_ids:
-        stage_folder = out_dir / f'st{stage_id:03d}'
-        stage_folder.mkdir(exist_ok=True)
-        copy_file(stage_dir / f'STAGE{stage_id:03d}.lz', stage_folder / f'STAGE{stage_id:03d}.lz', warnings)
-        copy_file(stage_dir / f'st{stage_id:03d}.gma', stage_folder / f'st{stage_id:03d}.gma', warnings)
-        copy_file(stage_dir / f'st{stage_id:03d}.tpl', stage_folder / f'st{stage_id:03d}.tpl', warnings)
-
-    # Copy backgrounds
-    for bg_name in sorted(referenced_bgs):
-        copy_file(bg_dir / f'{bg_name}.gma', out_dir / 'bg' / f'{bg_name}.gma', warnings)
-        copy_file(bg_dir / f'{bg_name}.tpl', out_dir / 'bg' / f'{bg_name}.tpl', warnings)
-
-    # Write pack.json
-    (out_dir / 'pack.json').write_text(json.dumps(pack_manifest, indent=2), encoding='utf-8')
-
-    if zip_output:
-        zip_path = out_dir.with_suffix('.zip')
-        with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
-            for root, _, files in os.walk(out_dir):
-                for name in files:
-                    file_path = Path(root) / name
-                    rel_path = file_path.relative_to(out_dir)
-                    zf.write(file_path, rel_path.as_posix())
+            pack_files = list_pack_files(rom_dir, stage_ids, referenced_bgs, stage_encoding)
+            # Archive path -> generator for outputs written from a ROM file rather than copied.
+            derived: Dict[str, DerivedOutput] = {}
+            if stage_encoding != 'lzss':
+                encode = DerivedOutput(f'stagedef-{stage_encoding}:{STAGE_ENCODER_VERSION}',
+                                       partial(encode_stagedef, encoding=stage_encoding))
+                derived.update((stagedef_arcname(stage_id, stage_encoding), encode) for stage_id in stage_ids)
+            tiers: List[TextureTier] = []
+            sidecars: List[Tuple[str, str, Path]] = []
+            if texture_tiers:
+                with profiler.span('texture_tiers'):
+                    tiers = list_texture_tiers(pack_files)
+                content['textureTiers'] = {tier.name: tier.manifest() for tier in tiers}
+                for tier in tiers:
+                    trim = DerivedOutput(f'tpl-{tier.name}:{TIER_ENCODER_VERSION}',
+                                         partial(trim_tpl_file, drop=tier.drop_mips))
+                    pack_files.extend((tier_arc, src) for _, tier_arc, src, _ in tier.files)
+                    derived.update((tier_arc, trim) for _, tier_arc, _, _ in tier.files)
+            if gpu_textures:
+                with profiler.span('texture_scan'):
+                    sidecars = list_texture_sidecars(pack_files)
+                if sidecars:
+                    content['gpuTextures'] = {arcname: sidecar for arcname, sidecar, _ in sidecars}
+                pack_files.extend((sidecar, src) for _, sidecar, src in sidecars)
+                for arcname, sidecar, _ in sidecars:
+                    # Tier TPLs are written by the pack, so their sidecars transcode the tier's bytes.
+                    tpl_output = derived.get(arcname)
+                    producer = f'gtx:{GTX_ENCODER_VERSION}'
+                    if tpl_output:
+                        derived[sidecar] = DerivedOutput(f'{producer}/{tpl_output.producer}', partial(
+                            transcode_derived_tpl, make_tpl=tpl_output.make_data))
+                    else:
+                        derived[sidecar] = DerivedOutput(producer, transcode_tpl_file)
+
+            manifest_text = json.dumps(pack_manifest, indent=2)
+            write_folder = not zip_only
+            zip_writer = PackZipWriter(out_dir.with_suffix('.zip'), zip_level, zip_threads) if zip_output or zip_only else None
+
+            if write_folder:
+                out_dir.mkdir(parents=True, exist_ok=True)
+                (out_dir / 'init').mkdir(exist_ok=True)
+                (out_dir / 'bg').mkdir(exist_ok=True)
+
+        progress.phase('files', len(pack_files))
+        with profiler.span('files'):
+            # Copy files and stream them into the zip in the same pass.
+            sidecar_names = {sidecar for _, sidecar, _ in sidecars}
+            sidecar_sizes: Dict[str, int] = {}
+            try:
+                if zip_writer:
+                    zip_writer.add_bytes('pack.json', manifest_text.encode('utf-8'))
+                done_bytes = 0
+                for done, (arcname, src) in enumerate(pack_files):
+                    progress.step(done, len(pack_files), done_bytes)
+                    if not src.exists():
+                        warnings.append(f'missing file: {src}')
+                        continue
+                    output = derived.get(arcname)
+                    if output:
+                        data = None
+                        if write_folder:
+                            method, data = write_derived(src, out_dir / arcname, output, cache, copy_mode,
+                                                         want_data=zip_writer is not None)
+                            profiler.count(f'files_{method}')
+                            if method != 'unchanged':
+                                profiler.count('bytes_written', len(data))
+                        if zip_writer:
+                            if data is None:
+                                data = output.make_data(src)
+                            zip_writer.add_bytes(arcname, data)
+                        if arcname in sidecar_names:
+                            sidecar_sizes[arcname] = (
+                                len(data) if data is not None else (out_dir / arcname).stat().st_size
+                            )
+                        if progress.enabled:
+                            done_bytes += src.stat().st_size
+                        continue
+                    if write_folder:
+                        method = copy_file(src, out_dir / arcname, warnings, cache, copy_mode, verify_copies)
+                        if profiler.enabled and method:
+                            profiler.count(f'files_{method}')
+                            if method != 'unchanged':
+                                profiler.count('bytes_written', src.stat().st_size)
+                    if zip_writer:
+                        zip_writer.add_file(arcname, src)
+                    if progress.enabled:
+                        done_bytes += src.stat().st_size
+                progress.step(len(pack_files), len(pack_files), done_bytes)
+            except BaseException:
+                if zip_writer:
+                    zip_writer.abort()
+                raise
+            if zip_writer:
+                zip_writer.close()
+                profiler.count('bytes_written', out_dir.with_suffix('.zip').stat().st_size)
+            if write_folder:
+                # pack.json goes last, so a cancelled or failed build leaves the previous manifest
+                # rather than one listing files that were never written. Left untouched when
+                # nothing in it changed.
+                manifest_path = out_dir / 'pack.json'
+                if not manifest_path.exists() or manifest_path.read_text(encoding='utf-8') != manifest_text:
+                    write_text_atomic(manifest_path, manifest_text)
+                    profiler.count('bytes_written', len(manifest_text))
+    finally:
+        # Also on errors and cancellation, so the cache's transaction is not left open.
+        if cache:
+            with profiler.span('cache_close'):
+                cache.close()
+        if owns_session:
+            session.close()
+
+    # Clients load a TPL's sidecar alongside it, so sidecars count towards the texture download.
+    tier_arcs = {tier_arc for tier in tiers for _, tier_arc, _, _ in tier.files}
+    full_sidecars = [sidecar for arcname, sidecar, _ in sidecars if arcname not in tier_arcs]
+    full_sidecar_bytes = sum(sidecar_sizes.get(sidecar, 0) for sidecar in full_sidecars)
+    if full_sidecars:
+        print(f'GPU texture sidecars: {full_sidecar_bytes} bytes across {len(full_sidecars)} files')
+    for tier in tiers:
+        tier.count_sidecars(full_sidecar_bytes, sidecar_sizes)
+        full = tier.full_bytes + tier.full_sidecar_bytes
+        saved = full - tier.bytes - tier.sidecar_bytes
+        percent = 100 * saved / full if full else 0
+        print(f'Texture tier {tier.name}: {tier.bytes + tier.sidecar_bytes} of {full} '
+              f'{"TPL + .gtx" if sidecars else "TPL"} bytes, {saved} saved ({percent:.1f}%) '
+              f'across {len(tier.files)} files')
 
     if warnings:
         print('Warnings:')
@@ -684,13 +1633,14 @@ def build_pack(
 
 def load_vanilla_courses_from_rom(
     rom_dir: Path,
+    session: Optional[RomSession] = None,
 ) -> Tuple[Dict[str, List[Tuple[int, bool]]], List[List[int]], Dict[int, int], List[str]]:
     try:
         from dump_vanilla_conf import load_vanilla_course_data
     except Exception as exc:
         raise RuntimeError(f'failed to import dump_vanilla_conf: {exc}') from exc
 
-    data = load_vanilla_course_data(rom_dir)
+    data = load_vanilla_course_data(rom_dir, session=session)
     challenge = data.get('challenge') if isinstance(data, dict) else None
     story = data.get('story') if isinstance(data, dict) else None
 
@@ -873,15 +1823,122 @@ def main() -> None:
     parser.add_argument('--courses', type=Path, help='Optional JSON file defining course lists')
     parser.add_argument('--lst', type=Path, help='Path to mkb2.us.lst (optional)')
     parser.add_argument('--zip', action='store_true', help='Also emit pack.zip')
+    parser.add_argument('--zip-only', action='store_true', help='Emit only pack.zip, without the pack folder')
+    parser.add_argument('--zip-level', type=int, choices=range(0, 10), default=ZIP_DEFAULT_LEVEL,
+                        metavar='0-9', help='Deflate level for .gma/.tpl/pack.json zip entries')
+    parser.add_argument('--zip-threads', type=int, default=1,
+                        help='Threads used to deflate zip entries (output is identical for any count)')
+    parser.add_argument('--jobs', type=int, help='Worker processes for stage env extraction (default: CPU count)')
+    parser.add_argument('--no-cache', action='store_true', help='Disable the persistent build cache')
+    parser.add_argument('--cache-dir', type=Path, help='Build cache folder (default: ~/.cache/smb2_pack_builder)')
+    parser.add_argument('--cache-max-mb', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help='Evict least-recently-used cache entries beyond this size')
+    parser.add_argument('--copy-mode', choices=COPY_MODES, default='auto',
+                        help='auto: skip unchanged files, reflink or copy_file_range when possible; '
+                             'hardlink: also hardlink ROM files (do not edit the output in place); '
+                             'copy: always copy')
+    parser.add_argument('--stage-encoding', choices=STAGE_ENCODINGS, default='lzss',
+                        help='lzss: copy STAGE###.lz as-is; raw: decompressed stagedef (STAGE###.bin); '
+                             'deflate: zlib stream the browser inflates natively (STAGE###.zlib)')
+    parser.add_argument('--gpu-textures', action='store_true',
+                        help='Also write a .gtx sidecar per TPL with its textures pre-decoded to the smallest '
+                             'lossless GPU format (BC1 for CMPR) that clients can upload without decoding')
+    parser.add_argument('--texture-tiers', action='store_true',
+                        help='Also write lower-resolution TPL tiers without the top 1 (mid) or 2 (low) mip levels '
+                             'and list them in pack.json for clients that ask for tier=mid/low')
+    parser.add_argument('--verify-copies', action='store_true',
+                        help='Compare file contents instead of size+mtime before skipping a copy')
+    parser.add_argument('--profile', nargs='?', type=Path, const=True, metavar='TRACE_JSON',
+                        help='Print per-phase/per-stage timings and write a Chrome trace '
+                             '(default: <out>.trace.json)')
+    parser.add_argument('--batch', type=Path, metavar='SPEC',
+                        help='Build every pack listed in a JSON/TOML spec file (see pack_batch.py)')
+    parser.add_argument('--batch-report', type=Path, help='With --batch: write per-pack results as JSON')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running and rebuild the pack whenever its inputs change')
+    parser.add_argument('--watch-interval', type=float, default=0.5, metavar='SECONDS',
+                        help='With --watch: how often to poll the inputs')
     parser.add_argument('--gui', action='store_true', help='Launch a simple GUI')
     args = parser.parse_args()
 
     if args.gui:
         run_gui()
         return
+    if args.batch:
+        run_batch(args)
+        return
     if not args.rom or not args.out or not args.id or not args.name:
         parser.error('--rom, --out, --id, and --name are required unless --gui is used')
-    build_pack(args.rom, args.out, args.id, args.name, args.courses, args.zip, lst_path=args.lst)
+    if args.watch and args.profile:
+        parser.error('--profile cannot be combined with --watch')
+    profiler = Profiler() if args.profile else NULL_PROFILER
+
+    def build(session: Optional[RomSession] = None) -> None:
+        build_pack(
+            args.rom,
+            args.out,
+            args.id,
+            args.name,
+            args.courses,
+            args.zip,
+            lst_path=args.lst,
+            jobs=args.jobs,
+            use_cache=not args.no_cache,
+            cache_dir=args.cache_dir,
+            cache_max_bytes=args.cache_max_mb * 1024 * 1024,
+            copy_mode=args.copy_mode,
+            verify_copies=args.verify_copies,
+            zip_only=args.zip_only,
+            zip_level=args.zip_level,
+            zip_threads=args.zip_threads,
+            session=session,
+            profiler=profiler,
+            stage_encoding=args.stage_encoding,
+            gpu_textures=args.gpu_textures,
+            texture_tiers=args.texture_tiers,
+        )
+
+    if args.watch:
+        from pack_watch import watch_pack
+
+        watch_pack(args.rom, build, (args.courses, args.lst or find_lst_path(args.rom)),
+                   use_cache=not args.no_cache, cache_dir=args.cache_dir, interval=args.watch_interval)
+        return
+    with profiler.span('build_pack'):
+        build()
+    if args.profile:
+        profiler.close()
+        trace_path = args.out.with_name(args.out.name + '.trace.json') if args.profile is True else args.profile
+        profiler.print_summary()
+        profiler.write_trace(trace_path)
+        print(f'Trace written to {trace_path}')
+
+
+def run_batch(args: argparse.Namespace) -> None:
+    from pack_batch import build_batch, print_batch_summary, write_batch_report
+
+    profiler = Profiler() if args.profile else NULL_PROFILER
+    with profiler.span('batch'):
+        results = build_batch(
+            args.batch,
+            jobs=args.jobs,
+            use_cache=not args.no_cache,
+            cache_dir=args.cache_dir,
+            cache_max_bytes=args.cache_max_mb * 1024 * 1024,
+            verify_copies=args.verify_copies,
+            profiler=profiler,
+        )
+    print_batch_summary(results)
+    if args.batch_report:
+        write_batch_report(results, args.batch_report)
+    if args.profile:
+        profiler.close()
+        trace_path = args.batch.with_suffix('.trace.json') if args.profile is True else args.profile
+        profiler.print_summary()
+        profiler.write_trace(trace_path)
+        print(f'Trace written to {trace_path}')
+    if not all(result.ok for result in results):
+        raise SystemExit(1)
 
 
 def run_gui() -> None:
@@ -894,7 +1951,7 @@ def run_gui() -> None:
 
     root = tk.Tk()
     root.title('SMB2 Pack Builder')
-    root.geometry('920x640')
+    root.geometry('1160x640')
 
     frame = ttk.Frame(root, padding=10)
     frame.pack(fill=tk.BOTH, expand=True)
@@ -911,6 +1968,111 @@ def run_gui() -> None:
 
     last_rom_dir = ''
     last_out_dir = ''
+    rom_session: Optional[RomSession] = None
+
+    def get_rom_session(rom_path: Path) -> RomSession:
+        # Reuse parsed ROM data across button clicks until the folder or its files change.
+        nonlocal rom_session
+        if rom_session is None or rom_session.rom_dir != rom_path or not rom_session.is_current():
+            if rom_session is not None:
+                rom_session.close()
+            rom_session = RomSession(rom_path, LayoutDatabase())
+        return rom_session
+
+    # Builds and ROM loads run one at a time on a single worker thread, which
+    # also owns `rom_session` (its sqlite connections belong to the thread that
+    # opened them). Progress and results come back to Tk through `ui_events`.
+    worker_jobs: queue.Queue = queue.Queue()
+    ui_events: queue.Queue = queue.Queue()
+    running_job: Optional[BuildProgress] = None
+    phase_labels = {
+        'inputs': 'Checking inputs',
+        'rel_tables': 'Reading REL tables',
+        'stage_list': 'Selecting stages',
+        'stage_env': 'Extracting stage fog',
+        'manifest': 'Writing pack.json',
+        'files': 'Copying files',
+        'load_courses': 'Loading courses from ROM',
+    }
+
+    def worker_loop() -> None:
+        while True:
+            worker_jobs.get()()
+
+    threading.Thread(target=worker_loop, name='pack-builder-worker', daemon=True).start()
+
+    def run_in_background(
+        title: str,
+        work: Callable[[BuildProgress], object],
+        on_done: Callable[[object], None],
+    ) -> None:
+        nonlocal running_job
+        if running_job is not None:
+            messagebox.showinfo('Busy', 'Another build or load is still running; wait for it or cancel it.')
+            return
+        progress = BuildProgress(lambda event: ui_events.put(('progress', event)))
+        running_job = progress
+        status_var.set(f'{title}...')
+        progress_bar.configure(mode='indeterminate')
+        progress_bar.start(50)
+        cancel_button.state(['!disabled'])
+
+        def job() -> None:
+            # SystemExit too: build_pack raises it for missing inputs.
+            try:
+                result, error = work(progress), None
+            except (Exception, SystemExit) as exc:
+                result, error = None, exc
+            ui_events.put(('done', (title, on_done, result, error)))
+
+        worker_jobs.put(job)
+
+    def show_progress(event: ProgressEvent) -> None:
+        text = phase_labels.get(event.phase, event.phase)
+        if event.total:
+            progress_bar.stop()
+            progress_bar.configure(mode='determinate', maximum=event.total, value=event.done)
+            text += f' ({event.done}/{event.total})'
+        if event.bytes:
+            text += f', {event.bytes / 1e6:.1f} MB'
+        status_var.set(text)
+
+    def finish_job(title: str, on_done: Callable[[object], None], result: object, error: Optional[BaseException]):
+        nonlocal running_job
+        running_job = None
+        progress_bar.stop()
+        progress_bar.configure(mode='determinate', value=0)
+        cancel_button.state(['disabled'])
+        if isinstance(error, BuildCancelled):
+            status_var.set(f'{title} cancelled.')
+        elif error is not None:
+            status_var.set(f'{title} failed.')
+            messagebox.showerror(f'{title} failed', str(error) or type(error).__name__)
+        else:
+            status_var.set(f'{title} done.')
+            on_done(result)
+
+    def poll_ui_events() -> None:
+        # Only the newest progress event is drawn; the worker may post thousands.
+        latest: Optional[ProgressEvent] = None
+        while True:
+            try:
+                kind, payload = ui_events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'progress':
+                latest = payload
+            else:
+                latest = None
+                finish_job(*payload)
+        if latest is not None and running_job is not None and not running_job.cancelled:
+            show_progress(latest)
+        root.after(50, poll_ui_events)
+
+    def cancel_clicked():
+        if running_job is not None:
+            running_job.cancel()
+            status_var.set('Cancelling...')
 
     def browse_dir(target_var: tk.StringVar, last_dir_attr: str):
         nonlocal last_rom_dir, last_out_dir
@@ -955,20 +2117,20 @@ def run_gui() -> None:
 
     challenge_frame = ttk.LabelFrame(courses_frame, text='Challenge Courses', padding=10)
     story_frame = ttk.LabelFrame(courses_frame, text='Story Worlds', padding=10)
+    picker_frame = ttk.LabelFrame(courses_frame, text='Stages', padding=10)
     challenge_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(0, 10))
-    story_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+    story_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(0, 10))
+    picker_frame.pack(side=tk.LEFT, fill=tk.Y)
 
-    challenge_courses: Dict[str, List[Tuple[int, bool]]] = {}
-    stage_time_overrides: Dict[int, int] = {}
+    courses = CourseModel()
     selected_course_name = tk.StringVar()
 
-    course_list = tk.Listbox(challenge_frame, height=8)
+    course_list = tk.Listbox(challenge_frame, height=8, exportselection=False)
     course_list.pack(fill=tk.X, pady=(0, 6))
 
     def refresh_course_list():
         course_list.delete(0, tk.END)
-        for name in sorted(challenge_courses.keys()):
-            course_list.insert(tk.END, name)
+        course_list.insert(tk.END, *courses.course_names)
 
     def on_course_select(_event=None):
         selection = course_list.curselection()
@@ -993,27 +2155,24 @@ def run_gui() -> None:
         if not name:
             messagebox.showerror('Missing name', 'Enter a course name.')
             return
-        if name in challenge_courses:
+        if name in courses.challenge_courses:
             messagebox.showerror('Duplicate name', 'Course already exists.')
             return
-        challenge_courses[name] = []
+        course_list.insert(courses.add_course(name), name)
         course_name_var.set('')
-        refresh_course_list()
 
     def remove_course():
         selection = course_list.curselection()
         if not selection:
             return
-        name = course_list.get(selection[0])
-        challenge_courses.pop(name, None)
+        course_list.delete(courses.remove_course(course_list.get(selection[0])))
         selected_course_name.set('')
-        refresh_course_list()
         refresh_stage_list()
 
     ttk.Button(course_controls, text='Add course', command=add_course).pack(side=tk.LEFT, padx=(0, 6))
     ttk.Button(course_controls, text='Remove', command=remove_course).pack(side=tk.LEFT)
 
-    stage_list = tk.Listbox(challenge_frame, height=10)
+    stage_list = tk.Listbox(challenge_frame, height=10, exportselection=False)
     stage_list.pack(fill=tk.BOTH, expand=True, pady=(0, 6))
 
     def refresh_stage_list():
@@ -1021,11 +2180,13 @@ def run_gui() -> None:
         name = selected_course_name.get()
         if not name:
             return
-        for stage_id, bonus in challenge_courses.get(name, []):
-            time_override = stage_time_overrides.get(stage_id)
-            time_label = f' ({time_override // 60}s)' if time_override else ''
-            label = f'{stage_id}{time_label} {"(bonus)" if bonus else ""}'
-            stage_list.insert(tk.END, label.strip())
+        stage_list.insert(tk.END, *(courses.stage_label(stage_id, bonus)
+                                    for stage_id, bonus in courses.challenge_courses.get(name, [])))
+
+    def set_stage_row(idx: int, label: str) -> None:
+        stage_list.delete(idx)
+        stage_list.insert(idx, label)
+        stage_list.selection_set(idx)
 
     stage_controls = ttk.Frame(challenge_frame)
     stage_controls.pack(fill=tk.X)
@@ -1050,41 +2211,32 @@ def run_gui() -> None:
             messagebox.showerror('Invalid stage', 'Stage ID must be a number.')
             return
         raw_time = stage_time_var.get().strip()
-        if raw_time:
-            if not raw_time.isdigit():
-                messagebox.showerror('Invalid time', 'Time must be a number of seconds.')
-                return
-            stage_time_overrides[int(raw)] = int(raw_time) * 60
+        if raw_time and not raw_time.isdigit():
+            messagebox.showerror('Invalid time', 'Time must be a number of seconds.')
+            return
         stage_id = int(raw)
         bonus = bool(stage_bonus_var.get())
-        challenge_courses[name].append((stage_id, bonus))
+        relabel = courses.set_time_override(stage_id, int(raw_time) * 60 if raw_time else None)
+        courses.add_stage(name, stage_id, bonus)
+        if relabel and courses.stage_in_use(stage_id):
+            # Rows already showing this stage carry its time limit too.
+            refresh_stage_list()
+        else:
+            stage_list.insert(tk.END, courses.stage_label(stage_id, bonus))
         stage_id_var.set('')
         stage_time_var.set('')
         stage_bonus_var.set(False)
-        refresh_stage_list()
         stage_id_entry.focus_set()
 
-    def stage_in_use(stage_id: int) -> bool:
-        for entries in challenge_courses.values():
-            if any(stage_id == sid for sid, _ in entries):
-                return True
-        for world in story_worlds:
-            if stage_id in world:
-                return True
-        return False
-
     def remove_stage():
         name = selected_course_name.get()
         selection = stage_list.curselection()
         if not name or not selection:
             return
         idx = selection[0]
-        items = challenge_courses.get(name, [])
-        if 0 <= idx < len(items):
-            stage_id, _ = items.pop(idx)
-            if not stage_in_use(stage_id):
-                stage_time_overrides.pop(stage_id, None)
-        refresh_stage_list()
+        if 0 <= idx < len(courses.challenge_courses.get(name, [])):
+            courses.remove_stage(name, idx)
+            stage_list.delete(idx)
 
     def toggle_bonus():
         name = selected_course_name.get()
@@ -1092,11 +2244,8 @@ def run_gui() -> None:
         if not name or not selection:
             return
         idx = selection[0]
-        items = challenge_courses.get(name, [])
-        if 0 <= idx < len(items):
-            stage_id, bonus = items[idx]
-            items[idx] = (stage_id, not bonus)
-        refresh_stage_list()
+        if 0 <= idx < len(courses.challenge_courses.get(name, [])):
+            set_stage_row(idx, courses.stage_label(*courses.toggle_bonus(name, idx)))
 
     ttk.Button(stage_controls, text='Add stage', command=add_stage).pack(side=tk.LEFT, padx=(0, 6))
     ttk.Button(stage_controls, text='Remove', command=remove_stage).pack(side=tk.LEFT, padx=(0, 6))
@@ -1104,14 +2253,12 @@ def run_gui() -> None:
     stage_id_entry.bind('<Return>', lambda _event: add_stage())
     stage_time_entry.bind('<Return>', lambda _event: add_stage())
 
-    story_worlds: List[List[int]] = []
-    world_list = tk.Listbox(story_frame, height=8)
+    world_list = tk.Listbox(story_frame, height=8, exportselection=False)
     world_list.pack(fill=tk.X, pady=(0, 6))
 
     def refresh_world_list():
         world_list.delete(0, tk.END)
-        for idx in range(len(story_worlds)):
-            world_list.insert(tk.END, f'World {idx + 1}')
+        world_list.insert(tk.END, *(f'World {idx + 1}' for idx in range(len(courses.story_worlds))))
 
     def on_world_select(_event=None):
         refresh_world_stage_list()
@@ -1122,23 +2269,25 @@ def run_gui() -> None:
     world_controls.pack(fill=tk.X, pady=(0, 10))
 
     def add_world():
-        story_worlds.append([])
-        refresh_world_list()
+        idx = courses.add_world()
+        world_list.insert(tk.END, f'World {idx + 1}')
 
     def remove_world():
         selection = world_list.curselection()
         if not selection:
             return
         idx = selection[0]
-        if 0 <= idx < len(story_worlds):
-            story_worlds.pop(idx)
-        refresh_world_list()
+        if 0 <= idx < len(courses.story_worlds):
+            courses.remove_world(idx)
+            # Rows are labelled by position, so dropping the last one renumbers the rest.
+            world_list.delete(tk.END)
+            world_list.selection_clear(0, tk.END)
         refresh_world_stage_list()
 
     ttk.Button(world_controls, text='Add world', command=add_world).pack(side=tk.LEFT, padx=(0, 6))
     ttk.Button(world_controls, text='Remove', command=remove_world).pack(side=tk.LEFT)
 
-    world_stage_list = tk.Listbox(story_frame, height=10)
+    world_stage_list = tk.Listbox(story_frame, height=10, exportselection=False)
     world_stage_list.pack(fill=tk.BOTH, expand=True, pady=(0, 6))
 
     def refresh_world_stage_list():
@@ -1146,9 +2295,7 @@ def run_gui() -> None:
         selection = world_list.curselection()
         if not selection:
             return
-        idx = selection[0]
-        for stage_id in story_worlds[idx]:
-            world_stage_list.insert(tk.END, str(stage_id))
+        world_stage_list.insert(tk.END, *map(str, courses.story_worlds[selection[0]]))
 
     world_stage_controls = ttk.Frame(story_frame)
     world_stage_controls.pack(fill=tk.X)
@@ -1171,16 +2318,16 @@ def run_gui() -> None:
             messagebox.showerror('Invalid stage', 'Stage ID must be a number.')
             return
         raw_time = world_stage_time_var.get().strip()
-        if raw_time:
-            if not raw_time.isdigit():
-                messagebox.showerror('Invalid time', 'Time must be a number of seconds.')
-                return
-            stage_time_overrides[int(raw)] = int(raw_time) * 60
-        idx = selection[0]
-        story_worlds[idx].append(int(raw))
+        if raw_time and not raw_time.isdigit():
+            messagebox.showerror('Invalid time', 'Time must be a number of seconds.')
+            return
+        stage_id = int(raw)
+        if courses.set_time_override(stage_id, int(raw_time) * 60 if raw_time else None):
+            refresh_stage_list()
+        courses.add_world_stage(selection[0], stage_id)
+        world_stage_list.insert(tk.END, str(stage_id))
         world_stage_id_var.set('')
         world_stage_time_var.set('')
-        refresh_world_stage_list()
         world_stage_entry.focus_set()
 
     def remove_world_stage():
@@ -1190,64 +2337,140 @@ def run_gui() -> None:
             return
         world_idx = selection[0]
         stage_idx = stage_selection[0]
-        if 0 <= stage_idx < len(story_worlds[world_idx]):
-            stage_id = story_worlds[world_idx].pop(stage_idx)
-            if not stage_in_use(stage_id):
-                stage_time_overrides.pop(stage_id, None)
-        refresh_world_stage_list()
+        if 0 <= stage_idx < len(courses.story_worlds[world_idx]):
+            courses.remove_world_stage(world_idx, stage_idx)
+            world_stage_list.delete(stage_idx)
 
     ttk.Button(world_stage_controls, text='Add stage', command=add_world_stage).pack(side=tk.LEFT, padx=(0, 6))
     ttk.Button(world_stage_controls, text='Remove', command=remove_world_stage).pack(side=tk.LEFT)
     world_stage_entry.bind('<Return>', lambda _event: add_world_stage())
     world_stage_time_entry.bind('<Return>', lambda _event: add_world_stage())
 
+    # Stage picker: the ROM's stages, filtered by id or name. Only the rows in
+    # view exist in the listbox, so thousands of stages scroll and filter
+    # without Tk holding a row for each.
+    picker_rows = 16
+    picker_stages: List[Tuple[int, str]] = []
+    picker_matches: List[Tuple[int, str]] = []
+    picker_first = 0
+    picker_filter_var = tk.StringVar()
+
+    ttk.Entry(picker_frame, textvariable=picker_filter_var, width=24).pack(fill=tk.X, pady=(0, 6))
+    picker_body = ttk.Frame(picker_frame)
+    picker_body.pack(fill=tk.BOTH, expand=True)
+    picker_list = tk.Listbox(picker_body, height=picker_rows, width=28, exportselection=False)
+    picker_scroll = ttk.Scrollbar(picker_body, orient=tk.VERTICAL)
+    picker_list.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+    picker_scroll.pack(side=tk.LEFT, fill=tk.Y)
+
+    def render_picker():
+        total = len(picker_matches)
+        picker_list.delete(0, tk.END)
+        picker_list.insert(tk.END, *(f'{stage_id:3d}  {name}' for stage_id, name in
+                                     picker_matches[picker_first:picker_first + picker_rows]))
+        if total > picker_rows:
+            picker_scroll.set(picker_first / total, (picker_first + picker_rows) / total)
+        else:
+            picker_scroll.set(0.0, 1.0)
+
+    def scroll_picker_to(first: int):
+        nonlocal picker_first
+        first = max(0, min(first, len(picker_matches) - picker_rows))
+        if first != picker_first:
+            picker_first = first
+            render_picker()
+
+    def on_picker_scroll(*args):
+        if args[0] == 'moveto':
+            scroll_picker_to(round(float(args[1]) * len(picker_matches)))
+        elif args[0] == 'scroll':
+            step = picker_rows if args[2] == 'pages' else 1
+            scroll_picker_to(picker_first + int(args[1]) * step)
+
+    def on_picker_wheel(event):
+        if getattr(event, 'num', None) == 4 or getattr(event, 'delta', 0) > 0:
+            scroll_picker_to(picker_first - 3)
+        else:
+            scroll_picker_to(picker_first + 3)
+        return 'break'
+
+    def filter_picker(*_args):
+        nonlocal picker_matches, picker_first
+        needle = picker_filter_var.get().strip().lower()
+        if needle:
+            picker_matches = [entry for entry in picker_stages
+                              if needle in str(entry[0]) or needle in entry[1].lower()]
+        else:
+            picker_matches = picker_stages
+        picker_first = 0
+        render_picker()
+
+    def pick_stage(_event=None):
+        selection = picker_list.curselection()
+        if not selection:
+            return
+        stage_id = picker_matches[picker_first + selection[0]][0]
+        stage_id_var.set(str(stage_id))
+        world_stage_id_var.set(str(stage_id))
+
+    def list_rom_stages_clicked():
+        rom_path = Path(rom_var.get().strip())
+        if not rom_path.exists():
+            messagebox.showerror('Invalid ROM', 'ROM folder does not exist.')
+            return
+
+        def list_stages(_progress: BuildProgress) -> List[Tuple[int, str]]:
+            session = get_rom_session(rom_path)
+            names = session.stage_names
+            return [(stage_id, names.get(stage_id, '')) for stage_id in session.stage_ids]
+
+        def apply(stages) -> None:
+            nonlocal picker_stages
+            picker_stages = stages
+            filter_picker()
+
+        run_in_background('List stages', list_stages, apply)
+
+    picker_scroll.configure(command=on_picker_scroll)
+    for sequence in ('<MouseWheel>', '<Button-4>', '<Button-5>'):
+        picker_list.bind(sequence, on_picker_wheel)
+    picker_list.bind('<<ListboxSelect>>', pick_stage)
+    picker_filter_var.trace_add('write', filter_picker)
+    ttk.Button(picker_frame, text='List ROM stages', command=list_rom_stages_clicked).pack(fill=tk.X, pady=(6, 0))
+
     def build_courses_data() -> Dict[str, object]:
-        order = {}
-        bonus = {}
-        for name, entries in challenge_courses.items():
-            order[name] = [stage_id for stage_id, _ in entries]
-            bonus[name] = [flag for _, flag in entries]
-        courses: Dict[str, object] = {
-            'challenge': {
-                'order': order,
-                'bonus': bonus,
-            },
-        }
-        if story_worlds:
-            courses['story'] = story_worlds
-        return courses
+        return make_courses_data(courses.challenge_courses, courses.story_worlds)
 
     def load_from_rom_clicked():
         rom_path = Path(rom_var.get().strip())
         if not rom_path.exists():
             messagebox.showerror('Invalid ROM', 'ROM folder does not exist.')
             return
-        if challenge_courses or story_worlds:
+        if courses:
             if not messagebox.askyesno(
                 'Replace courses',
                 'Replace current course data with values from the ROM?',
             ):
                 return
-        try:
-            loaded_courses, loaded_worlds, loaded_overrides, load_warnings = (
-                load_vanilla_courses_from_rom(rom_path)
-            )
-        except Exception as exc:
-            messagebox.showerror('Load failed', str(exc))
-            return
-        challenge_courses.clear()
-        challenge_courses.update(loaded_courses)
-        story_worlds.clear()
-        story_worlds.extend(loaded_worlds)
-        stage_time_overrides.clear()
-        stage_time_overrides.update(loaded_overrides)
-        selected_course_name.set('')
-        refresh_course_list()
-        refresh_stage_list()
-        refresh_world_list()
-        refresh_world_stage_list()
-        if load_warnings:
-            messagebox.showwarning('Loaded with warnings', '\n'.join(load_warnings))
+
+        def load(progress: BuildProgress):
+            progress.phase('load_courses')
+            loaded = load_vanilla_courses_from_rom(rom_path, get_rom_session(rom_path))
+            progress.check()
+            return loaded
+
+        def apply(loaded) -> None:
+            loaded_courses, loaded_worlds, loaded_overrides, load_warnings = loaded
+            courses.replace(loaded_courses, loaded_worlds, loaded_overrides)
+            selected_course_name.set('')
+            refresh_course_list()
+            refresh_stage_list()
+            refresh_world_list()
+            refresh_world_stage_list()
+            if load_warnings:
+                messagebox.showwarning('Loaded with warnings', '\n'.join(load_warnings))
+
+        run_in_background('Load', load, apply)
 
     def load_from_cmmod_clicked():
         config_path_str = filedialog.askopenfilename(
@@ -1257,7 +2480,7 @@ def run_gui() -> None:
         if not config_path_str:
             return
         config_path = Path(config_path_str)
-        if challenge_courses or story_worlds:
+        if courses:
             if not messagebox.askyesno(
                 'Replace courses',
                 'Replace current challenge courses with values from the cmmod config?',
@@ -1268,14 +2491,11 @@ def run_gui() -> None:
         except Exception as exc:
             messagebox.showerror('Load failed', str(exc))
             return
-        challenge_courses.clear()
-        challenge_courses.update(loaded_courses)
-        stage_time_overrides.clear()
-        stage_time_overrides.update(loaded_overrides)
+        courses.replace(loaded_courses, stage_time_overrides=loaded_overrides)
         selected_course_name.set('')
         refresh_course_list()
         refresh_stage_list()
-        if story_worlds:
+        if courses.story_worlds:
             load_warnings.append('Story worlds were left unchanged.')
         if load_warnings:
             messagebox.showwarning('Loaded with warnings', '\n'.join(load_warnings))
@@ -1297,29 +2517,42 @@ def run_gui() -> None:
         if not pack_name:
             messagebox.showerror('Missing name', 'Pack name is required.')
             return
-        courses_data = build_courses_data()
-        try:
+        # Snapshot everything the worker reads; the course editors stay usable meanwhile.
+        courses_data = make_courses_data(courses.challenge_courses, [list(world) for world in courses.story_worlds])
+        overrides = dict(courses.stage_time_overrides)
+        zip_output = bool(zip_var.get())
+        lst_path = Path(lst_var.get().strip()) if lst_var.get().strip() else None
+
+        def build(progress: BuildProgress) -> None:
             build_pack(
                 rom_path,
                 out_path,
                 pack_id,
                 pack_name,
                 None,
-                bool(zip_var.get()),
+                zip_output,
                 courses_data=courses_data,
-                lst_path=Path(lst_var.get().strip()) if lst_var.get().strip() else None,
-                stage_time_overrides=stage_time_overrides,
+                lst_path=lst_path,
+                stage_time_overrides=overrides,
+                session=get_rom_session(rom_path),
+                progress=progress,
             )
-        except Exception as exc:
-            messagebox.showerror('Build failed', str(exc))
-            return
-        messagebox.showinfo('Done', 'Pack build completed.')
+
+        run_in_background('Build', build, lambda _result: messagebox.showinfo('Done', 'Pack build completed.'))
 
     action_frame = ttk.Frame(frame)
     action_frame.pack(fill=tk.X, pady=(10, 0))
+    status_var = tk.StringVar()
+    progress_bar = ttk.Progressbar(action_frame, length=240)
+    progress_bar.pack(side=tk.LEFT)
+    ttk.Label(action_frame, textvariable=status_var).pack(side=tk.LEFT, padx=(8, 0))
     ttk.Button(action_frame, text='Build Pack', command=build_pack_clicked).pack(side=tk.RIGHT)
+    cancel_button = ttk.Button(action_frame, text='Cancel', command=cancel_clicked)
+    cancel_button.pack(side=tk.RIGHT, padx=(0, 6))
+    cancel_button.state(['disabled'])
     ttk.Button(load_controls, text='Load courses from cmmod config', command=load_from_cmmod_clicked).pack(side=tk.LEFT)
 
+    root.after(50, poll_ui_events)
     root.mainloop()
 
 
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""Write a structurally valid fake extracted SMB2 ROM for benchmarks.
+
+The output has the layout `smb2_pack_builder` and `dump_vanilla_conf` expect,
+with none of the game's content:
+
+- `mkb2.main_loop.rel`: a REL with a section table, an import table and
+  relocations against itself and main.dol. The data section holds the
+  WorldTheme, theme light, bg filename (pointers plus strings), challenge
+  course, story, bonus stage and theme music tables at their NTSC offsets.
+  A `.text` section of tunable size carries the bulk of the relocations.
+- `stage/STAGE###.lz`: LZSS-compressed stage-like payloads with fog and fog
+  animation structs at the header pointers, plus `st###.gma`/`st###.tpl`.
+- `stgname/usa.str`, placeholder `bg/` and `init/` files and a
+  `src-smb2/mkb2.us.lst` with the default symbol addresses.
+
+The same arguments and seed always produce the same files.
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import struct
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from bench_lzss import lzss_compress, synthetic_stage_payload
+from rom_schema import COURSE_COMMAND, FOG, FOG_ANIM, KEYFRAME, STORY_ENTRY, THEME_LIGHT
+from smb2_pack_builder import (
+    BG_NAME_TABLE,
+    BONUS_STAGE_COUNT,
+    DEFAULT_BONUS_STAGES_FILE_OFF,
+    DEFAULT_STAGE_WORLD_FILE_OFF,
+    DEFAULT_SYMBOLS,
+    DEFAULT_THEME_MUSIC_FILE_OFF,
+    DOL_MODULE_ID,
+    R_DOLPHIN_END,
+    R_DOLPHIN_NOP,
+    R_PPC_ADDR16_HA,
+    R_PPC_ADDR16_LO,
+    R_PPC_ADDR32,
+    R_PPC_REL24,
+    R_PPC_SECTION,
+    STAGE_WORLD_THEME_MAX,
+    STAGE_WORLD_THEMES_LEN,
+    THEME_LIGHT_COUNT,
+    THEME_MUSIC_COUNT,
+)
+
+MODULE_ID = 1
+SECTION_COUNT = 18
+TEXT_SECTION = 1
+DATA_SECTION = 5
+BSS_SECTION = 6
+BSS_SIZE = 0x20000
+
+HEADER_SIZE = 0x40
+IMPORT_TABLE_OFF = HEADER_SIZE + SECTION_COUNT * 8
+DATA_SECTION_OFF = 0x1000
+# Past the last vanilla table (the story block ends at 0x20B5D8).
+DATA_SECTION_END = 0x20C000
+
+STAGE_NAME_LINES = 421
+THEME_LIGHTS_FILE_OFF = DEFAULT_STAGE_WORLD_FILE_OFF - (
+    DEFAULT_SYMBOLS['STAGE_WORLD_THEMES'] - DEFAULT_SYMBOLS['theme_lights'])
+BG_LIST_FILE_OFF = DEFAULT_STAGE_WORLD_FILE_OFF - (
+    DEFAULT_SYMBOLS['STAGE_WORLD_THEMES'] - DEFAULT_SYMBOLS['g_bg_filename_list'])
+COURSE_FILE_OFFS = (0x2075B0, 0x207914, 0x208634, 0x209CF4, 0x20A0C8, 0x20A448, 0x20A8E0, 0x20ACB4)
+# Floors per course; with three commands per floor each fills its vanilla slot.
+COURSE_FLOORS = (10, 30, 50, 10, 10, 10, 10, 10)
+STORY_FILE_OFF = 0x20B448
+STORY_WORLDS = 10
+STORY_WORLD_STAGES = 10
+
+# Stagedef header pointers read by parse_stage_env, and where the structs go.
+STAGE_FOG_ANIM_PTR_OFF = 0xB0
+STAGE_FOG_PTR_OFF = 0xBC
+STAGE_FOG_OFF = 0x200
+STAGE_FOG_ANIM_OFF = 0x300
+STAGE_KEYFRAMES_OFF = 0x400
+STAGE_KEYFRAMES_STRIDE = 0x100
+MIN_STAGE_SIZE = STAGE_KEYFRAMES_OFF + len(FOG_ANIM.fields) // 2 * STAGE_KEYFRAMES_STRIDE
+
+_RELOC = struct.Struct('>HBBI')
+# Placeholder instructions the relocations patch: `bl 0`, `lis r3, 0`, `addi r3, r3, 0`.
+_INSN_BL = 0x48000001
+_INSN_LIS = 0x3C600000
+_INSN_ADDI = 0x38630000
+
+# A section-relative relocation before encoding: (offset, type, target section, addend).
+Reloc = Tuple[int, int, int, int]
+
+
+def encode_relocations(by_section: Dict[int, List[Reloc]]) -> bytes:
+    """One module's relocation stream: delta-coded per section, END-terminated."""
+    out = bytearray()
+    for section, relocs in sorted(by_section.items()):
+        out += _RELOC.pack(0, R_PPC_SECTION, section, 0)
+        prev = 0
+        for offset, rel_type, target, addend in sorted(relocs):
+            delta = offset - prev
+            while delta > 0xFFFF:
+                out += _RELOC.pack(0xFFFF, R_DOLPHIN_NOP, 0, 0)
+                delta -= 0xFFFF
+            out += _RELOC.pack(delta, rel_type, target, addend)
+            prev = offset
+    out += _RELOC.pack(0, R_DOLPHIN_END, 0, 0)
+    return bytes(out)
+
+
+def _fill_data(rel: bytearray, rng: random.Random, start: int, end: int) -> None:
+    """Float tables, zero runs and word soup, with no "bg/" strings in it."""
+    pos = start
+    while pos < end:
+        length = min(rng.randrange(64, 4096) & ~3, end - pos)
+        kind = rng.randrange(3)
+        if kind == 0:
+            count = length // 4
+            struct.pack_into(f'>{count}f', rel, pos, *(rng.uniform(-512, 512) for _ in range(count)))
+        elif kind == 1:
+            rel[pos:pos + length] = rng.randbytes(length).replace(b'bg/', b'BG/')
+        pos += length
+
+
+def _course_commands(rng: random.Random, stage_ids: List[int], floors: int) -> List[Tuple[int, int, int]]:
+    cmds = []
+    for _ in range(floors):
+        cmds.append((2, 0, rng.choice(stage_ids)))
+        if rng.random() < 0.3:
+            cmds.append((2, 1, rng.choice((1800, 3600, 5400))))
+        else:
+            cmds.append((0, 0, 0))
+        cmds.append((1, 0, rng.randrange(1, 4)))
+    cmds.append((3, 0, 0))
+    return cmds
+
+
+def build_main_loop_rel(rng: random.Random, stage_ids: List[int], named_ids: List[int], text_size: int) -> bytes:
+    text_size &= ~0xF
+    text_off = DATA_SECTION_END
+    self_relocs_off = text_off + text_size
+    size = self_relocs_off
+    rel = bytearray(size)
+    _fill_data(rel, rng, DATA_SECTION_OFF, DATA_SECTION_END)
+
+    self_relocs: Dict[int, List[Reloc]] = {DATA_SECTION: [], TEXT_SECTION: []}
+    dol_relocs: Dict[int, List[Reloc]] = {TEXT_SECTION: []}
+
+    # Theme music ids and bonus stages (read at fixed offsets).
+    struct.pack_into(f'>{THEME_MUSIC_COUNT}h', rel, DEFAULT_THEME_MUSIC_FILE_OFF,
+                     *(rng.randrange(0, 60) for _ in range(THEME_MUSIC_COUNT)))
+    struct.pack_into(f'>{BONUS_STAGE_COUNT}i', rel, DEFAULT_BONUS_STAGES_FILE_OFF,
+                     *(rng.choice(stage_ids) for _ in range(BONUS_STAGE_COUNT)))
+
+    # Theme lights: ambient and infinite light colours plus rotation.
+    for idx in range(THEME_LIGHT_COUNT):
+        values = [rng.random() for _ in range(6)] + [rng.randrange(-0x8000, 0x8000) for _ in range(2)]
+        THEME_LIGHT.struct.pack_into(rel, THEME_LIGHTS_FILE_OFF + idx * THEME_LIGHT.size, *values)
+
+    # STAGE_WORLD_THEMES, immediately followed by the bg path strings, as in the game.
+    themed = [idx for idx, name in enumerate(BG_NAME_TABLE) if name and idx <= STAGE_WORLD_THEME_MAX]
+    rel[DEFAULT_STAGE_WORLD_FILE_OFF:DEFAULT_STAGE_WORLD_FILE_OFF + STAGE_WORLD_THEMES_LEN] = bytes(
+        rng.choice(themed) for _ in range(STAGE_WORLD_THEMES_LEN))
+    string_off = DEFAULT_STAGE_WORLD_FILE_OFF + STAGE_WORLD_THEMES_LEN
+    strings: Dict[str, int] = {}
+    for idx, name in enumerate(BG_NAME_TABLE):
+        # The list holds null pointers on disk; the linker fills them in.
+        slot = BG_LIST_FILE_OFF + idx * 4
+        rel[slot:slot + 4] = bytes(4)
+        if not name:
+            continue
+        if name not in strings:
+            encoded = f'bg/{name}.gma'.encode('ascii')
+            encoded += bytes(4 - len(encoded) % 4)
+            strings[name] = string_off
+            rel[string_off:string_off + len(encoded)] = encoded
+            string_off += len(encoded)
+        self_relocs[DATA_SECTION].append(
+            (slot - DATA_SECTION_OFF, R_PPC_ADDR32, DATA_SECTION, strings[name] - DATA_SECTION_OFF))
+    if string_off > COURSE_FILE_OFFS[0]:
+        raise SystemExit('bg strings overlap the course tables')
+
+    # Challenge courses and story worlds.
+    for course_off, floors in zip(COURSE_FILE_OFFS, COURSE_FLOORS):
+        for idx, cmd in enumerate(_course_commands(rng, stage_ids, floors)):
+            COURSE_COMMAND.struct.pack_into(rel, course_off + idx * COURSE_COMMAND.size, *cmd)
+    for idx in range(STORY_WORLDS * STORY_WORLD_STAGES):
+        STORY_ENTRY.struct.pack_into(rel, STORY_FILE_OFF + idx * STORY_ENTRY.size,
+                                     rng.choice(named_ids), rng.randrange(0, 6))
+
+    # .text: calls into main.dol and lis/addi pairs addressing the data section.
+    for off in range(0, text_size, 16):
+        kind = rng.randrange(4)
+        if kind == 0:
+            struct.pack_into('>I', rel, text_off + off, _INSN_BL)
+            dol_relocs[TEXT_SECTION].append((off, R_PPC_REL24, 0, 0x80003000 + rng.randrange(0x200000) * 4))
+        elif kind == 1:
+            target = rng.randrange(DATA_SECTION_END - DATA_SECTION_OFF) & ~3
+            struct.pack_into('>II', rel, text_off + off, _INSN_LIS, _INSN_ADDI)
+            self_relocs[TEXT_SECTION].append((off + 2, R_PPC_ADDR16_HA, DATA_SECTION, target))
+            self_relocs[TEXT_SECTION].append((off + 6, R_PPC_ADDR16_LO, DATA_SECTION, target))
+        else:
+            struct.pack_into('>4I', rel, text_off + off, *(rng.getrandbits(32) for _ in range(4)))
+
+    self_stream = encode_relocations(self_relocs)
+    dol_stream = encode_relocations(dol_relocs)
+    rel += self_stream + dol_stream
+    dol_relocs_off = self_relocs_off + len(self_stream)
+
+    sections = [(0, 0)] * SECTION_COUNT
+    sections[TEXT_SECTION] = (text_off | 1, text_size)
+    sections[DATA_SECTION] = (DATA_SECTION_OFF, DATA_SECTION_END - DATA_SECTION_OFF)
+    sections[BSS_SECTION] = (0, BSS_SIZE)
+    for idx, (off_flags, sec_size) in enumerate(sections):
+        struct.pack_into('>II', rel, HEADER_SIZE + idx * 8, off_flags, sec_size)
+    imports = [(MODULE_ID, self_relocs_off), (DOL_MODULE_ID, dol_relocs_off)]
+    for idx, (module_id, relocs_off) in enumerate(imports):
+        struct.pack_into('>II', rel, IMPORT_TABLE_OFF + idx * 8, module_id, relocs_off)
+    struct.pack_into('>16I', rel, 0,
+                     MODULE_ID, 0, 0, SECTION_COUNT, HEADER_SIZE, 0, 0, 1,
+                     BSS_SIZE, self_relocs_off, IMPORT_TABLE_OFF, len(imports) * 8,
+                     0, 0, 0, 0)
+    return bytes(rel)
+
+
+def build_stage(rng: random.Random, size: int) -> bytes:
+    """A stagedef-like payload with fog and (usually) fog animation structs."""
+    stage = bytearray(synthetic_stage_payload(rng, max(size, MIN_STAGE_SIZE)))
+    stage[:STAGE_FOG_OFF] = bytes(STAGE_FOG_OFF)
+    if rng.random() < 0.2:
+        return bytes(stage)
+    struct.pack_into('>I', stage, STAGE_FOG_PTR_OFF, STAGE_FOG_OFF)
+    FOG.struct.pack_into(stage, STAGE_FOG_OFF, rng.randrange(0, 6), rng.uniform(0, 100), rng.uniform(100, 1000),
+                         rng.random(), rng.random(), rng.random())
+    if rng.random() < 0.5:
+        struct.pack_into('>I', stage, STAGE_FOG_ANIM_PTR_OFF, STAGE_FOG_ANIM_OFF)
+        header = []
+        for channel in range(len(FOG_ANIM.fields) // 2):
+            count = rng.randrange(0, 8)
+            frames_off = STAGE_KEYFRAMES_OFF + channel * STAGE_KEYFRAMES_STRIDE
+            for idx in range(count):
+                KEYFRAME.struct.pack_into(stage, frames_off + idx * KEYFRAME.size, rng.randrange(0, 3),
+                                          idx * 60.0, rng.random(), rng.uniform(-1, 1), rng.uniform(-1, 1))
+            header += [count, frames_off if count else 0]
+        FOG_ANIM.struct.pack_into(stage, STAGE_FOG_ANIM_OFF, *header)
+    return bytes(stage)
+
+
+def write_synthetic_rom(
+    root: Path,
+    *,
+    stages: int = 60,
+    stage_size: int = 128 * 1024,
+    asset_size: int = 128 * 1024,
+    text_size: int = 1024 * 1024,
+    seed: int = 1,
+) -> Path:
+    if not 20 <= stages < STAGE_NAME_LINES:
+        raise SystemExit(f'stage count must be between 20 and {STAGE_NAME_LINES - 1}')
+    rng = random.Random(seed)
+    stage_ids = sorted(rng.sample(range(1, STAGE_NAME_LINES), stages))
+    named_ids = [sid for sid in stage_ids if sid % 5]
+
+    root.mkdir(parents=True, exist_ok=True)
+    (root / 'mkb2.main_loop.rel').write_bytes(build_main_loop_rel(rng, stage_ids, named_ids, text_size))
+
+    lst_dir = root / 'src-smb2'
+    lst_dir.mkdir(exist_ok=True)
+    (lst_dir / 'mkb2.us.lst').write_text(
+        ''.join(f'{addr:08X}:{name}\n' for name, addr in DEFAULT_SYMBOLS.items()), encoding='ascii')
+
+    stgname_dir = root / 'stgname'
+    stgname_dir.mkdir(exist_ok=True)
+    (stgname_dir / 'usa.str').write_text(
+        '\n'.join(f'Stage {idx}' if idx % 5 else '-' for idx in range(STAGE_NAME_LINES)) + '\n',
+        encoding='ascii')
+
+    stage_dir = root / 'stage'
+    stage_dir.mkdir(exist_ok=True)
+    for stage_id in stage_ids:
+        (stage_dir / f'STAGE{stage_id:03d}.lz').write_bytes(lzss_compress(build_stage(rng, stage_size)))
+        (stage_dir / f'st{stage_id:03d}.gma').write_bytes(synthetic_stage_payload(rng, asset_size))
+        (stage_dir / f'st{stage_id:03d}.tpl').write_bytes(rng.randbytes(asset_size // 4) * 4)
+
+    bg_dir = root / 'bg'
+    bg_dir.mkdir(exist_ok=True)
+    for name in sorted({name for name in BG_NAME_TABLE if name}):
+        (bg_dir / f'{name}.gma').write_bytes(synthetic_stage_payload(rng, asset_size))
+        (bg_dir / f'{name}.tpl').write_bytes(rng.randbytes(asset_size // 4) * 4)
+
+    init_dir = root / 'init'
+    init_dir.mkdir(exist_ok=True)
+    for name in ('common.lz', 'common_p.lz'):
+        (init_dir / name).write_bytes(lzss_compress(synthetic_stage_payload(rng, asset_size)))
+    (init_dir / 'common.gma').write_bytes(synthetic_stage_payload(rng, asset_size))
+    (init_dir / 'common.tpl').write_bytes(rng.randbytes(asset_size // 4) * 4)
+    return root
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Write a synthetic extracted SMB2 ROM for benchmarks.')
+    parser.add_argument('out', type=Path, help='Output ROM folder')
+    parser.add_argument('--stages', type=int, default=60, help='Number of STAGE###.lz files (20-420)')
+    parser.add_argument('--stage-kb', type=int, default=128, help='Decompressed size of each stagedef in KB')
+    parser.add_argument('--asset-kb', type=int, default=128, help='Size of each .gma/.tpl file in KB')
+    parser.add_argument('--text-kb', type=int, default=1024,
+                        help='Size of the REL .text section in KB (sets the relocation count)')
+    parser.add_argument('--seed', type=int, default=1, help='Generator seed')
+    args = parser.parse_args()
+    write_synthetic_rom(args.out, stages=args.stages, stage_size=args.stage_kb * 1024,
+                        asset_size=args.asset_kb * 1024, text_size=args.text_kb * 1024, seed=args.seed)
+    print(args.out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""Lower-resolution TPL tiers for packs (`--texture-tiers`).
+
+Every client downloads and uploads each texture's full mip chain. A tier is
+a second copy of a pack TPL without its top one or two mip levels: each
+texture's header is halved and points at the first level kept, and the
+smaller levels are copied over byte for byte. A texture keeps at least its
+smallest level, and one whose chain the client would not halve evenly is
+copied whole, so every tier TPL parses and renders like the original.
+
+For `foo.tpl` the tiers are `foo.mid.tpl` (top level dropped) and
+`foo.low.tpl` (top two dropped). The manifest lists them under
+`content.textureTiers`, with each file's size, so a client asked for
+`tier=low` fetches those instead of the full TPLs. A TPL that no tier
+makes smaller gets no file, and the client keeps using the original.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from gpu_textures import TplTexture, mip_chain, parse_tpl
+from rom_reader import ByteView, RomFile
+from rom_schema import TPL_TEXTURE
+
+# Tier name -> top mip levels dropped.
+TEXTURE_TIERS = {'mid': 1, 'low': 2}
+
+TPL_ALIGN = 32
+# Bump when the tier made from the same TPL changes, so build caches rewrite it.
+TIER_ENCODER_VERSION = 1
+
+
+@dataclass
+class TierEntry:
+    """Where one TPL entry's data comes from in the source and its header in the tier."""
+    header: bytes
+    start: int
+    end: int
+    texture: Optional[TplTexture] = None
+
+
+def tier_arcname(tpl_arcname: str, tier: str) -> str:
+    return f'{tpl_arcname[:-len(".tpl")]}.{tier}.tpl'
+
+
+def _align(value: int) -> int:
+    return (value + TPL_ALIGN - 1) & ~(TPL_ALIGN - 1)
+
+
+def _plan_tier(data: ByteView, drop: int) -> Optional[List[TierEntry]]:
+    """The tier's entries, or None if `data` is not a TPL or no texture loses a level."""
+    textures = parse_tpl(data)
+    if not textures:
+        return None
+    # A texture's data runs up to the next texture's (or the end of the file).
+    starts = sorted({tex.offset for tex in textures if tex} | {len(data)})
+    ends = {start: end for start, end in zip(starts, starts[1:])}
+    entries: List[TierEntry] = []
+    trimmed = False
+    for idx, tex in enumerate(textures):
+        header = bytes(data[4 + idx * TPL_TEXTURE.size:4 + (idx + 1) * TPL_TEXTURE.size])
+        if tex is None or tex.offset >= len(data):
+            entries.append(TierEntry(header, 0, 0))
+            continue
+        chain = mip_chain(tex, len(data))
+        levels = min(drop, len(chain) - 1)
+        if levels <= 0:
+            entries.append(TierEntry(header, tex.offset, ends[tex.offset], tex))
+            continue
+        offset, width, height = chain[levels]
+        kept = TplTexture(tex.format, offset, width, height, len(chain) - levels)
+        entries.append(TierEntry(header, offset, ends[tex.offset], kept))
+        trimmed = True
+    return entries if trimmed else None
+
+
+def _layout(entries: List[TierEntry]) -> Tuple[Dict[Tuple[int, int], int], int]:
+    """(source span -> tier offset, tier size); entries sharing data share it in the tier too."""
+    offsets: Dict[Tuple[int, int], int] = {}
+    size = _align(4 + len(entries) * TPL_TEXTURE.size)
+    for entry in sorted(entries, key=lambda entry: entry.start):
+        span = (entry.start, entry.end)
+        if entry.texture is None or span in offsets:
+            continue
+        offsets[span] = size
+        size = _align(size + entry.end - entry.start)
+    return offsets, size
+
+
+def tier_size(path: Path, drop: int) -> Optional[int]:
+    """Size of the tier TPL for `path`, from its header table alone; None if the tier would not be smaller."""
+    with RomFile(path) as rom:
+        entries = _plan_tier(rom.view, drop)
+    return _layout(entries)[1] if entries else None
+
+
+def trim_tpl(data: ByteView, drop: int) -> bytes:
+    """The tier TPL for `data` with the top `drop` mip levels of every texture removed."""
+    entries = _plan_tier(data, drop)
+    if entries is None:
+        return bytes(data)
+    offsets, size = _layout(entries)
+    out = bytearray(size)
+    out[0:4] = len(entries).to_bytes(4, 'big')
+    for idx, entry in enumerate(entries):
+        pos = 4 + idx * TPL_TEXTURE.size
+        tex = entry.texture
+        if tex is None:
+            out[pos:pos + TPL_TEXTURE.size] = entry.header
+            continue
+        offset = offsets[(entry.start, entry.end)]
+        TPL_TEXTURE.struct.pack_into(out, pos, tex.format, offset, tex.width, tex.height, tex.mip_count,
+                                     TPL_TEXTURE.unpack(entry.header).magic)
+        out[offset:offset + entry.end - entry.start] = data[entry.start:entry.end]
+    return bytes(out)
+
+
+def trim_tpl_file(src: Path, drop: int) -> bytes:
+    with RomFile(src) as rom:
+        return trim_tpl(rom.view, drop)